@@ -34,8 +34,12 @@ from numpy import linspace,floor
 from numpy import any,minimum,maximum
 from numpy import sort as npsort
 from bisect import bisect
+from collections import OrderedDict
+from itertools import islice
+from time import time as clock
 from warnings import warn,simplefilter
 import pydoc
+import csv
 
 # Enable warning repetitions
 simplefilter('always', UserWarning)
@@ -45,11 +49,24 @@ try:
     import urllib.request as urllib2
 except ImportError:
     import urllib2
+# Openers of the compressed data files, by extension
+import gzip
+COMPRESSED_OPENERS = {'gz':gzip.open}
+try:
+    import lzma
+    COMPRESSED_OPENERS['xz'] = lzma.open
+except ImportError:
+    pass
 if 'io' in sys.modules: # define open using Linux-style line endings
     import io
-    def open_(*args,**argv):
+    def open_(file,mode='r',**argv):
         argv.update(dict(newline='\n'))
-        return io.open(*args,**argv)
+        ext = os.path.splitext(file)[1][1:]
+        if ext in COMPRESSED_OPENERS:
+            # compressed files are streamed as text too
+            if 'b' not in mode and 't' not in mode: mode += 't'
+            return COMPRESSED_OPENERS[ext](file,mode,**argv)
+        return io.open(file,mode,**argv)
 else:
     open_ = open
 
@@ -152,7 +169,7 @@ VARIABLES['DISPLAY_FETCH_URL'] = False
 # from the shift of the nodes due to error accumulation.
 # This effect is pronounced only if the step is sufficiently small.
 def arange_(lower,upper,step):
-    npnt = floor((upper-lower)/step)+1
+    npnt = int(floor((upper-lower)/step))+1
     upper_new = lower + step*(npnt-1)
     if abs((upper-upper_new)-step) < 1e-10:
         upper_new += step
@@ -174,6 +191,59 @@ BACKEND_DATABASE_NAME_DEFAULT = '.'
 
 VARIABLES['BACKEND_DATABASE_NAME'] = BACKEND_DATABASE_NAME_DEFAULT
 
+# Keep a binary columnar copy of each parsed table next to its data file
+#  (see saveSidecar/loadSidecar) to skip text parsing on the next start.
+VARIABLES['SIDECAR_CACHE'] = True
+
+# Register tables with their headers only and load the data
+#  on the first access (see registerTable/loadTableOnDemand).
+VARIABLES['LAZY_LOADING'] = False
+
+# Keep the columns of the loaded tables as read-only numpy.memmap arrays
+#  backed by the sidecar files instead of reading them to RAM.
+#  Edits go through getWritableColumn, which copies the column to RAM.
+VARIABLES['MEMMAP_COLUMNS'] = False
+
+# Number of processes used by loadCache to parse the tables.
+#  With more than one process the tables with missing or outdated
+#  sidecars are parsed in parallel and handed over through the sidecar files.
+VARIABLES['LOADING_PROCESSES'] = 1
+
+# Keep the integer columns of the loaded tables in the narrowest
+#  integer types (e.g. int8 for molec_id and local_iso_id).
+#  Edited columns are widened back to the default types, and so are
+#  the values read by the queries, so their arithmetic does not overflow.
+VARIABLES['COMPACT_COLUMNS'] = False
+
+# With COMPACT_COLUMNS, also keep the fixed-point float columns in
+#  single precision when it holds all digits of their format
+#  (e.g. gamma_air, n_air). Values then differ from the parsed ones
+#  beyond the precision of the format.
+VARIABLES['FLOAT32_COLUMNS'] = False
+
+# Compression of the data files written by cache2storage and queryHITRAN:
+#  None for plain text files, 'gz' or 'xz' for *.data.gz or *.data.xz.
+#  Compressed files are read transparently whatever this setting is.
+VARIABLES['DATA_COMPRESSION'] = None
+
+# Make the results of selects of plain parameters views
+#  of the source table instead of copies (see createView).
+#  Views share memory with the source table: edits through the hapi
+#  functions copy the views first, but in-place writes to the source
+#  columns (e.g. data['nu'][:] = ...) change the views too.
+VARIABLES['SELECT_VIEWS'] = False
+
+# Create indexes (see createIndex) automatically for the columns
+#  compared with constants in the conditions of selects.
+VARIABLES['AUTO_INDEXES'] = False
+
+# Memory budget in bytes of the cache of select results (see QUERY_CACHE).
+#  Repeated selects with the same parameters and conditions from an unchanged
+#  table reuse the cached result. The cache is disabled by default (0):
+#  in-place writes to the columns (e.g. data['nu'][:] = ...) are not seen by it,
+#  so enable it only if the tables are edited through the hapi functions.
+VARIABLES['QUERY_CACHE_SIZE'] = 0
+
 # For this node local DB is schema-dependent!
 LOCAL_TABLE_CACHE = {
    'sampletab' : { # table
@@ -1155,6 +1225,30 @@ PARAMETER_META = {}
 for param in PARAMETER_META_:
     PARAMETER_META[param.lower()] = PARAMETER_META_[param]
 
+def getStoredFileName(path):
+    # the file itself if it exists, otherwise its existing compressed version
+    if os.path.isfile(path): return path
+    for ext in COMPRESSED_OPENERS:
+        if os.path.isfile(path+'.'+ext): return path+'.'+ext
+    return path
+
+def getDataFileName(TableName):
+    # name of the data file to write the table to
+    fullpath_data = VARIABLES['BACKEND_DATABASE_NAME'] + '/' + TableName + '.data'
+    if VARIABLES['DATA_COMPRESSION']:
+        if VARIABLES['DATA_COMPRESSION'] not in COMPRESSED_OPENERS:
+            raise Exception('Unknown compression \"%s\"' % VARIABLES['DATA_COMPRESSION'])
+        fullpath_data += '.' + VARIABLES['DATA_COMPRESSION']
+    return fullpath_data
+
+def removeOtherDataFiles(fullpath_data):
+    # remove the other (plain or compressed) versions of the data file,
+    #  they would be outdated by the one being written
+    plain = re.sub(r'\.(%s)$' % '|'.join(COMPRESSED_OPENERS),'',fullpath_data)
+    for path in [plain]+[plain+'.'+ext for ext in COMPRESSED_OPENERS]:
+        if path!=fullpath_data and os.path.isfile(path):
+            os.remove(path)
+
 def getFullTableAndHeaderName(TableName,ext=None):
     #print('TableName=',TableName)
     if ext is None: ext = 'data'
@@ -1162,13 +1256,18 @@ def getFullTableAndHeaderName(TableName,ext=None):
     if os.path.isabs(TableName): flag_abspath = True        
     fullpath_data = TableName + '.' + ext
     if not flag_abspath: fullpath_data = os.path.join(VARIABLES['BACKEND_DATABASE_NAME'],fullpath_data)
+    fullpath_data = getStoredFileName(fullpath_data)
     if not os.path.isfile(fullpath_data):
         fullpath_data = VARIABLES['BACKEND_DATABASE_NAME'] + '/' + TableName + '.par'
+        fullpath_data = getStoredFileName(fullpath_data)
         if not os.path.isfile(fullpath_data) and TableName!='sampletab':
             raise Exception('Lonely header \"%s\"' % fullpath_data)
+    return fullpath_data,getFullHeaderName(TableName)
+
+def getFullHeaderName(TableName):
     fullpath_header = TableName + '.header'
-    if not flag_abspath: fullpath_header = os.path.join(VARIABLES['BACKEND_DATABASE_NAME'],fullpath_header)
-    return fullpath_data,fullpath_header
+    if not os.path.isabs(TableName): fullpath_header = os.path.join(VARIABLES['BACKEND_DATABASE_NAME'],fullpath_header)
+    return fullpath_header
 
 def getParameterFormat(ParameterName,TableName):
     return LOCAL_TABLE_CACHE[TableName]['header']['format']
@@ -1180,7 +1279,7 @@ def getRowObject(RowID,TableName):
     # return RowObject from TableObject in CACHE
     RowObject = []
     for par_name in LOCAL_TABLE_CACHE[TableName]['header']['order']:
-        par_value = LOCAL_TABLE_CACHE[TableName]['data'][par_name][RowID]
+        par_value = widenValue(LOCAL_TABLE_CACHE[TableName]['data'][par_name][RowID])
         par_format = LOCAL_TABLE_CACHE[TableName]['header']['format'][par_name]
         RowObject.append((par_name,par_value,par_format))
     return RowObject
@@ -1190,6 +1289,7 @@ def addRowObject(RowObject,TableName):
     #print 'addRowObject: '
     #print 'RowObject: '+str(RowObject)
     #print 'TableName:'+TableName
+    # the caller calls touchTable once for all the added rows
     for par_name,par_value,par_format in RowObject:
         #print 'par_name,par_value,par_format: '+str((par_name,par_value,par_format))
         #print '>>> '+ str(LOCAL_TABLE_CACHE[TableName]['data'][par_name])
@@ -1198,9 +1298,10 @@ def addRowObject(RowObject,TableName):
 
 def setRowObject(RowID,RowObject,TableName):
     number_of_rows = LOCAL_TABLE_CACHE[TableName]['header']['number_of_rows']
+    touchTable(TableName)
     if RowID >= 0 and RowID < number_of_rows:
        for par_name,par_value,par_format in RowObject:
-           LOCAL_TABLE_CACHE[TableName]['data'][par_name][RowID] = par_value
+           getWritableColumn(TableName,par_name)[RowID] = par_value
     else:
        # !!! XXX ATTENTION: THIS IS A TEMPORARY INSERTION XXX !!!
        LOCAL_TABLE_CACHE[TableName]['header']['number_of_rows'] += 1
@@ -1272,6 +1373,45 @@ def putRowObjectToString(RowObject):
         output_string += formatString(par_format,par_value)
     return output_string
 
+# number of rows formatted and written at once by cache2storage
+CACHE2STORAGE_BLOCK = 100000
+
+def formatColumn(par_format,values):
+    # Fortran string formatting of the whole column,
+    #  gives the same results as formatString for every value
+    regex = FORMAT_PYTHON_REGEX
+    (lng,trail,lngpnt,ty) = re.search(regex,par_format).groups()
+    if isinstance(values,ndarray): values = values.tolist()
+    result = [par_format % par_value for par_value in values]
+    if ty.lower() in set(['f','e']):
+        lng = int(lng) if lng else 0
+        lngpnt = int(lngpnt) if lngpnt else 0
+        fmt = '%%%ds' % lng
+        if lng==lngpnt+1:
+            # drop leading zero: 0.123 -> .123
+            result = [fmt % res[1:] if res[0:1]=='0' else item
+                      for item,res in zip(result,map(str.strip,result))]
+        # drop leading zero of the negative values: -0.123 -> -.123
+        #  (check only the negative ones)
+        for i in np.flatnonzero(array(values)<0):
+            res = (par_format % values[i]).strip()
+            if res[1:2]=='0':
+                result[i] = fmt % (res[0:1]+res[2:])
+    return result
+
+def putColumnsToString(header,data,RowStart,RowEnd):
+    # serialize rows from RowStart to RowEnd, one line per row
+    return putFormattedColumnsToString([header['format'][par_name] for par_name in header['order']],
+                                       [data[par_name][RowStart:RowEnd] for par_name in header['order']],
+                                       RowEnd-RowStart)
+
+def putFormattedColumnsToString(Formats,Columns,number_of_rows):
+    # serialize rows of the columns, one line per row
+    columns = [formatColumn(par_format,column) for par_format,column in zip(Formats,Columns)]
+    if not columns:
+        return '\n'*number_of_rows
+    return ''.join([line+'\n' for line in map(''.join,zip(*columns))])
+
 # Parameter nicknames are hard-coded.
 PARAMETER_NICKNAMES = {
     "a": "A", 
@@ -1296,10 +1436,14 @@ PARAMETER_NICKNAMES = {
 }  
 
 def putTableHeaderToString(TableName):
+    header = LOCAL_TABLE_CACHE[TableName]['header']
+    return putNamesToString(header['order'],[header['format'][par_name] for par_name in header['order']])
+
+def putNamesToString(ParameterNames,Formats):
+    # parameter names (or nicknames) aligned with the columns of the given formats
     output_string = ''
     regex = FORMAT_PYTHON_REGEX
-    for par_name in LOCAL_TABLE_CACHE[TableName]['header']['order']:
-        par_format = LOCAL_TABLE_CACHE[TableName]['header']['format'][par_name]
+    for par_name,par_format in zip(ParameterNames,Formats):
         (lng,trail,lngpnt,ty) = re.search(regex,par_format).groups()
         fmt = '%%%ss' % lng
         try:
@@ -1313,10 +1457,14 @@ def putTableHeaderToString(TableName):
 def getRowObjectFromString(input_string,TableName):
     # restore RowObject from string, get formats and names in TableName
     #print 'getRowObjectFromString:'
+    return getRowObjectFromHeader(input_string,LOCAL_TABLE_CACHE[TableName]['header'])
+
+def getRowObjectFromHeader(input_string,header):
+    # restore RowObject from string, get formats and names from the table header
     pos = 0
     RowObject = []
-    for par_name in LOCAL_TABLE_CACHE[TableName]['header']['order']:
-        par_format = LOCAL_TABLE_CACHE[TableName]['header']['format'][par_name]
+    for par_name in header['order']:
+        par_format = header['format'][par_name]
         regex = '^\%([0-9]+)\.?[0-9]*([dfs])$' #
         regex = FORMAT_PYTHON_REGEX
         (lng,trail,lngpnt,ty) = re.search(regex,par_format).groups()
@@ -1334,16 +1482,15 @@ def getRowObjectFromString(input_string,TableName):
         RowObject.append((par_name,par_value,par_format))
         pos += lng
     # Do the same but now for extra (comma-separated) parameters
-    if 'extra' in set(LOCAL_TABLE_CACHE[TableName]['header']):
-        csv_chunks = input_string.split(LOCAL_TABLE_CACHE[TableName]['header'].\
-                                        get('extra_separator',','))
+    if 'extra' in set(header):
+        csv_chunks = input_string.split(header.get('extra_separator',','))
         # Disregard the first "column-fixed" container if it presents:
-        if LOCAL_TABLE_CACHE[TableName]['header'].get('order',[]):
+        if header.get('order',[]):
             pos = 1
         else:
             pos = 0
-        for par_name in LOCAL_TABLE_CACHE[TableName]['header']['extra']:
-            par_format = LOCAL_TABLE_CACHE[TableName]['header']['extra_format'][par_name]
+        for par_name in header['extra']:
+            par_format = header['extra_format'][par_name]
             regex = '^\%([0-9]+)\.?[0-9]*([dfs])$' #
             regex = FORMAT_PYTHON_REGEX
             (lng,trail,lngpnt,ty) = re.search(regex,par_format).groups()
@@ -1376,22 +1523,613 @@ def cache2storage(TableName):
     except:
        pass
     #fullpath_data,fullpath_header = getFullTableAndHeaderName(TableName) # "lonely header" bug
-    fullpath_data = VARIABLES['BACKEND_DATABASE_NAME'] + '/' + TableName + '.data' # bugfix
+    fullpath_data = getDataFileName(TableName) # bugfix
     fullpath_header = VARIABLES['BACKEND_DATABASE_NAME'] + '/' + TableName + '.header' # bugfix
-    OutfileData = open(fullpath_data,'w')
+    loadTableOnDemand(TableName)
+    materializeTable(TableName)
+    dropSidecar(fullpath_header) # binary copy becomes outdated
+    removeOtherDataFiles(fullpath_data)
+    OutfileData = open_(fullpath_data,'w') if VARIABLES['DATA_COMPRESSION'] else open(fullpath_data,'w')
     OutfileHeader = open(fullpath_header,'w')
-    # write table data
-    line_count = 1
-    line_number = LOCAL_TABLE_CACHE[TableName]['header']['number_of_rows']
-    for RowID in range(0,line_number):
-        line_count += 1
-        RowObject = getRowObject(RowID,TableName)
-        raw_string = putRowObjectToString(RowObject)
-        OutfileData.write(raw_string+'\n')
+    # write table data by blocks of rows, formatting the block column-wise
+    header = LOCAL_TABLE_CACHE[TableName]['header']
+    data = LOCAL_TABLE_CACHE[TableName]['data']
+    line_number = header['number_of_rows']
+    for RowStart in range(0,line_number,CACHE2STORAGE_BLOCK):
+        RowEnd = min(RowStart+CACHE2STORAGE_BLOCK,line_number)
+        OutfileData.write(putColumnsToString(header,data,RowStart,RowEnd))
+    OutfileData.close()
     # write table header
     TableHeader = getTableHeader(TableName)
     OutfileHeader.write(json.dumps(TableHeader,indent=2))
+    OutfileHeader.close()
     
+# BULK PARSER FOR COLUMN-FIXED DATA
+#  Instead of calling one converter per field of every line,
+#  the whole block of lines is turned into a byte matrix and each
+#  column of the header format is sliced and cast in one pass.
+
+FIXED_WIDTH_TYPES = {'d':int, 'f':float, 'E':float, 's':str}
+
+def getFixedWidthLayout(header):
+    # return a list of (qnt,dtype,start,end) for the "order" section of the header
+    layout = []
+    end = 0
+    for qnt in header['order']:
+        fmt = header['format'][qnt]
+        # pre-defined positions are needed to skip the existing parameters in headers (new feature)
+        if 'position' in header:
+            start = header['position'][qnt]
+        else:
+            start = end
+        dtype = FIXED_WIDTH_TYPES[fmt[-1]]
+        aux = fmt[fmt.index('%')+1:-1]
+        if '.' in aux:
+            aux = aux[:aux.index('.')]
+        size = int(aux)
+        end = start + size
+        layout.append((qnt,dtype,start,end))
+    return layout
+
+def convertFixedWidthValue(value,dtype,qnt):
+    # convert a single fixed-width field to the value of the given type
+    # return dtype(value) # this will fail on the float number with D exponent (Fortran notation)
+    if dtype==float:
+        try:
+            return dtype(value)
+        except ValueError: # possible D exponent instead of E 
+            try:
+                return dtype(value.replace('D','E'))
+            except ValueError: # this is a special case and it should not be in the main version tree!
+                # Dealing with the weird and unparsable intensity format such as "2.700-164, i.e with no E or D characters.
+                res = re.search('(\d\.\d\d\d)\-(\d\d\d)',value)
+                if res:
+                    return dtype(res.group(1)+'E-'+res.group(2))
+                else:
+                    raise Exception('PARSE ERROR: unknown format of the par value (%s)'%value)
+    elif dtype==int and qnt=='local_iso_id':
+        if value=='0': return 10
+        try:
+            return dtype(value)
+        except ValueError:
+            # convert letters to numbers: A->11, B->12, etc... ; .par file must be in ASCII or Unicode.
+            return 11+ord(value)-ord('A')
+    else:
+        return dtype(value)
+
+def getFixedWidthConverter(qnt,dtype,start,end):
+    # per-line converter, used when the bulk parser can't be applied
+    def cfunc(line, dtype=dtype, start=start, end=end, qnt=qnt):
+        return convertFixedWidthValue(line[start:end],dtype,qnt)
+    return cfunc
+
+def getFixedWidthField(lines,starts,lengths,start,end):
+    # return a fixed-width column [start,end) of all lines as an array of byte strings
+    if lengths is None: # all lines have the same length, lines is a 2D matrix
+        width = lines.shape[1]
+        field = lines[:,min(start,width):min(end,width)]
+        if end>width: # pad the short lines with zero bytes (stripped by numpy)
+            field = np.hstack([field,zeros((field.shape[0],end-max(start,width)),dtype=np.uint8)])
+    else: # lines is a flat buffer, gather the bytes by index
+        offsets = arange(start,end)
+        index = starts[:,None] + offsets[None,:]
+        valid = offsets[None,:] < lengths[:,None]
+        field = where(valid,lines[np.minimum(index,len(lines)-1)],0).astype(np.uint8)
+    field = np.ascontiguousarray(field)
+    return field.view('S%d'%(end-start)).ravel()
+
+def castFloatField(field):
+    # replace Fortran D exponent by E
+    raw = field.view(np.uint8).copy()
+    raw[raw==ord('D')] = ord('E')
+    values = raw.view(field.dtype)
+    try:
+        return values.astype(__FloatType__)
+    except ValueError:
+        # weird values such as "2.700-164" have no exponent character,
+        #  only those are converted one by one
+        raw = raw.reshape(len(field),-1)
+        odd = ~np.any((raw==ord('E'))|(raw==ord('e')),axis=1)
+        column = zeros(len(field),dtype=__FloatType__)
+        column[~odd] = values[~odd].astype(__FloatType__)
+        column[odd] = [convertFixedWidthValue(value,float,None) for value in field[odd].astype(str).tolist()]
+        return column
+
+def internStrings(values):
+    # equal strings of the column share one object
+    pool = {}
+    return [pool.setdefault(value,value) for value in values]
+
+def compactColumn(column,par_format):
+    # narrowest integer type holding the values of the column;
+    #  with FLOAT32_COLUMNS, single precision for the float columns
+    #  which keep all the digits of their format in it
+    if not isinstance(column,ndarray) or isinstance(column,np.memmap) or len(column)==0:
+        return column
+    if column.dtype.kind=='i':
+        lo,hi = column.min(),column.max()
+        for dtype in (np.int8,np.int16,np.int32):
+            if np.iinfo(dtype).min<=lo and hi<=np.iinfo(dtype).max:
+                return column.astype(dtype)
+    elif column.dtype.kind=='f' and VARIABLES['FLOAT32_COLUMNS']:
+        (lng,trail,lngpnt,ty) = re.search(FORMAT_PYTHON_REGEX,par_format).groups()
+        if ty=='f' and lngpnt and np.isfinite(column).all() and \
+           np.abs(column).max()*np.finfo(float32).eps<0.5*10**-int(lngpnt):
+            return column.astype(float32)
+    return column
+
+def widenColumn(column):
+    # compact column back in int64/float64, so that the arithmetic
+    #  on its values gives the same results as on the full-width column
+    if isinstance(column,ndarray) and column.dtype.kind in 'if' and column.dtype.itemsize<8:
+        return column.astype(__IntegerType__ if column.dtype.kind=='i' else __FloatType__)
+    return column
+
+def widenValue(value):
+    # same as widenColumn for a single value of the column
+    if isinstance(value,(np.int8,np.int16,np.int32)):
+        return np.int64(value)
+    if isinstance(value,np.float32):
+        return np.float64(value)
+    return value
+
+def compactTable(TableName):
+    # store the numeric columns of the table in the compact types
+    header = LOCAL_TABLE_CACHE[TableName]['header']
+    data = LOCAL_TABLE_CACHE[TableName]['data']
+    for par_name in header['order']:
+        data[par_name] = compactColumn(data[par_name],header['format'][par_name])
+
+def castFixedWidthField(field,dtype,qnt):
+    # cast array of byte strings to a column; fall back to
+    #  the element-wise conversion if the bulk cast is impossible
+    try:
+        if dtype==float:
+            return castFloatField(field)
+        elif dtype==int and qnt=='local_iso_id':
+            # few unique values: convert them one by one and broadcast back
+            values,inverse = np.unique(field,return_inverse=True)
+            values = array([convertFixedWidthValue(value.decode('ascii'),dtype,qnt) for value in values],
+                           dtype=__IntegerType__)
+            return values[inverse.ravel()]
+        elif dtype==int:
+            return field.astype(__IntegerType__)
+        else:
+            return internStrings(field.astype(str).tolist())
+    except ValueError:
+        column = [convertFixedWidthValue(value,dtype,qnt) for value in field.astype(str).tolist()]
+        return array(column)
+
+def parseFixedWidthBuffer(buffer,layout):
+    # parse ASCII buffer with newline-separated lines according to layout
+    #  (see getFixedWidthLayout); return list of columns and number of lines
+    data = np.frombuffer(buffer,dtype=np.uint8)
+    stops = np.flatnonzero(data==ord('\n')) + 1 # line ends, newline included
+    if len(data) and data[-1]!=ord('\n'):
+        stops = np.append(stops,len(data))
+    line_count = len(stops)
+    if line_count==0:
+        return [],0
+    starts = np.concatenate([[0],stops[:-1]])
+    lengths = stops - starts
+    if np.all(lengths==lengths[0]):
+        # typical case of .par files: view the buffer as a matrix without copying
+        lines = data[:line_count*lengths[0]].reshape(line_count,lengths[0])
+        starts = lengths = None
+    else:
+        lines = data
+    columns = []
+    for qnt,dtype,start,end in layout:
+        field = getFixedWidthField(lines,starts,lengths,start,end)
+        columns.append(castFixedWidthField(field,dtype,qnt))
+    return columns,line_count
+
+# BINARY COLUMNAR SIDECAR
+#  After a table is parsed from text, its columns are saved as .npy files
+#  in the TableName.cache folder together with a manifest.json, which holds
+#  the final header and the size/mtime of the source data and header files.
+#  If the sources didn't change, storage2cache reads the columns back
+#  instead of parsing the text again.
+
+SIDECAR_VERSION = 1
+SIDECAR_EXT = 'cache'
+SIDECAR_MANIFEST = 'manifest.json'
+
+def getSidecarName(fullpath_header):
+    # sidecar folder for the table with the given header file
+    return os.path.splitext(fullpath_header)[0] + '.' + SIDECAR_EXT
+
+def getFileStamp(path):
+    # size and modification time identifying the state of the file
+    stat = os.stat(path)
+    return [stat.st_size,stat.st_mtime_ns]
+
+def getSidecarSources(fullpath_data,fullpath_header):
+    return {'data':[os.path.abspath(fullpath_data)]+getFileStamp(fullpath_data),
+            'header':getFileStamp(fullpath_header)}
+
+def saveSidecar(TableName,fullpath_data,fullpath_header):
+    # write columns of the table from cache to the sidecar folder
+    sidecar = getSidecarName(fullpath_header)
+    header = LOCAL_TABLE_CACHE[TableName]['header']
+    data = LOCAL_TABLE_CACHE[TableName]['data']
+    columns = []
+    try:
+        if not os.path.isdir(sidecar): os.mkdir(sidecar)
+        for i,par_name in enumerate(header['order']):
+            col = data[par_name]
+            kind = 'array' if isinstance(col,ndarray) else 'list'
+            col = np.asarray(col)
+            if col.dtype.kind not in 'biufU': return False # can't be stored without pickling
+            fname = '%d.npy' % i
+            np.save(os.path.join(sidecar,fname),col,allow_pickle=False)
+            columns.append([par_name,fname,kind])
+        manifest = {'version':SIDECAR_VERSION,
+                    'sources':getSidecarSources(fullpath_data,fullpath_header),
+                    'header':header,'columns':columns}
+        # manifest is written the last, so a half-written sidecar is never valid
+        with open(os.path.join(sidecar,SIDECAR_MANIFEST+'.tmp'),'w') as fp:
+            fp.write(json.dumps(manifest))
+        os.replace(os.path.join(sidecar,SIDECAR_MANIFEST+'.tmp'),
+                   os.path.join(sidecar,SIDECAR_MANIFEST))
+    except (OSError,TypeError,ValueError) as e:
+        warn('Cannot write sidecar for %s: %s' % (TableName,e))
+        return False
+    return True
+
+def readSidecarManifest(fullpath_data,fullpath_header):
+    # manifest of the sidecar if it is up to date, None otherwise
+    try:
+        with open(os.path.join(getSidecarName(fullpath_header),SIDECAR_MANIFEST),'r') as fp:
+            manifest = json.loads(fp.read())
+        if manifest['version']!=SIDECAR_VERSION or \
+           manifest['sources']!=getSidecarSources(fullpath_data,fullpath_header):
+            return None
+    except (OSError,KeyError,TypeError,ValueError):
+        return None
+    return manifest
+
+def loadSidecar(TableName,fullpath_data,fullpath_header,mmap_mode=None):
+    # read the table from the sidecar folder to cache, if it is up to date;
+    #  with mmap_mode the columns (string ones included) are memory-mapped
+    sidecar = getSidecarName(fullpath_header)
+    manifest = readSidecarManifest(fullpath_data,fullpath_header)
+    if manifest is None: return False
+    try:
+        data = {}
+        for par_name,fname,kind in manifest['columns']:
+            col = np.load(os.path.join(sidecar,fname),mmap_mode=mmap_mode,allow_pickle=False)
+            data[par_name] = col if kind=='array' or mmap_mode else internStrings(col.tolist())
+    except (OSError,KeyError,ValueError):
+        return False
+    LOCAL_TABLE_CACHE[TableName] = {'header':manifest['header'],'data':data,'filehandler':None}
+    return True
+
+def getWritableColumn(TableName,ParameterName):
+    # controlled write path for memory-mapped columns: the column is copied
+    #  to RAM on the first edit, the sidecar files are never modified;
+    #  the caller calls touchTable before the edit
+    col = LOCAL_TABLE_CACHE[TableName]['data'][ParameterName]
+    if isinstance(col,np.memmap):
+        col = col.tolist() if col.dtype.kind=='U' else np.array(col)
+        LOCAL_TABLE_CACHE[TableName]['data'][ParameterName] = col
+    if isinstance(col,ndarray) and col.dtype.kind in 'if' and col.dtype.itemsize<8:
+        # compact column: widen it back, so that any value can be stored
+        col = widenColumn(col)
+        LOCAL_TABLE_CACHE[TableName]['data'][ParameterName] = col
+    return col
+
+def dropSidecar(fullpath_header):
+    # remove the sidecar of the table, e.g. when its data file is rewritten
+    sidecar = getSidecarName(fullpath_header)
+    if not os.path.isdir(sidecar): return
+    try:
+        # without manifest the rest of the files is ignored
+        os.remove(os.path.join(sidecar,SIDECAR_MANIFEST))
+    except OSError:
+        pass
+    try:
+        for fname in listdir(sidecar):
+            os.remove(os.path.join(sidecar,fname))
+        os.rmdir(sidecar)
+    except OSError: # files can still be mapped (e.g. on Windows)
+        pass
+
+def readTableHeader(fullpath_header):
+    # read the JSON header of the table
+    with open(fullpath_header,'r') as InfileHeader:
+        header_text = InfileHeader.read()
+    try:
+        Header = json.loads(header_text)
+    except:
+        print('HEADER:')
+        print(header_text)
+        raise Exception('Invalid header')
+    # Check if Header['order'] and Header['extra'] contain
+    #  parameters with same names, raise exception if true.
+    intersct = set(Header.get('order',[])).intersection(set(Header.get('extra',[])))
+    if intersct:
+        raise Exception('Parameters with the same names: {}'.format(intersct))
+    return Header
+
+def getTableSchema(Header):
+    # get order, formats and defaults of all table parameters;
+    #  comma-separated ("extra") parameters go after the column-fixed ones
+    glob_order = []; glob_format = {}; glob_default = {}
+    if "order" in Header.keys():
+        glob_order += Header['order']
+        glob_format.update(Header['format'])
+        glob_default.update(Header['default'])
+    if "extra" in Header.keys():
+        glob_order += Header['extra']
+        glob_format.update(Header['extra_format'])
+        for par_name in Header['extra']:
+            glob_default[par_name] = PARAMETER_META[par_name]['default_fmt']
+    return glob_order,glob_format,glob_default
+
+def castCSVField(values,ty,strict):
+    # Convert the text values of a field as getRowObjectFromHeader does.
+    #  Return the column and the mask of values which can not be converted:
+    #  strict fields reject such rows, the others get zero instead
+    #  (the "#" placeholders of the missing parameters).
+    if ty=='d': # integer value
+        dtype,func,default = int64,int,0
+    elif ty.lower() in set(['e','f']): # float value
+        dtype,func,default = float64,float,0.0
+    elif ty=='s': # string value
+        return internStrings(values),None # don't strip string value
+    else:
+        raise Exception('Format \"%s\" is unknown' % ty)
+    try:
+        field = array(values,dtype=bytes) # byte strings convert faster
+        placeholder,empty,zero = b'#',b'',b'0'
+    except UnicodeEncodeError:
+        field = array(values,dtype=str)
+        placeholder,empty,zero = '#','','0'
+    if not strict:
+        stripped = np.char.strip(field)
+        field[(stripped==placeholder)|(stripped==empty)] = zero
+    try:
+        return field.astype(dtype),None
+    except (ValueError,OverflowError):
+        pass
+    column = []; failed = zeros(len(values),dtype=bool)
+    for i,value in enumerate(values):
+        try:
+            column.append(func(value))
+        except:
+            column.append(default); failed[i] = True
+    return array(column),failed if strict else None
+
+def parseExtraLines(lines,Header):
+    # parse lines of the table with column-fixed and comma-separated parts,
+    #  the lines which getRowObjectFromHeader can't parse are dropped
+    order = Header.get('order',[])
+    extra = Header['extra']
+    chunks = [line.split(Header.get('extra_separator',',')) for line in lines]
+    # Disregard the first "column-fixed" container if it presents:
+    first = 1 if order else 0
+    accepted = np.fromiter(map(len,chunks),dtype=int,count=len(chunks))>=first+len(extra)
+    if not accepted.all():
+        lines = [line for line,ok in zip(lines,accepted) if ok]
+        chunks = [chunk for chunk,ok in zip(chunks,accepted) if ok]
+    accepted = np.ones(len(lines),dtype=bool)
+    columns = {}
+    try:
+        pos = 0
+        for par_name in order:
+            (lng,trail,lngpnt,ty) = re.search(FORMAT_PYTHON_REGEX,Header['format'][par_name]).groups()
+            lng = int(lng)
+            columns[par_name],failed = castCSVField([line[pos:pos+lng] for line in lines],ty,True)
+            if failed is not None: accepted &= ~failed
+            pos += lng
+        for i,par_name in enumerate(extra):
+            (lng,trail,lngpnt,ty) = re.search(FORMAT_PYTHON_REGEX,Header['extra_format'][par_name]).groups()
+            lng = int(lng)
+            columns[par_name],failed = castCSVField([chunk[first+i] for chunk in chunks],ty,False)
+    except Exception:
+        # malformed format: no line can be parsed
+        accepted[:] = False
+        columns = {par_name:[] for par_name in order+extra}
+    if not accepted.all():
+        for par_name in columns:
+            if isinstance(columns[par_name],ndarray):
+                columns[par_name] = columns[par_name][accepted]
+            else:
+                columns[par_name] = [value for value,ok in zip(columns[par_name],accepted) if ok]
+    return columns,int(accepted.sum())
+
+def parseTableBlock(InfileData,Header,nlines=None):
+    """
+    Parse at most nlines lines (all remaining lines if None) of the table
+    data from the opened file InfileData, as described by Header.
+    Return the columns dictionary, number of parsed lines and EOF flag.
+    """
+    glob_order,glob_format,glob_default = getTableSchema(Header)
+    data = {par_name:[] for par_name in glob_order}
+    if 'extra' in Header and Header['extra']:
+        # Parse the lines in bulk; rejected lines don't count,
+        #  so keep reading until the block is full.
+        line_count = 0
+        flag_EOF = False
+        blocks = []
+        while nlines is None or line_count<nlines:
+            if nlines is None:
+                lines = InfileData.readlines()
+                flag_EOF = True
+            else:
+                lines = list(islice(iter(InfileData.readline,''),nlines-line_count))
+                flag_EOF = len(lines)<nlines-line_count
+            columns,count = parseExtraLines(lines,Header)
+            blocks.append(columns); line_count += count
+            if flag_EOF: break
+        for par_name in glob_order:
+            cols = [columns[par_name] for columns in blocks]
+            if isinstance(cols[0],ndarray):
+                data[par_name] = cols[0] if len(cols)==1 else np.concatenate(cols)
+            else:
+                for col in cols: data[par_name].extend(col)
+    else:
+        quantities = Header['order']
+        layout = getFixedWidthLayout(Header)
+        # Read the whole block as one buffer and slice the columns from it.
+        if nlines is None:
+            text = InfileData.read()
+            flag_EOF = True
+        else:
+            lines = list(islice(iter(InfileData.readline,''),nlines))
+            flag_EOF = len(lines)<nlines
+            text = ''.join(lines); del lines
+        try:
+            buffer = text.encode('ascii')
+        except UnicodeEncodeError:
+            buffer = None
+        if buffer is not None:
+            del text
+            data_columns,line_count = parseFixedWidthBuffer(buffer,layout)
+            del buffer
+        else:
+            # non-ASCII data: byte positions differ from character positions,
+            #  fall back to the per-line converters
+            converters = [getFixedWidthConverter(qnt,dtype,start,end) for qnt,dtype,start,end in layout]
+            lines = text.split('\n')
+            lines = [line+'\n' for line in lines[:-1]] + ([lines[-1]] if lines[-1] else [])
+            data_matrix = [[cvt(line) for cvt in converters] for line in lines]
+            line_count = len(data_matrix)
+            data_columns = zip(*data_matrix)
+        for qnt, col in zip(quantities, data_columns):
+            if isinstance(col,np.ndarray):
+                data[qnt] = col # bulk parser
+            elif type(col[0]) in {int,float}:
+                data[qnt] = np.array(col)
+            else:
+                data[qnt].extend(internStrings(col))
+        line_count = len(data[quantities[0]])
+    return data,line_count,flag_EOF
+
+def iterTableChunks(TableName,chunk_rows=100000,ext=None):
+    """
+    INPUT PARAMETERS: 
+        TableName:   name of the table
+        chunk_rows:  maximum number of rows in one chunk
+        ext:         extension of the data file (optional)
+    OUTPUT PARAMETERS: 
+        iterator over the table chunks
+    ---
+    DESCRIPTION:
+        Iterate over the table by blocks of at most chunk_rows rows.
+        Every chunk is a dictionary with the same structure as
+        a table in the cache: {'header':..., 'data':{par_name:column}},
+        where the header describes the chunk (number_of_rows is the
+        size of the chunk). Tables which are already loaded in the cache
+        are sliced; otherwise the data file is streamed from the storage,
+        so the whole table is never read in memory and the cache
+        is not modified.
+    ---
+    EXAMPLE OF USAGE:
+        for chunk in iterTableChunks('sampletab',10000):
+            print(chunk['header']['number_of_rows'],sum(chunk['data']['sw']))
+    ---
+    """
+    chunk_rows = int(chunk_rows)
+    if chunk_rows<1:
+        raise Exception('chunk_rows must be positive')
+    if TableName in LOCAL_TABLE_CACHE and isTableLoaded(TableName) and \
+       LOCAL_TABLE_CACHE[TableName].get('filehandler') is None:
+        Header = LOCAL_TABLE_CACHE[TableName]['header']
+        data = LOCAL_TABLE_CACHE[TableName]['data']
+        for RowStart in range(0,Header['number_of_rows'],chunk_rows):
+            RowEnd = min(RowStart+chunk_rows,Header['number_of_rows'])
+            header = Header.copy()
+            header['number_of_rows'] = RowEnd-RowStart
+            yield {'header':header,
+                   'data':{par_name:data[par_name][RowStart:RowEnd] for par_name in Header['order']}}
+        return
+    if TableName in LOCAL_TABLE_CACHE and ext is None:
+        ext = LOCAL_TABLE_CACHE[TableName].get('ext')
+    fullpath_data,fullpath_header = getFullTableAndHeaderName(TableName,ext)
+    for chunk in iterStorageChunks(fullpath_data,fullpath_header,chunk_rows):
+        yield chunk
+
+def iterStorageChunks(fullpath_data,fullpath_header,chunk_rows):
+    # chunks of the table streamed from its data file (see iterTableChunks)
+    Header = readTableHeader(fullpath_header)
+    glob_order,glob_format,glob_default = getTableSchema(Header)
+    with open_(fullpath_data,'r') as InfileData:
+        flag_EOF = False
+        while not flag_EOF:
+            data,line_count,flag_EOF = parseTableBlock(InfileData,Header,chunk_rows)
+            if line_count==0: break
+            header = {key:Header[key] for key in Header
+                      if key not in ('extra','extra_format','extra_separator')}
+            header['order'] = glob_order
+            header['format'] = glob_format
+            header['default'] = glob_default
+            header['number_of_rows'] = line_count
+            yield {'header':header,'data':data}
+
+# rows parsed at once when the sidecar is built by blocks
+SIDECAR_CHUNK_ROWS = 100000
+
+def saveSidecarByChunks(TableName,fullpath_data,fullpath_header,chunk_rows=SIDECAR_CHUNK_ROWS):
+    # parse the data file block by block straight to the sidecar folder,
+    #  so the whole table is never held in memory (see saveSidecar):
+    #  every block is saved to its own files, which are then copied
+    #  into the final columns written through memory maps
+    sidecar = getSidecarName(fullpath_header)
+    parts = [] # file names of the blocks of each column
+    header = None
+    number_of_rows = 0
+    try:
+        if not os.path.isdir(sidecar): os.mkdir(sidecar)
+        for chunk_id,chunk in enumerate(iterStorageChunks(fullpath_data,fullpath_header,chunk_rows)):
+            header = chunk['header']
+            number_of_rows += header['number_of_rows']
+            for i,par_name in enumerate(header['order']):
+                col = chunk['data'][par_name]
+                if chunk_id==0:
+                    parts.append([par_name,'array' if isinstance(col,ndarray) else 'list',[]])
+                col = np.asarray(col)
+                if col.dtype.kind not in 'biufU': return False # can't be stored without pickling
+                fname = '%d.%d.npy' % (i,chunk_id)
+                np.save(os.path.join(sidecar,fname),col,allow_pickle=False)
+                parts[i][2].append(fname)
+            del chunk
+        if header is None: return False # empty table: nothing to gain
+        header['number_of_rows'] = number_of_rows
+        columns = []
+        for i,(par_name,kind,fnames) in enumerate(parts):
+            blocks = [np.load(os.path.join(sidecar,fname),mmap_mode='r') for fname in fnames]
+            fname = '%d.npy' % i
+            col = np.lib.format.open_memmap(os.path.join(sidecar,fname),mode='w+',
+                                            dtype=np.result_type(*blocks),shape=(number_of_rows,))
+            RowStart = 0
+            for block in blocks:
+                col[RowStart:RowStart+len(block)] = block
+                RowStart += len(block)
+            col.flush()
+            del col,blocks
+            columns.append([par_name,fname,kind])
+        manifest = {'version':SIDECAR_VERSION,
+                    'sources':getSidecarSources(fullpath_data,fullpath_header),
+                    'header':header,'columns':columns}
+        # manifest is written the last, so a half-written sidecar is never valid
+        with open(os.path.join(sidecar,SIDECAR_MANIFEST+'.tmp'),'w') as fp:
+            fp.write(json.dumps(manifest))
+        os.replace(os.path.join(sidecar,SIDECAR_MANIFEST+'.tmp'),
+                   os.path.join(sidecar,SIDECAR_MANIFEST))
+    except (OSError,TypeError,ValueError) as e:
+        warn('Cannot write sidecar for %s: %s' % (TableName,e))
+        return False
+    finally:
+        for par_name,kind,fnames in parts:
+            for fname in fnames:
+                try:
+                    os.remove(os.path.join(sidecar,fname))
+                except OSError:
+                    pass
+    return True
+
 def storage2cache(TableName,cast=True,ext=None,nlines=None):
     """ edited by NHL
     TableName: name of the HAPI table to read in
@@ -1402,140 +2140,40 @@ def storage2cache(TableName,cast=True,ext=None,nlines=None):
     #print('TableName',TableName)
     if nlines is not None:
         print('WARNING: storage2cache is reading the block of maximum %d lines'%nlines)
+    touchTable(TableName)
     fullpath_data,fullpath_header = getFullTableAndHeaderName(TableName,ext)
     if TableName in LOCAL_TABLE_CACHE and \
        'filehandler' in LOCAL_TABLE_CACHE[TableName] and \
        LOCAL_TABLE_CACHE[TableName]['filehandler'] is not None:
         InfileData = LOCAL_TABLE_CACHE[TableName]['filehandler'] 
     else:
+        # whole table is requested: try the binary sidecar first
+        if nlines is None and (VARIABLES['SIDECAR_CACHE'] or VARIABLES['MEMMAP_COLUMNS']) and \
+           loadSidecar(TableName,fullpath_data,fullpath_header,
+                       mmap_mode='r' if VARIABLES['MEMMAP_COLUMNS'] else None):
+            if VARIABLES['COMPACT_COLUMNS']: compactTable(TableName)
+            print('                     Lines loaded: %d' % \
+                  LOCAL_TABLE_CACHE[TableName]['header']['number_of_rows'])
+            return True
+        # memory-mapped table: build the sidecar by blocks and map it
+        if nlines is None and VARIABLES['MEMMAP_COLUMNS'] and \
+           saveSidecarByChunks(TableName,fullpath_data,fullpath_header) and \
+           loadSidecar(TableName,fullpath_data,fullpath_header,mmap_mode='r'):
+            print('                     Lines parsed: %d' % \
+                  LOCAL_TABLE_CACHE[TableName]['header']['number_of_rows'])
+            return True
         InfileData = open_(fullpath_data,'r')            
-    InfileHeader = open(fullpath_header,'r')
-    #try:
-    header_text = InfileHeader.read()
-    try:
-        Header = json.loads(header_text)
-    except:
-        print('HEADER:')
-        print(header_text)
-        raise Exception('Invalid header')
+    Header = readTableHeader(fullpath_header)
     #print 'Header:'+str(Header)
     LOCAL_TABLE_CACHE[TableName] = {}
     LOCAL_TABLE_CACHE[TableName]['header'] = Header
     LOCAL_TABLE_CACHE[TableName]['data'] = {}    
     LOCAL_TABLE_CACHE[TableName]['filehandler'] = InfileData
-    # Check if Header['order'] and Header['extra'] contain
-    #  parameters with same names, raise exception if true.
-    #intersct = set(Header['order']).intersection(set(Header.get('extra',[])))
-    intersct = set(Header.get('order',[])).intersection(set(Header.get('extra',[])))
-    if intersct:
-        raise Exception('Parameters with the same names: {}'.format(intersct))
     # initialize empty data to avoid problems
-    glob_order = []; glob_format = {}; glob_default = {}
-    if "order" in LOCAL_TABLE_CACHE[TableName]['header'].keys():
-        glob_order += LOCAL_TABLE_CACHE[TableName]['header']['order']
-        glob_format.update(LOCAL_TABLE_CACHE[TableName]['header']['format'])
-        glob_default.update(LOCAL_TABLE_CACHE[TableName]['header']['default'])
-        for par_name in LOCAL_TABLE_CACHE[TableName]['header']['order']:
-            LOCAL_TABLE_CACHE[TableName]['data'][par_name] = []
-    if "extra" in LOCAL_TABLE_CACHE[TableName]['header'].keys():
-        glob_order += LOCAL_TABLE_CACHE[TableName]['header']['extra']
-        glob_format.update(LOCAL_TABLE_CACHE[TableName]['header']['extra_format'])
-        for par_name in LOCAL_TABLE_CACHE[TableName]['header']['extra']:
-            glob_default[par_name] = PARAMETER_META[par_name]['default_fmt']
-            LOCAL_TABLE_CACHE[TableName]['data'][par_name] = []
-    
-    header = LOCAL_TABLE_CACHE[TableName]['header']
-    if 'extra' in header and header['extra']:
-        line_count = 0
-        flag_EOF = False
-        #line_number = LOCAL_TABLE_CACHE[TableName]['header']['number_of_rows']
-        #for line in InfileData:
-        while True:
-            #print '%d line from %d' % (line_count,line_number)
-            #print 'line: '+line #
-            if nlines is not None and line_count>=nlines: break
-            line = InfileData.readline()
-            if line=='': # end of file is represented by an empty string
-                flag_EOF = True
-                break 
-            try:
-                RowObject = getRowObjectFromString(line,TableName)
-                line_count += 1
-            except:
-                continue
-            #print 'RowObject: '+str(RowObject)
-            addRowObject(RowObject,TableName)
-        #except:
-        #    raise Exception('TABLE FETCHING ERROR')
-        LOCAL_TABLE_CACHE[TableName]['header']['number_of_rows'] = line_count
-    else:
-        quantities = header['order']
-        formats = [header['format'][qnt] for qnt in quantities]
-        types = {'d':int, 'f':float, 'E':float, 's':str}
-        converters = []
-        end = 0
-        for qnt, fmt in zip(quantities, formats):
-            # pre-defined positions are needed to skip the existing parameters in headers (new feature)
-            if 'position' in header:
-                start = header['position'][qnt]
-            else:
-                start = end
-            dtype = types[fmt[-1]]
-            aux = fmt[fmt.index('%')+1:-1]
-            if '.' in aux:
-                aux = aux[:aux.index('.')]
-            size = int(aux)
-            end = start + size
-            def cfunc(line, dtype=dtype, start=start, end=end, qnt=qnt):
-                # return dtype(line[start:end]) # this will fail on the float number with D exponent (Fortran notation)
-                if dtype==float:
-                    try:
-                        return dtype(line[start:end])
-                    except ValueError: # possible D exponent instead of E 
-                        try:
-                            return dtype(line[start:end].replace('D','E'))
-                        except ValueError: # this is a special case and it should not be in the main version tree!
-                            # Dealing with the weird and unparsable intensity format such as "2.700-164, i.e with no E or D characters.
-                            res = re.search('(\d\.\d\d\d)\-(\d\d\d)',line[start:end])
-                            if res:
-                                return dtype(res.group(1)+'E-'+res.group(2))
-                            else:
-                                raise Exception('PARSE ERROR: unknown format of the par value (%s)'%line[start:end])
-                elif dtype==int and qnt=='local_iso_id':
-                    if line[start:end]=='0': return 10
-                    try:
-                        return dtype(line[start:end])
-                    except ValueError:
-                        # convert letters to numbers: A->11, B->12, etc... ; .par file must be in ASCII or Unicode.
-                        return 11+ord(line[start:end])-ord('A')
-                else:
-                    return dtype(line[start:end])
-            #cfunc.__doc__ = 'converter {} {}'.format(qnt, fmt) # doesn't work in earlier versions of Python
-            converters.append(cfunc)
-            #start = end
-        #data_matrix = [[cvt(line) for cvt in converters] for line in InfileData]
-        flag_EOF = False
-        line_count = 0
-        data_matrix = []
-        while True:
-            if nlines is not None and line_count>=nlines: break   
-            line = InfileData.readline()
-            if line=='': # end of file is represented by an empty string
-                flag_EOF = True
-                break 
-            data_matrix.append([cvt(line) for cvt in converters])
-            line_count += 1
-        data_columns = zip(*data_matrix)
-        for qnt, col in zip(quantities, data_columns):
-            #LOCAL_TABLE_CACHE[TableName]['data'][qnt].extend(col) # old code
-            if type(col[0]) in {int,float}:
-                LOCAL_TABLE_CACHE[TableName]['data'][qnt] = np.array(col) # new code
-            else:
-                LOCAL_TABLE_CACHE[TableName]['data'][qnt].extend(col) # old code
-            #LOCAL_TABLE_CACHE[TableName]['data'][qnt] = list(col)
-            #LOCAL_TABLE_CACHE[TableName]['data'][qnt] = col
-        header['number_of_rows'] = line_count = (
-            len(LOCAL_TABLE_CACHE[TableName]['data'][quantities[0]]))
+    glob_order,glob_format,glob_default = getTableSchema(Header)
+    data,line_count,flag_EOF = parseTableBlock(InfileData,Header,nlines)
+    LOCAL_TABLE_CACHE[TableName]['data'] = data
+    LOCAL_TABLE_CACHE[TableName]['header']['number_of_rows'] = line_count
     
     # Delete all character-separated values, treat them as column-fixed.
     try:
@@ -1551,7 +2189,12 @@ def storage2cache(TableName,cast=True,ext=None,nlines=None):
     if flag_EOF:
         InfileData.close()
         LOCAL_TABLE_CACHE[TableName]['filehandler'] = None
-    InfileHeader.close()
+    # the whole table has been parsed: save it for the next start
+    if nlines is None and flag_EOF and (VARIABLES['SIDECAR_CACHE'] or VARIABLES['MEMMAP_COLUMNS']):
+        if saveSidecar(TableName,fullpath_data,fullpath_header) and VARIABLES['MEMMAP_COLUMNS']:
+            # release the parsed columns and map the saved ones
+            loadSidecar(TableName,fullpath_data,fullpath_header,mmap_mode='r')
+    if VARIABLES['COMPACT_COLUMNS']: compactTable(TableName)
     print('                     Lines parsed: %d' % line_count)
     return flag_EOF    
     
@@ -1644,7 +2287,9 @@ def scanForNewParfiles(StorageName):
     for file_name in file_names:
         # check if extension is 'par' and the header is absent
         try:
-            fname,fext = re.search('(.+)\.(\w+)',file_name).groups()
+            fname,fext = re.search(r'(.+)\.(\w+)',file_name).groups()
+            if fext in COMPRESSED_OPENERS: # compressed .par file
+                fname,fext = re.search(r'(.+)\.(\w+)',fname).groups()
         except:
             continue
         if fext == 'par' and fname not in headers:
@@ -1659,6 +2304,67 @@ def createHeader(TableName):
     fp.write(json.dumps(HITRAN_DEFAULT_HEADER,indent=2))
     fp.close()
 
+def registerTable(TableName,ext=None):
+    # put only the header of the table to cache;
+    #  data is read by loadTableOnDemand when it is needed
+    #  (a missing data file is reported then)
+    Header = readTableHeader(getFullHeaderName(TableName))
+    LOCAL_TABLE_CACHE[TableName] = {'header':Header,'filehandler':None,'lazy':True,'ext':ext}
+
+def isTableLoaded(TableName):
+    return not LOCAL_TABLE_CACHE[TableName].get('lazy',False)
+
+def loadTableOnDemand(TableName):
+    # load data of the table registered by registerTable, do nothing otherwise
+    if TableName in LOCAL_TABLE_CACHE and not isTableLoaded(TableName):
+        storage2cache(TableName,ext=LOCAL_TABLE_CACHE[TableName]['ext'])
+
+def buildSidecar(TableName,database,memmap=False):
+    # parse the table in a pool process and save it to the sidecar;
+    #  only the timing goes back to the parent process
+    VARIABLES['BACKEND_DATABASE_NAME'] = database
+    VARIABLES['SIDECAR_CACHE'] = True
+    VARIABLES['MEMMAP_COLUMNS'] = memmap # memory-mapped tables are built by blocks
+    VARIABLES['COMPACT_COLUMNS'] = False
+    t = clock()
+    storage2cache(TableName)
+    number_of_rows = LOCAL_TABLE_CACHE[TableName]['header']['number_of_rows']
+    del LOCAL_TABLE_CACHE[TableName]
+    return number_of_rows,clock()-t
+
+def prepareSidecars(table_names,processes):
+    # parse the tables without valid sidecars in a process pool,
+    #  the biggest tables go first
+    queue = []
+    for TableName in table_names:
+        try:
+            fullpath_data,fullpath_header = getFullTableAndHeaderName(TableName)
+            if readSidecarManifest(fullpath_data,fullpath_header) is None:
+                queue.append((os.path.getsize(fullpath_data),TableName))
+        except Exception as e:
+            # e.g. no data file: the table fails when it is loaded, not here
+            print('  %s: failed (%s)' % (TableName,e))
+    if len(queue)<2: return # nothing to gain from the pool
+    queue = [TableName for size,TableName in sorted(queue,reverse=True)]
+    print('Parsing %d tables in %d processes' % (len(queue),min(processes,len(queue))))
+    from concurrent.futures import ProcessPoolExecutor,as_completed
+    t = clock()
+    with ProcessPoolExecutor(max_workers=min(processes,len(queue))) as pool:
+        futures = {pool.submit(buildSidecar,TableName,VARIABLES['BACKEND_DATABASE_NAME'],
+                               VARIABLES['MEMMAP_COLUMNS']):TableName
+                   for TableName in queue}
+        for count,future in enumerate(as_completed(futures)):
+            TableName = futures[future]
+            try:
+                number_of_rows,elapsed = future.result()
+            except Exception as e:
+                # the table will be parsed again by the main process
+                print('  [%d/%d] %s: failed (%s)' % (count+1,len(queue),TableName,e))
+                continue
+            print('  [%d/%d] %s: %d lines parsed in %.2f s' % \
+                  (count+1,len(queue),TableName,number_of_rows,elapsed))
+    print('Tables parsed in %.2f s' % (clock()-t))
+
 def loadCache():
     print('Using '+VARIABLES['BACKEND_DATABASE_NAME']+'\n')
     LOCAL_TABLE_CACHE = {}
@@ -1669,9 +2375,15 @@ def loadCache():
         # get name without 'par' extension
         createHeader(tab_name)
         table_names.append(tab_name)
+    if VARIABLES['LOADING_PROCESSES']>1 and \
+       (VARIABLES['SIDECAR_CACHE'] or VARIABLES['MEMMAP_COLUMNS']):
+        prepareSidecars(table_names,VARIABLES['LOADING_PROCESSES'])
     for TableName in table_names:
         print(TableName)
-        storage2cache(TableName)
+        if VARIABLES['LAZY_LOADING']:
+            registerTable(TableName)
+        else:
+            storage2cache(TableName)
 
 def saveCache():
     try:
@@ -1680,6 +2392,7 @@ def saveCache():
     except:
         pass
     for TableName in LOCAL_TABLE_CACHE:
+        if not isTableLoaded(TableName): continue # nothing to save
         print(TableName)
         cache2storage(TableName)
 
@@ -1826,15 +2539,30 @@ def operationSET(arg):
         raise Exception('Type mismatch: SET')
     return list(arg)
 
+COMPILED_REGEXES = {}
+COMPILED_REGEXES_LIMIT = 1000
+
+def compileRegex(pattern):
+    # compiled regex of the pattern, compiled once
+    try:
+        return COMPILED_REGEXES[pattern]
+    except KeyError:
+        pass
+    regex = re.compile(pattern)
+    if len(COMPILED_REGEXES)>=COMPILED_REGEXES_LIMIT:
+        COMPILED_REGEXES.clear()
+    COMPILED_REGEXES[pattern] = regex
+    return regex
+
 def operationMATCH(arg1,arg2):
     # Match regex (arg1) and string (arg2)
     #return bool(re.match(arg1,arg2)) # works wrong
-    return bool(re.search(arg1,arg2))
+    return bool(compileRegex(arg1).search(arg2))
 
 def operationSEARCH(arg1,arg2):
     # Search regex (arg1) in string (arg2)
     # Output list of entries
-    group = re.search(arg1,arg2).groups()
+    group = compileRegex(arg1).search(arg2).groups()
     result = []
     for item in group:
         result.append(('STR',item))
@@ -1845,7 +2573,7 @@ def operationFINDALL(arg1,arg2):
     # Output a list of groups of entries
     # XXX: If a group has more than 1 entry,
     #    there could be potential problems
-    list_of_groups = re.findall(arg1,arg2)
+    list_of_groups = compileRegex(arg1).findall(arg2)
     result = []
     for item in list_of_groups:
         result.append(('STR',item))
@@ -1859,86 +2587,85 @@ def operationLIST(args):
 
 # GROUPING ---------------------------------------------- 
 
-GROUP_INDEX = {}
-# GROUP_INDEX has the following structure:
-#  GROUP_INDEX[KEY] = VALUE
-#    KEY = table line values
-#    VALUE = {'FUNCTIONS':DICT,'FLAG':LOGICAL,'ROWID':INTEGER}
-#      FUNCTIONS = {'FUNC_NAME':DICT}
-#            FUNC_NAME = {'FLAG':LOGICAL,'NAME':STRING}
-
-# name and default value
-GROUP_FUNCTION_NAMES = { 'COUNT' :  0,
-                         'SUM'   :  0,
-                         'MUL'   :  1,
-                         'AVG'   :  0,
-                         'MIN'   : +1e100,
-                         'MAX'   : -1e100,
-                         'SSQ'   : 0,
-                       }
-
-def clearGroupIndex():
-    #GROUP_INDEX = {}
-    for key in GROUP_INDEX.keys():
-        del GROUP_INDEX[key]
-
-def getValueFromGroupIndex(GroupIndexKey,FunctionName):
-    # If no such index_key, create it and return a value
-    if FunctionName not in GROUP_FUNCTION_NAMES:
-       raise Exception('No such function \"%s\"' % FunctionName)
-    # In the case if NewRowObjectDefault is requested
-    if not GroupIndexKey:
-       return GROUP_FUNCTION_NAMES[FunctionName]
-    if FunctionName not in GROUP_INDEX[GroupIndexKey]['FUNCTIONS']:
-       GROUP_INDEX[GroupIndexKey]['FUNCTIONS'][FunctionName] = {}
-       GROUP_INDEX[GroupIndexKey]['FUNCTIONS'][FunctionName]['FLAG'] = True
-       GROUP_INDEX[GroupIndexKey]['FUNCTIONS'][FunctionName]['VALUE'] = \
-         GROUP_FUNCTION_NAMES[FunctionName]
-    return GROUP_INDEX[GroupIndexKey]['FUNCTIONS'][FunctionName]['VALUE']
-
-def setValueToGroupIndex(GroupIndexKey,FunctionName,Value):
-    GROUP_INDEX[GroupIndexKey]['FUNCTIONS'][FunctionName]['VALUE'] = Value
-
-GROUP_DESC = {}
-def initializeGroup(GroupIndexKey):
-    if GroupIndexKey not in GROUP_INDEX:
-        print('GROUP_DESC[COUNT]='+str(GROUP_DESC['COUNT']))
-        GROUP_INDEX[GroupIndexKey] = {}
-        GROUP_INDEX[GroupIndexKey]['FUNCTIONS'] = {}
-        GROUP_INDEX[GroupIndexKey]['ROWID'] = len(GROUP_INDEX) - 1
-    for FunctionName in GROUP_FUNCTION_NAMES:
-        # initialize function flags (UpdateFlag)
-        if FunctionName in GROUP_INDEX[GroupIndexKey]['FUNCTIONS']:
-           GROUP_INDEX[GroupIndexKey]['FUNCTIONS'][FunctionName]['FLAG'] = True
-    print('initializeGroup: GROUP_INDEX='+str(GROUP_INDEX))
-
-def groupCOUNT(GroupIndexKey):
-    FunctionName = 'COUNT'
-    Value = getValueFromGroupIndex(GroupIndexKey,FunctionName)
-    if GroupIndexKey:
-       if GROUP_INDEX[GroupIndexKey]['FUNCTIONS'][FunctionName]['FLAG']:
-          GROUP_INDEX[GroupIndexKey]['FUNCTIONS'][FunctionName]['FLAG'] = False
-          Value = Value + 1
-          setValueToGroupIndex(GroupIndexKey,FunctionName,Value)
-    return Value
-
-def groupSUM():
-    pass
-
-def groupMUL():
-    pass
-
-def groupAVG():
-    pass
-
-def groupMIN():
-    pass
-
-def groupMAX():
-    pass
-
-def groupSSQ():
-    pass
+# Group functions are computed for all groups at once.
+# Rows are factorized into groups by getGroups, the arguments of the
+#  group functions are reduced over the runs of rows of each group
+#  in the (stably) sorted order, see numpy.ufunc.reduceat.
+# Groups = {'inverse':ARRAY,'order':ARRAY,'starts':ARRAY,'first':ARRAY,
+#           'number_of_groups':INTEGER}
+#   inverse = index of the group for every row
+#   order = row indices sorted by group, starts = first positions of groups in order
+#   first = first row of every group
+
+def getGroups(KeyColumns,number_of_rows):
+    # factorize rows by the values of the key columns;
+    #  groups are numbered in the order of their first rows
+    inverse = np.zeros(number_of_rows,dtype=int)
+    if number_of_rows==0:
+       first = np.zeros(0,dtype=int)
+    else:
+       for column in KeyColumns:
+           if not isinstance(column,ndarray): continue # constant key
+           codes = np.unique(getSortKey(column),return_inverse=True)[1].reshape(-1)
+           inverse = np.unique(inverse*(int(codes.max())+1)+codes,return_inverse=True)[1].reshape(-1)
+       first = np.unique(inverse,return_index=True)[1]
+       # renumber groups by their first rows
+       group_order = np.argsort(first,kind='stable')
+       rank = np.empty(len(first),dtype=int)
+       rank[group_order] = arange(len(first))
+       inverse = rank[inverse]
+       first = first[group_order]
+    order = np.argsort(inverse,kind='stable')
+    starts = np.searchsorted(inverse[order],arange(len(first)))
+    return {'inverse':inverse,'order':order,'starts':starts,'first':first,
+            'number_of_groups':len(first)}
+
+def getGroupValues(values,Groups):
+    # argument of a group function ordered by groups
+    if not isinstance(values,ndarray):
+       values = np.full(len(Groups['inverse']),values)
+    if values.dtype.kind in 'SU':
+       values = values.astype(object)
+    return values[Groups['order']]
+
+def groupCOUNT(values,Groups):
+    return np.bincount(Groups['inverse'],minlength=Groups['number_of_groups'])
+
+def groupSUM(values,Groups):
+    if Groups['number_of_groups']==0: return np.zeros(0)
+    return np.add.reduceat(getGroupValues(values,Groups),Groups['starts'])
+
+def groupMUL(values,Groups):
+    if Groups['number_of_groups']==0: return np.zeros(0)
+    return np.multiply.reduceat(getGroupValues(values,Groups),Groups['starts'])
+
+def groupAVG(values,Groups):
+    if Groups['number_of_groups']==0: return np.zeros(0)
+    values = getGroupValues(values,Groups).astype(float)
+    return np.add.reduceat(values,Groups['starts'])/groupCOUNT(None,Groups)
+
+def groupMIN(values,Groups):
+    if Groups['number_of_groups']==0: return np.zeros(0)
+    return np.minimum.reduceat(getGroupValues(values,Groups),Groups['starts'])
+
+def groupMAX(values,Groups):
+    if Groups['number_of_groups']==0: return np.zeros(0)
+    return np.maximum.reduceat(getGroupValues(values,Groups),Groups['starts'])
+
+def groupSSQ(values,Groups):
+    if Groups['number_of_groups']==0: return np.zeros(0)
+    values = getGroupValues(values,Groups)
+    return np.add.reduceat(values*values,Groups['starts'])
+
+GROUP_FUNCTIONS = {
+'COUNT' : groupCOUNT,
+'SUM'   : groupSUM,
+'MUL'   : groupMUL,
+'AVG'   : groupAVG,
+'MIN'   : groupMIN,
+'MAX'   : groupMAX,
+'SSQ'   : groupSSQ,
+}
 
 OPERATORS = {\
 # List
@@ -2007,8 +2734,6 @@ OPERATORS = {\
 'SEARCH' : lambda args : operationSEARCH(args[0],args[1]),
 # Regexp findal
 'FINDALL' : lambda args : operationFINDALL(args[0],args[1]),
-# Group count
-'COUNT' : lambda args : groupCOUNT(args[0]),
 }
     
 # new evaluateExpression function,
@@ -2134,6 +2859,822 @@ def checkRowObject(RowObject,Conditions,VarDictionary):
        Flag=True
     return Flag
 
+# COLUMN-WISE EVALUATION -------------------------------
+
+# Expressions of the same language as in evaluateExpression, evaluated
+#  for all rows at once. A value is either a constant (number, string,
+#  list) or a column: numpy array with one element per row. String
+#  columns are kept as arrays of objects, so the operations on them
+#  have the same semantics as in the row-wise evaluation.
+# Expressions which can not be vectorized raise ColumnwiseError,
+#  the callers evaluate them row-wise then.
+
+class ColumnwiseError(Exception):
+    pass
+
+def checkElementwiseArgs(args):
+    # numpy would broadcast a list argument over the rows instead of
+    #  taking it as one value, as the row-wise evaluation does
+    for arg in args:
+        if type(arg) in set([list,tuple,set]):
+            raise ColumnwiseError('list argument of an element-wise operation')
+    return args
+
+def getColumnTruth(value):
+    # truth value of every element of a column (or of a constant)
+    if isinstance(value,ndarray):
+        if value.dtype==object:
+            return array([bool(item) for item in value],dtype=bool)
+        return value.astype(bool)
+    return bool(value)
+
+def getObjectConstant(value):
+    # wrap a constant to pass it as an element to numpy.frompyfunc
+    constant = np.empty((),dtype=object)
+    constant[()] = value
+    return constant
+
+def mapColumns(function,args):
+    # apply a row-wise operation element by element
+    args = [arg if isinstance(arg,ndarray) else getObjectConstant(arg) for arg in args]
+    return np.frompyfunc(lambda *items: function(list(items)),len(args),1)(*args)
+
+def columnAND(args):
+    result = True
+    for arg in args:
+        result = result & getColumnTruth(arg)
+    return result
+
+def columnOR(args):
+    result = False
+    for arg in args:
+        result = result | getColumnTruth(arg)
+    return result
+
+def columnNOT(arg):
+    truth = getColumnTruth(arg)
+    return ~truth if isinstance(truth,ndarray) else not truth
+
+def columnRANGE(x,x_min,x_max):
+    checkElementwiseArgs([x,x_min,x_max])
+    return getColumnTruth(x_min <= x) & getColumnTruth(x <= x_max)
+
+def columnSUBSET(arg1,arg2):
+    if isinstance(arg1,ndarray) and arg1.dtype!=object and \
+       type(arg2) in set([list,tuple,set]) and \
+       all(type(item) in set([int,float]) for item in arg2):
+        return np.isin(arg1,list(arg2))
+    return getColumnTruth(mapColumns(OPERATORS['IN'],[arg1,arg2]))
+
+def factorizeColumn(column):
+    # distinct values of the column and the position of every element among them
+    if column.dtype.kind in 'US':
+        values,codes = np.unique(column,return_inverse=True)
+        return values.tolist(),codes.reshape(-1)
+    pool = {}
+    codes = np.fromiter((pool.setdefault(value,len(pool)) for value in column.tolist()),
+                        dtype=int,count=len(column))
+    return list(pool),codes
+
+def mapDistinctValues(function,args):
+    # apply a row-wise operation of a constant pattern and a string column
+    #  once per distinct string, the results are broadcast back to the rows;
+    #  None if the arguments are not of this kind
+    pattern,column = args
+    if isinstance(pattern,ndarray) or not isinstance(column,ndarray) or \
+       column.dtype.kind not in 'OUS':
+        return None
+    try:
+        values,codes = factorizeColumn(column)
+    except TypeError: # unhashable values
+        return None
+    result = np.empty(len(values),dtype=object)
+    for i,value in enumerate(values):
+        result[i] = function([pattern,value])
+    return result[codes]
+
+def columnMATCH(args):
+    result = mapDistinctValues(OPERATORS['MATCH'],args)
+    if result is None:
+        return getColumnTruth(mapColumns(OPERATORS['MATCH'],args))
+    return result.astype(bool)
+
+def columnSEARCH(args,Operation='SEARCH'):
+    result = mapDistinctValues(OPERATORS[Operation],args)
+    if result is None:
+        return mapColumns(OPERATORS[Operation],args)
+    # rows with the same string get their own lists
+    return np.frompyfunc(list,1,1)(result)
+
+def columnFINDALL(args):
+    return columnSEARCH(args,'FINDALL')
+
+def columnCHAIN(args,fails):
+    # chained comparison: fails is the condition which breaks the chain
+    checkElementwiseArgs(args)
+    result = True
+    for i in range(1,len(args)):
+        result = result & columnNOT(fails(args[i-1],args[i]))
+    return result
+
+def columnSUM(args):
+    checkElementwiseArgs(args)
+    if not isinstance(args[0],ndarray) and type(args[0]) not in set([int,float,str]):
+       raise Exception('SUM error: unknown arg type')
+    result = args[0]
+    for arg in args[1:]:
+        result = result + arg
+    return result
+
+def columnMUL(args):
+    checkElementwiseArgs(args)
+    if not isinstance(args[0],ndarray) and type(args[0]) not in set([int,float]):
+       raise Exception('MUL error: unknown arg type')
+    result = args[0]
+    for arg in args[1:]:
+        result = result * arg
+    return result
+
+def columnNOTEQUAL(args):
+    arg1,arg2 = checkElementwiseArgs(args)
+    return arg1 != arg2
+
+def columnDIFF(args):
+    arg1,arg2 = checkElementwiseArgs(args)
+    return arg1 - arg2
+
+def columnDIV(args):
+    arg1,arg2 = checkElementwiseArgs(args)
+    return arg1 / arg2
+
+COLUMN_OPERATORS = {
+'LIST' : lambda args : mapColumns(OPERATORS['LIST'],args),
+'&' : columnAND, '&&' : columnAND, 'AND' : columnAND,
+'|' : columnOR, '||' : columnOR, 'OR' : columnOR,
+'!' : lambda args : columnNOT(args[0]),
+'NOT' : lambda args : columnNOT(args[0]),
+'RANGE' : lambda args : columnRANGE(args[0],args[1],args[2]),
+'BETWEEN' : lambda args : columnRANGE(args[0],args[1],args[2]),
+'IN' : lambda args : columnSUBSET(args[0],args[1]),
+'SUBSET': lambda args : columnSUBSET(args[0],args[1]),
+'<' : lambda args : columnCHAIN(args,lambda a,b: a>=b),
+'LESS' : lambda args : columnCHAIN(args,lambda a,b: a>=b),
+'LT'  : lambda args : columnCHAIN(args,lambda a,b: a>=b),
+'>' : lambda args : columnCHAIN(args,lambda a,b: a<=b),
+'MORE' : lambda args : columnCHAIN(args,lambda a,b: a<=b),
+'MT'   : lambda args : columnCHAIN(args,lambda a,b: a<=b),
+'<=' : lambda args : columnCHAIN(args,lambda a,b: a>b),
+'LESSOREQUAL' : lambda args : columnCHAIN(args,lambda a,b: a>b),
+'LTE' : lambda args : columnCHAIN(args,lambda a,b: a>b),
+'>=' : lambda args : columnCHAIN(args,lambda a,b: a<b),
+'MOREOREQUAL' : lambda args : columnCHAIN(args,lambda a,b: a<b),
+'MTE' : lambda args : columnCHAIN(args,lambda a,b: a<b),
+'=' : lambda args : columnCHAIN(args,lambda a,b: b!=a),
+'==' : lambda args : columnCHAIN(args,lambda a,b: b!=a),
+'EQ' : lambda args : columnCHAIN(args,lambda a,b: b!=a),
+'EQUAL' : lambda args : columnCHAIN(args,lambda a,b: b!=a),
+'EQUALS' : lambda args : columnCHAIN(args,lambda a,b: b!=a),
+'!=' : columnNOTEQUAL, '<>' : columnNOTEQUAL, '~=' : columnNOTEQUAL,
+'NE' : columnNOTEQUAL, 'NOTEQUAL' : columnNOTEQUAL,
+'+' : columnSUM, 'SUM' : columnSUM,
+'-' : columnDIFF, 'DIFF' : columnDIFF,
+'*' : columnMUL, 'MUL' : columnMUL,
+'/' : columnDIV, 'DIV' : columnDIV,
+'MATCH' : columnMATCH, 'LIKE' : columnMATCH,
+'SEARCH' : columnSEARCH,
+'FINDALL' : columnFINDALL,
+}
+
+def evaluateColumnExpression(root,Columns):
+    # evaluate expression for all rows at once (see evaluateExpression);
+    #  Columns is a function returning a column by parameter name
+    return compileExpression(root,Columnwise=True)(Columns)
+
+def getColumnResolver(TableName,RowIDs=None):
+    # function returning columns of the table (only rows RowIDs if given)
+    #  as numpy arrays, LineNumber included
+    data = LOCAL_TABLE_CACHE[TableName]['data']
+    number_of_rows = LOCAL_TABLE_CACHE[TableName]['header']['number_of_rows']
+    cache = {}
+    def Columns(par_name):
+        if par_name not in cache:
+            if par_name=='LineNumber' and par_name not in data:
+                column = arange(number_of_rows) if RowIDs is None else arange(number_of_rows)[RowIDs]
+            else:
+                column = widenColumn(gatherColumn(data[par_name],RowIDs))
+                if not isinstance(column,ndarray):
+                    values = column
+                    column = np.empty(len(values),dtype=object)
+                    column[:] = values
+            cache[par_name] = column
+        return cache[par_name]
+    return Columns
+
+def gatherColumn(column,RowIDs=None):
+    # rows RowIDs (array or slice) of the column, the column type (list or array) is kept
+    if RowIDs is None:
+        return column
+    if isinstance(column,ndarray) or isinstance(RowIDs,slice):
+        return column[RowIDs]
+    return [column[i] for i in RowIDs.tolist()]
+
+def getColumnValues(value,number_of_rows):
+    # column of the resulting table from the value of the expression
+    if not isinstance(value,ndarray):
+        return [value]*number_of_rows
+    if value.dtype==object:
+        return value.tolist()
+    return value
+
+# COMPILED EXPRESSIONS -------------------------------
+
+# An expression is compiled once to a plan: a function Plan(Context,GroupIndexKey)
+#  made of nested closures, so the operators are looked up and the constants
+#  are checked only once, not for every row. Context is VarDictionary for the
+#  row-wise plans and a column resolver for the column-wise ones.
+# Plans are cached by the expression, so repeated queries reuse them.
+
+COMPILED_EXPRESSIONS = {}
+COMPILED_EXPRESSIONS_LIMIT = 1000
+
+# number of arguments of the operators which take a fixed number of them
+OPERATOR_ARITY = {
+'!':1, 'NOT':1, 'RANGE':3, 'BETWEEN':3, 'IN':2, 'SUBSET':2,
+'!=':2, '<>':2, '~=':2, 'NE':2, 'NOTEQUAL':2,
+'-':2, 'DIFF':2, '/':2, 'DIV':2,
+'MATCH':2, 'LIKE':2, 'SEARCH':2, 'FINDALL':2,
+}
+
+def getExpressionKey(root):
+    # hashable key of the expression, None if it contains unhashable constants
+    if type(root) in set([list,tuple]):
+        key = [type(root)]
+        for element in root:
+            element_key = getExpressionKey(element)
+            if element_key is None:
+                return None
+            key.append(element_key)
+        return tuple(key)
+    try:
+        hash(root)
+    except TypeError:
+        return None
+    return (type(root),root)
+
+def buildPlan(root,Operators,Columnwise):
+    # compile the expression tree to nested closures
+    if type(root) in set([list,tuple]):
+        if not root or type(root[0])!=str:
+            raise Exception('Invalid expression: %s' % repr(root))
+        head = root[0].upper()
+        # string constants are treated specially
+        if head in set(['STR','STRING','SET']): # one arg
+            if len(root)!=2:
+                raise Exception('%s: expected 1 argument, got %d' % (head,len(root)-1))
+            if head=='SET':
+                value = operationSET(root[1])
+                return lambda Context,GroupIndexKey=None: list(value)
+            value = operationSTR(root[1])
+            return lambda Context,GroupIndexKey=None: value
+        try:
+            function = Operators[head]
+        except KeyError:
+            raise Exception('Unknown operator: %s' % head)
+        arity = OPERATOR_ARITY.get(head)
+        if arity is not None and len(root)-1!=arity:
+            raise Exception('%s: expected %d argument(s), got %d' % (head,arity,len(root)-1))
+        args = [buildPlan(element,Operators,Columnwise) for element in root[1:]]
+        if len(args)==2:
+            arg1,arg2 = args
+            return lambda Context,GroupIndexKey=None: \
+                function([arg1(Context,GroupIndexKey),arg2(Context,GroupIndexKey)])
+        return lambda Context,GroupIndexKey=None: \
+            function([arg(Context,GroupIndexKey) for arg in args])
+    elif type(root)==str:
+        # root is a par_name
+        if Columnwise:
+            return lambda Context,GroupIndexKey=None: Context(root)
+        return lambda Context,GroupIndexKey=None: Context[root]
+    else:
+        # root is a non-string constant
+        return lambda Context,GroupIndexKey=None: root
+
+def compileExpression(root,Columnwise=False):
+    # get the plan of the expression, compiling it on the first use;
+    #  malformed expressions raise here, before any row is evaluated
+    key = getExpressionKey(root)
+    if key is not None:
+        key = (key,Columnwise)
+        if key in COMPILED_EXPRESSIONS:
+            return COMPILED_EXPRESSIONS[key]
+    Operators = COLUMN_OPERATORS if Columnwise else OPERATORS
+    plan = buildPlan(root,Operators,Columnwise)
+    if key is not None:
+        if len(COMPILED_EXPRESSIONS)>=COMPILED_EXPRESSIONS_LIMIT:
+            COMPILED_EXPRESSIONS.clear()
+        COMPILED_EXPRESSIONS[key] = plan
+    return plan
+
+# Type checking: values are classified as 'number', 'string' or 'list'
+#  (None if unknown), the mismatches which are errors for any row
+#  are reported before the query is run.
+
+def getValueType(value):
+    if isinstance(value,(bool,int,float,np.number,np.bool_)):
+        return 'number'
+    elif isinstance(value,str):
+        return 'string'
+    elif isinstance(value,(list,tuple,set)):
+        return 'list'
+    return None
+
+def getColumnType(column,default=None):
+    # type of the column values, from the column dtype or its first value
+    if isinstance(column,ndarray) and column.dtype!=object:
+        if column.dtype.kind in 'biuf':
+            return 'number'
+        elif column.dtype.kind in 'SU':
+            return 'string'
+        return None
+    if len(column)>0:
+        return getValueType(column[0])
+    return getValueType(default)
+
+def getExpressionVariables(root):
+    # names of the parameters used in the expression
+    if type(root) in set([list,tuple]):
+        if root and type(root[0])==str and root[0].upper() in set(['STR','STRING','SET']):
+            return set()
+        names = set()
+        for element in root[1:]:
+            names |= getExpressionVariables(element)
+        return names
+    elif type(root)==str:
+        return set([root])
+    return set()
+
+def getParameterTypes(TableName,ParameterNames=None):
+    # types of the parameters (all by default) visible in expressions on the table
+    data = LOCAL_TABLE_CACHE[TableName]['data']
+    default = LOCAL_TABLE_CACHE[TableName]['header'].get('default',{})
+    ParameterTypes = {'LineNumber':'number'}
+    for par_name in data if ParameterNames is None else ParameterNames:
+        if par_name in data:
+            ParameterTypes[par_name] = getColumnType(data[par_name],default.get(par_name))
+    return ParameterTypes
+
+def validateExpression(root,ParameterTypes):
+    # check parameter names and argument types of a compiled expression;
+    #  return the type of its value
+    if type(root) in set([list,tuple]):
+        head = root[0].upper()
+        if head in set(['STR','STRING']):
+            return 'string'
+        elif head in set(['SET']):
+            return 'list'
+        types = [validateExpression(element,ParameterTypes) for element in root[1:]]
+        known = set(types)-set([None])
+        def mismatch():
+            return Exception('Type mismatch: %s(%s)' % \
+                (head,','.join([str(ty) for ty in types])))
+        if head in set(['<','LESS','LT','>','MORE','MT','<=','LESSOREQUAL','LTE',
+                        '>=','MOREOREQUAL','MTE','RANGE','BETWEEN']):
+            if len(known)>1: raise mismatch()
+            return 'number'
+        elif head in set(['-','DIFF','/','DIV']):
+            if known-set(['number']): raise mismatch()
+            return 'number'
+        elif head in set(['+','SUM']):
+            if len(known)>1: raise mismatch()
+            return known.pop() if known else None
+        elif head in set(['*','MUL']):
+            if types[0] not in set([None,'number']): raise mismatch()
+            return 'number' if known==set(['number']) else None
+        elif head in set(['MATCH','LIKE','SEARCH','FINDALL']):
+            if known-set(['string']): raise mismatch()
+            return 'number' if head in set(['MATCH','LIKE']) else 'list'
+        elif head in set(['IN','SUBSET']):
+            if types[1]=='number': raise mismatch()
+            return 'number'
+        elif head in set(['LIST']):
+            return 'list'
+        return 'number'
+    elif type(root)==str:
+        if root not in ParameterTypes:
+            raise Exception('%s: no such parameter' % root)
+        return ParameterTypes[root]
+    else:
+        return getValueType(root)
+
+def checkQuery(TableName,ParameterNames,Conditions):
+    # compile and check all expressions of a query on the table
+    Expressions = [par_expr for par_name,par_expr,par_format in getParameterExpressions(ParameterNames)
+                   if par_expr is not None] + ([Conditions] if Conditions else [])
+    Variables = set()
+    for root in Expressions:
+        Variables |= getExpressionVariables(root)
+    ParameterTypes = getParameterTypes(TableName,Variables)
+    try:
+        if Conditions:
+            compileExpression(Conditions)
+            validateExpression(Conditions,ParameterTypes)
+        for par_name,par_expr,par_format in getParameterExpressions(ParameterNames):
+            if par_expr is None:
+                if par_name not in LOCAL_TABLE_CACHE[TableName]['data']:
+                    raise Exception('%s: no such parameter' % par_name)
+            else:
+                compileExpression(par_expr)
+                validateExpression(par_expr,ParameterTypes)
+    except Exception as e:
+        raise Exception('Invalid query on table %s: %s' % (TableName,e))
+
+# INDEXES --------------------------------------------
+
+# Secondary indexes on table columns. Conditions on indexed columns
+#  are looked up in the indexes instead of scanning the whole table:
+#   sorted index: {'type':'sorted','values':ARRAY,'order':ARRAY,'valid':INTEGER}
+#     values = column values in ascending order (NaNs go last),
+#     order = row ids of the values (None if the column is sorted itself),
+#     valid = number of values which are not NaN
+#   hash index: {'type':'hash','rows':DICT}
+#     rows = column value => array of row ids
+# Every edit of a table increments its generation (see touchTable),
+#  indexes of older generations are rebuilt on their next use.
+
+LOCAL_TABLE_INDEXES = {}
+LOCAL_TABLE_GENERATION = {}
+
+# names of the views of the tables: parent table => set of view names
+#  (see createView); may hold names which are no longer views
+LOCAL_TABLE_VIEWS = {}
+
+def touchTable(TableName):
+    # mark the table as edited; must be called BEFORE the data is changed,
+    #  once per edit operation (not per row):
+    #  views of the table (and the table itself if it is a view)
+    #  get their own copy of the data first
+    if TableName in LOCAL_TABLE_CACHE:
+        materializeTable(TableName)
+    for name in LOCAL_TABLE_VIEWS.pop(TableName,()):
+        data = LOCAL_TABLE_CACHE.get(name,{}).get('data')
+        if isinstance(data,TableViewData) and data.parent==TableName:
+            materializeTable(name)
+    dropQueryResults(TableName)
+    LOCAL_TABLE_GENERATION[TableName] = LOCAL_TABLE_GENERATION.get(TableName,0) + 1
+
+def buildIndex(TableName,ParameterName,Type):
+    column = LOCAL_TABLE_CACHE[TableName]['data'][ParameterName]
+    index = {'type':Type,'column':column,'length':len(column),
+             'generation':LOCAL_TABLE_GENERATION.get(TableName,0)}
+    if Type=='sorted':
+        values = widenColumn(np.asarray(column))
+        if values.dtype.kind not in 'biuf':
+            raise Exception('%s: sorted index needs a numeric column' % ParameterName)
+        if len(values)<2 or np.all(values[1:]>=values[:-1]):
+            order = None
+        else:
+            order = np.argsort(values,kind='stable')
+            values = values[order]
+        index['values'] = values
+        index['order'] = order
+        index['valid'] = len(values)-np.count_nonzero(np.isnan(values)) \
+                         if values.dtype.kind=='f' else len(values)
+    elif Type=='hash':
+        values = widenColumn(column) if isinstance(column,ndarray) else np.array(list(column))
+        if values.dtype==object or values.ndim!=1:
+            raise Exception('%s: cannot index column' % ParameterName)
+        keys,inverse = np.unique(values,return_inverse=True)
+        order = np.argsort(inverse.reshape(-1),kind='stable')
+        splits = np.cumsum(np.bincount(inverse.reshape(-1),minlength=len(keys)))[:-1]
+        index['rows'] = dict(zip(keys.tolist(),np.split(order,splits)))
+    else:
+        raise Exception('Unknown index type: %s' % Type)
+    return index
+
+def createIndex(TableName,ParameterName,Type=None):
+    """
+    INPUT PARAMETERS: 
+        TableName:      name of the table                          (required)
+        ParameterName:  name of the column to index                (required)
+        Type:           'sorted' or 'hash'                         (optional)
+    OUTPUT PARAMETERS: 
+        none
+    ---
+    DESCRIPTION:
+        Create an index on the column, which is then used by select
+        for conditions on this column: ranges, comparisons and equality
+        for sorted indexes, equality and IN for hash indexes.
+        By default numeric columns get sorted indexes, others get hash indexes.
+        The index is kept up to date when the table is edited.
+    ---
+    EXAMPLE OF USAGE:
+        createIndex('sampletab','nu')
+        createIndex('sampletab','local_lower_quanta')
+    ---
+    """
+    loadTableOnDemand(TableName)
+    if ParameterName not in LOCAL_TABLE_CACHE[TableName]['data']:
+        raise Exception('No such column \"%s\"' % ParameterName)
+    if Type is None:
+        column = LOCAL_TABLE_CACHE[TableName]['data'][ParameterName]
+        Type = 'sorted' if getColumnType(column)=='number' and \
+               np.asarray(column).dtype.kind in 'biuf' else 'hash'
+    index = buildIndex(TableName,ParameterName,Type)
+    LOCAL_TABLE_INDEXES.setdefault(TableName,{})[ParameterName] = index
+
+def dropIndex(TableName,ParameterName=None):
+    # drop the index of the column, or all indexes of the table
+    if ParameterName is None:
+        LOCAL_TABLE_INDEXES.pop(TableName,None)
+    else:
+        LOCAL_TABLE_INDEXES.get(TableName,{}).pop(ParameterName,None)
+
+def getIndex(TableName,ParameterName):
+    # up-to-date index of the column, None if the column is not indexed
+    indexes = LOCAL_TABLE_INDEXES.get(TableName,{})
+    data = LOCAL_TABLE_CACHE[TableName]['data']
+    if ParameterName not in indexes:
+        if not VARIABLES['AUTO_INDEXES'] or ParameterName not in data:
+            return None
+        try:
+            createIndex(TableName,ParameterName)
+        except Exception:
+            return None
+        return indexes[ParameterName]
+    index = indexes[ParameterName]
+    column = data.get(ParameterName)
+    if column is None:
+        dropIndex(TableName,ParameterName)
+        return None
+    if index['column'] is not column or index['length']!=len(column) or \
+       index['generation']!=LOCAL_TABLE_GENERATION.get(TableName,0):
+        index = buildIndex(TableName,ParameterName,index['type'])
+        indexes[ParameterName] = index
+    return index
+
+def getIndexConstant(element):
+    # (True,value) if the element of the expression is a constant
+    if isinstance(element,(bool,int,float,np.number)):
+        return True,element
+    if type(element) in set([list,tuple]) and len(element)==2 and type(element[0])==str:
+        head = element[0].upper()
+        if head in set(['STR','STRING']) and type(element[1])==str:
+            return True,element[1]
+        elif head in set(['SET']) and type(element[1]) in set([list,tuple,set]):
+            return True,list(element[1])
+    return False,None
+
+# comparisons of a column with a constant, the column being the first argument,
+#  and the same comparisons with swapped arguments
+INDEX_COMPARISONS = {
+'<':'<', 'LESS':'<', 'LT':'<', '>':'>', 'MORE':'>', 'MT':'>',
+'<=':'<=', 'LESSOREQUAL':'<=', 'LTE':'<=', '>=':'>=', 'MOREOREQUAL':'>=', 'MTE':'>=',
+'=':'=', '==':'=', 'EQ':'=', 'EQUAL':'=', 'EQUALS':'=',
+}
+SWAPPED_COMPARISONS = {'<':'>','>':'<','<=':'>=','>=':'<=','=':'='}
+
+def lookupSortedIndex(index,op,constants):
+    # row ids for a condition on a sorted index, None if it can't be answered
+    for value in constants:
+        if not isinstance(value,(bool,int,float,np.number)) or value!=value:
+            return None
+    values,valid = index['values'],index['valid']
+    if op=='IN':
+        bounds = [(np.searchsorted(values,value,'left'),np.searchsorted(values,value,'right'))
+                  for value in set(constants)]
+    else:
+        value = constants[0]
+        if op=='<':
+            bounds = [(0,np.searchsorted(values,value,'left'))]
+        elif op=='<=':
+            bounds = [(0,np.searchsorted(values,value,'right'))]
+        elif op=='>':
+            bounds = [(np.searchsorted(values,value,'right'),valid)]
+        elif op=='>=':
+            bounds = [(np.searchsorted(values,value,'left'),valid)]
+        elif op=='=':
+            bounds = [(np.searchsorted(values,value,'left'),np.searchsorted(values,value,'right'))]
+        else: # RANGE
+            bounds = [(np.searchsorted(values,value,'left'),np.searchsorted(values,constants[1],'right'))]
+    if op in set(['<','<=','>','>=']):
+        # comparisons fail only when the opposite comparison holds,
+        #  so they are true for NaNs (see operationLESS)
+        bounds.append((valid,len(values)))
+    parts = []
+    for lo,hi in bounds:
+        if lo<hi:
+            parts.append(arange(lo,hi) if index['order'] is None else index['order'][lo:hi])
+    # the parts do not overlap
+    if not parts:
+        return np.zeros(0,dtype=int)
+    elif len(parts)==1 and index['order'] is None:
+        return parts[0]
+    return np.sort(np.concatenate(parts))
+
+def lookupHashIndex(index,op,constants):
+    # row ids for a condition on a hash index, None if it can't be answered
+    if op not in set(['=','IN']):
+        return None
+    try:
+        constants = set(constants)
+    except TypeError: # unhashable
+        return None
+    # row ids of every value are in ascending order, different values do not overlap
+    parts = [index['rows'][value] for value in constants if value in index['rows']]
+    if not parts:
+        return np.zeros(0,dtype=int)
+    elif len(parts)==1:
+        return parts[0].copy()
+    return np.sort(np.concatenate(parts))
+
+def lookupConjunct(TableName,Conjunct):
+    # row ids satisfying the condition if it is a comparison of
+    #  an indexed column with constants, None otherwise
+    if type(Conjunct) not in set([list,tuple]) or len(Conjunct)<3 or type(Conjunct[0])!=str:
+        return None
+    head = Conjunct[0].upper()
+    args = Conjunct[1:]
+    if head in INDEX_COMPARISONS and len(args)==2:
+        op = INDEX_COMPARISONS[head]
+        if type(args[0])!=str:
+            op = SWAPPED_COMPARISONS[op]
+            args = args[::-1]
+    elif head in set(['RANGE','BETWEEN']) and len(args)==3:
+        op = 'RANGE'
+    elif head in set(['IN','SUBSET']) and len(args)==2:
+        op = 'IN'
+    else:
+        return None
+    par_name = args[0]
+    if type(par_name)!=str:
+        return None
+    constants = []
+    for element in args[1:]:
+        flag,value = getIndexConstant(element)
+        if not flag:
+            return None
+        constants.append(value)
+    if op=='IN':
+        if type(constants[0])!=list: return None
+        constants = constants[0]
+    elif [value for value in constants if type(value)==list]:
+        return None
+    index = getIndex(TableName,par_name)
+    if index is None:
+        return None
+    if index['type']=='sorted':
+        return lookupSortedIndex(index,op,constants)
+    return lookupHashIndex(index,op,constants)
+
+def getConjuncts(Conditions):
+    # top-level conjuncts of the conditions
+    if type(Conditions) in set([list,tuple]) and Conditions and type(Conditions[0])==str and \
+       Conditions[0].upper() in set(['&','&&','AND']):
+        Conjuncts = []
+        for element in Conditions[1:]:
+            Conjuncts += getConjuncts(element)
+        return Conjuncts
+    return [Conditions]
+
+def getSelectedRowIDs(TableName,Conditions):
+    # ids of the rows satisfying Conditions: conjuncts on indexed columns
+    #  are looked up in the indexes, the rest is evaluated column-wise
+    #  on the remaining rows only
+    table_length = LOCAL_TABLE_CACHE[TableName]['header']['number_of_rows']
+    RowIDs = None
+    Rest = []
+    for Conjunct in getConjuncts(Conditions):
+        Rows = lookupConjunct(TableName,Conjunct)
+        if Rows is None:
+            Rest.append(Conjunct)
+        elif RowIDs is None:
+            RowIDs = Rows
+        else:
+            RowIDs = np.intersect1d(RowIDs,Rows,assume_unique=True)
+    if RowIDs is None:
+        Rest = [Conditions]
+    if not Rest or RowIDs is not None and len(RowIDs)==0:
+        return RowIDs
+    Conditions = Rest[0] if len(Rest)==1 else ['AND']+Rest
+    mask = getColumnTruth(compileExpression(Conditions,Columnwise=True)
+                          (getColumnResolver(TableName,RowIDs)))
+    number_of_rows = table_length if RowIDs is None else len(RowIDs)
+    if not isinstance(mask,ndarray):
+        mask = np.full(number_of_rows,mask,dtype=bool)
+    if RowIDs is None:
+        return np.flatnonzero(mask)
+    return RowIDs[mask]
+
+# VIEWS ----------------------------------------------
+
+# A select result can be a view of the source table instead of a copy:
+#  its data refers to the columns of the parent table and to the selected
+#  rows (a slice if they are contiguous, an array of row ids otherwise).
+#  Columns are gathered on the first access; for slices they are numpy
+#  views (read-only) sharing memory with the parent.
+# A view is materialized, i.e. gets its own copy of the data,
+#  when it is edited or saved, and when its parent table is edited
+#  (see touchTable).
+
+class TableViewData(dict):
+    # data of a view table; behaves like the data dictionary of a table
+
+    def __init__(self,parent,source,rows,names):
+        dict.__init__(self)
+        self.parent = parent # name of the parent table
+        self.source = source # data of the parent table
+        self.rows = rows     # slice or array of row ids
+        self.names = list(names)
+
+    def __missing__(self,par_name):
+        if par_name not in self.names:
+            raise KeyError(par_name)
+        column = gatherColumn(self.source[par_name],self.rows)
+        if isinstance(column,ndarray) and column.base is not None:
+            # a view of the parent column: protect the parent from edits
+            column = column.view()
+            column.flags.writeable = False
+        dict.__setitem__(self,par_name,column)
+        return column
+
+    def __setitem__(self,par_name,column):
+        if par_name not in self.names:
+            self.names.append(par_name)
+        dict.__setitem__(self,par_name,column)
+
+    def __delitem__(self,par_name):
+        if par_name not in self.names:
+            raise KeyError(par_name)
+        self.names.remove(par_name)
+        dict.pop(self,par_name,None)
+
+    def __contains__(self,par_name):
+        return par_name in self.names
+
+    def __iter__(self):
+        return iter(list(self.names))
+
+    def __len__(self):
+        return len(self.names)
+
+    def get(self,par_name,default=None):
+        return self[par_name] if par_name in self.names else default
+
+    def keys(self):
+        return list(self.names)
+
+    def values(self):
+        return [self[par_name] for par_name in self.names]
+
+    def items(self):
+        return [(par_name,self[par_name]) for par_name in self.names]
+
+    def copy(self):
+        return dict(self.items())
+
+    def __reduce__(self):
+        # views are sent to other processes as ordinary data
+        return (dict,(self.copy(),))
+
+def getRowSlice(RowIDs):
+    # slice for contiguous row ids, the ids themselves otherwise
+    if len(RowIDs)==0:
+        return slice(0,0)
+    if RowIDs[-1]-RowIDs[0]+1==len(RowIDs) and np.all(np.diff(RowIDs)==1):
+        return slice(int(RowIDs[0]),int(RowIDs[-1])+1)
+    return RowIDs
+
+def isView(TableName):
+    return isinstance(LOCAL_TABLE_CACHE[TableName].get('data'),TableViewData)
+
+def createView(ViewName,TableName,RowIDs,ParameterNames):
+    # make the data of the (already created) table ViewName
+    #  a view of rows RowIDs of TableName
+    data = LOCAL_TABLE_CACHE[TableName]['data']
+    parent,source = TableName,data
+    if isinstance(data,TableViewData):
+        # view of a view refers to the parent table directly
+        parent,source = data.parent,data.source
+        RowIDs = arange(data.rows.stop)[data.rows][RowIDs] \
+                 if isinstance(data.rows,slice) else data.rows[RowIDs]
+    LOCAL_TABLE_CACHE[ViewName]['data'] = TableViewData(parent,source,getRowSlice(RowIDs),ParameterNames)
+    LOCAL_TABLE_CACHE[ViewName]['header']['number_of_rows'] = len(RowIDs)
+    LOCAL_TABLE_VIEWS.setdefault(parent,set()).add(ViewName)
+
+def materializeTable(TableName):
+    # give a view table its own copy of the data, do nothing for other tables
+    data = LOCAL_TABLE_CACHE[TableName].get('data')
+    if not isinstance(data,TableViewData):
+        return
+    LOCAL_TABLE_VIEWS.get(data.parent,set()).discard(TableName)
+    NewData = {}
+    for par_name in data.names:
+        column = data[par_name]
+        if isinstance(column,ndarray) and (column.base is not None or isinstance(column,np.memmap)):
+            column = np.array(column)
+        NewData[par_name] = column
+    LOCAL_TABLE_CACHE[TableName]['data'] = NewData
+
 # ----------------------------------------------------
 # /CONDITIONS
 # ----------------------------------------------------
@@ -2211,34 +3752,56 @@ def getDefaultValue(Type):
 
 # VarDictionary = Context (this name is more suitable)
 
-# GroupIndexKey is a key to special structure/dictionary GROUP_INDEX.
-# GROUP_INDEX contains information needed to calculate streamed group functions
-#  such as COUNT, AVG, MIN, MAX etc...
+# GroupIndexKey is passed to the plans of expressions (see compileExpression).
+# Group functions such as COUNT, AVG, MIN, MAX etc... are not evaluated
+#  row by row, they are calculated for all groups at once by group().
 
-def newRowObject(ParameterNames,RowObject,VarDictionary,ContextFormat,GroupIndexKey=None):
-    # Return a subset of RowObject according to 
-    # ParameterNames include either par names
-    #  or expressions containing par names literals
-    # ContextFormat contains format for ParNames
+def getParameterExpressions(ParameterNames):
+    # split ParameterNames into (par_name,par_expr,par_format) triples;
+    #  par_expr is None for plain par names, par_format is None
+    #  unless it is given in a bind
     anoncount = 0
-    RowObjectNew = []
+    ParameterExpressions = []
     for expr in ParameterNames:
+        par_format = None
         if type(expr) in set([list,tuple]): # bind
            head = expr[0]
            if head in set(['let','bind','LET','BIND']):
               par_name = expr[1]
               par_expr = expr[2]
+              if len(expr)>3: par_format = expr[3]
            else:
               par_name = "#%d" % anoncount
               anoncount += 1
               par_expr = expr
-           par_value = evaluateExpression(par_expr,VarDictionary,GroupIndexKey)
-           try:
-              par_format = expr[3]
-           except:
-              par_format = getDefaultFormat(type(par_value))
         else: # parname
            par_name = expr
+           par_expr = None
+        ParameterExpressions.append((par_name,par_expr,par_format))
+    return ParameterExpressions
+
+def compileParameterNames(ParameterNames,Columnwise=False):
+    # same as getParameterExpressions, with the expressions compiled to plans
+    return [(par_name,None if par_expr is None else compileExpression(par_expr,Columnwise),par_format)
+            for par_name,par_expr,par_format in getParameterExpressions(ParameterNames)]
+
+def newRowObject(ParameterNames,RowObject,VarDictionary,ContextFormat,GroupIndexKey=None,
+                 CompiledNames=None):
+    # Return a subset of RowObject according to
+    # ParameterNames include either par names
+    #  or expressions containing par names literals
+    # ContextFormat contains format for ParNames
+    # CompiledNames is the result of compileParameterNames(ParameterNames)
+    #  to be reused when called for every row
+    if CompiledNames is None:
+       CompiledNames = compileParameterNames(ParameterNames)
+    RowObjectNew = []
+    for par_name,plan,par_format in CompiledNames:
+        if plan is not None: # bind
+           par_value = plan(VarDictionary,GroupIndexKey)
+           if par_format is None:
+              par_format = getDefaultFormat(type(par_value))
+        else: # parname
            par_value = VarDictionary[par_name]
            par_format = ContextFormat[par_name]
         RowObjectNew.append((par_name,par_value,par_format))
@@ -2273,6 +3836,7 @@ def describeTable(TableName):
         describeTable('sampletab')
     ---
     """
+    loadTableOnDemand(TableName)
     print('-----------------------------------------')
     print(TableName+' summary:')
     try:
@@ -2291,28 +3855,84 @@ def describeTable(TableName):
     print('-----------------------------------------')
 
 # Write a table to File or STDOUT
-def outputTable(TableName,Conditions=None,File=None,Header=True):
-    # Display or record table with condition checking
-    if File:
-       Header = False
-       OutputFile = open(File,'w')
-    if Header:
-       headstr = putTableHeaderToString(TableName)
-       if File:
-          OutputFile.write(headstr)
-       else:
-          print(headstr)
-    for RowID in range(0,LOCAL_TABLE_CACHE[TableName]['header']['number_of_rows']):
-        RowObject = getRowObject(RowID,TableName)
-        VarDictionary = getVarDictionary(RowObject)
+# number of rows formatted and written at once by outputTable
+OUTPUT_BLOCK = 100000
+# size of the write buffer of the files written by outputTable
+OUTPUT_BUFFER_SIZE = 4*1024**2
+
+def getOutputRowIDs(TableName,Conditions):
+    # ids of the rows to output: column-wise selection,
+    #  falling back to the row-wise check of the conditions
+    number_of_rows = LOCAL_TABLE_CACHE[TableName]['header']['number_of_rows']
+    if not Conditions:
+        return arange(number_of_rows)
+    try:
+        return getSelectedRowIDs(TableName,Conditions)
+    except ColumnwiseError:
+        pass
+    ConditionsPlan = compileExpression(Conditions)
+    RowIDs = []
+    for RowID in range(0,number_of_rows):
+        VarDictionary = getVarDictionary(getRowObject(RowID,TableName))
         VarDictionary['LineNumber'] = RowID
-        if not checkRowObject(RowObject,Conditions,VarDictionary):
-           continue
-        raw_string = putRowObjectToString(RowObject)
-        if File:
-           OutputFile.write(raw_string+'\n')
+        if ConditionsPlan(VarDictionary):
+           RowIDs.append(RowID)
+    return array(RowIDs,dtype=int)
+
+def outputTable(TableName,Conditions=None,File=None,Header=True,ParameterNames=None,Delimiter=None):
+    # Display or record table with condition checking.
+    # ParameterNames are the names or expressions to output (all parameters by default),
+    #  Delimiter switches the fixed-width output to the delimited one (e.g. ',' for CSV).
+    # The rows are selected column-wise and formatted by blocks,
+    #  so the table is streamed to the file without a copy of the result.
+    loadTableOnDemand(TableName)
+    if ParameterNames is None:
+       ParameterNames = LOCAL_TABLE_CACHE[TableName]['header']['order']
+    checkQuery(TableName,ParameterNames,Conditions)
+    # output formats are the same as in the result of select
+    RowObjectDefault = getDefaultRowObject(TableName)
+    VarDictionary = getVarDictionary(RowObjectDefault)
+    VarDictionary['LineNumber'] = 0
+    RowObjectDefault = newRowObject(ParameterNames,RowObjectDefault,VarDictionary,
+                                    getContextFormat(RowObjectDefault))
+    Names = [par_name for par_name,par_value,par_format in RowObjectDefault]
+    Formats = [par_format for par_name,par_value,par_format in RowObjectDefault]
+    CompiledNames = compileParameterNames(ParameterNames,Columnwise=True)
+    RowIDs = getOutputRowIDs(TableName,Conditions)
+    # plain parameters of views are gathered from the parent table
+    data = LOCAL_TABLE_CACHE[TableName]['data']
+    SourceRowIDs = None
+    if isinstance(data,TableViewData):
+       SourceRowIDs = arange(data.rows.stop)[data.rows] if isinstance(data.rows,slice) else data.rows
+       data = data.source
+    if File:
+       if Delimiter is None: Header = False
+       OutputFile = open(File,'w',buffering=OUTPUT_BUFFER_SIZE)
+    else:
+       OutputFile = sys.stdout
+    if Delimiter is not None:
+       Writer = csv.writer(OutputFile,delimiter=Delimiter,lineterminator='\n')
+       if Header:
+          Writer.writerow(Names)
+    elif Header:
+       OutputFile.write(putNamesToString(Names,Formats)+'\n')
+    for BlockStart in range(0,len(RowIDs),OUTPUT_BLOCK):
+        Block = RowIDs[BlockStart:BlockStart+OUTPUT_BLOCK]
+        Columns = getColumnResolver(TableName,Block)
+        BlockColumns = []
+        for par_name,plan,par_format in CompiledNames:
+            if plan is not None:
+               BlockColumns.append(getColumnValues(plan(Columns),len(Block)))
+            else:
+               BlockColumns.append(gatherColumn(data[par_name],
+                                                Block if SourceRowIDs is None else SourceRowIDs[Block]))
+        if Delimiter is not None:
+           Writer.writerows(zip(*[[item.strip() for item in formatColumn(par_format,column)]
+                                  for par_format,column in zip(Formats,BlockColumns)]))
         else:
-           print(raw_string)
+           OutputFile.write(putFormattedColumnsToString(Formats,BlockColumns,len(Block)))
+    if File:
+       OutputFile.close()
 
 # Create table "prototype-based" way
 def createTable(TableName,RowObjectDefault):
@@ -2337,6 +3957,7 @@ def createTable(TableName,RowObjectDefault):
     LOCAL_TABLE_CACHE[TableName]['header']['table_name'] = TableName
     LOCAL_TABLE_CACHE[TableName]['header']['table_type'] = 'column-fixed'
     LOCAL_TABLE_CACHE[TableName]['data'] = data
+    touchTable(TableName)
     
 
 # simple "drop table" capability
@@ -2360,6 +3981,8 @@ def dropTable(TableName):
        del LOCAL_TABLE_CACHE[TableName]
     except:
        pass
+    dropIndex(TableName)
+    touchTable(TableName)
     # delete from storage
     pass # TODO
 
@@ -2380,6 +4003,7 @@ def getColumn(TableName,ParameterName):
         p1 = getColumn('sampletab','p1')
     ---
     """
+    loadTableOnDemand(TableName)
     return LOCAL_TABLE_CACHE[TableName]['data'][ParameterName]
 
 # Returns a list of columns corresponding to parameter names
@@ -2399,14 +4023,17 @@ def getColumns(TableName,ParameterNames):
         p1,p2,p3 = getColumns('sampletab',('p1','p2','p3'))
     ---
     """
+    loadTableOnDemand(TableName)
     Columns = []
     for par_name in ParameterNames:
         Columns.append(LOCAL_TABLE_CACHE[TableName]['data'][par_name])
     return Columns
 
 def addColumn(TableName,ParameterName,Before=None,Expression=None,Type=None,Default=None,Format=None):
+    loadTableOnDemand(TableName)
     if ParameterName in LOCAL_TABLE_CACHE[TableName]['header']['format']:
        raise Exception('Column \"%s\" already exists' % ParameterName)
+    touchTable(TableName)
     if not Type: Type = float
     if not Default: Default = getDefaultValue(Type)
     if not Format: Format = getDefaultFormat(Type)
@@ -2416,11 +4043,12 @@ def addColumn(TableName,ParameterName,Before=None,Expression=None,Type=None,Defa
        LOCAL_TABLE_CACHE[TableName]['data'][ParameterName]=[Default for i in range(0,number_of_rows)]
     else:
        data = []
+       plan = compileExpression(Expression)
        for RowID in range(0,number_of_rows):
            RowObject = getRowObject(RowID,TableName)
            VarDictionary = getVarDictionary(RowObject)
            VarDictionary['LineNumber'] = RowID
-           par_value = evaluateExpression(Expression,VarDictionary)
+           par_value = plan(VarDictionary)
            data.append(par_value)
            LOCAL_TABLE_CACHE[TableName]['data'][ParameterName] = data
     # Mess with header
@@ -2440,8 +4068,10 @@ def addColumn(TableName,ParameterName,Before=None,Expression=None,Type=None,Defa
    
 
 def deleteColumn(TableName,ParameterName):
+    loadTableOnDemand(TableName)
     if ParameterName not in LOCAL_TABLE_CACHE[TableName]['header']['format']:
        raise Exception('No such column \"%s\"' % ParameterName)
+    touchTable(TableName)
     # Mess with data
     i = LOCAL_TABLE_CACHE[TableName]['header']['order'].index(ParameterName)
     del LOCAL_TABLE_CACHE[TableName]['header']['order'][i]
@@ -2467,6 +4097,120 @@ def insertRow():
 def deleteRows(TableName,ParameterNames,Conditions):
     pass
 
+# Results of the selects are cached in QUERY_CACHE (least recently used first):
+#   key = (TableName,generation of the table,ParameterNames,Conditions,
+#          number of rows,((par_name,id,length) of every column used by the query)),
+#   entry = {'view':(parent,source,rows,names)|None,'data':DICT|None,
+#            'columns':LIST,'number_of_rows':INT,'size':INT}
+# Views are cached by their row ids, other results by a copy of their columns.
+# Entries of a table are dropped on its every edit (see touchTable); columns
+#  assigned or resized without touchTable change the key, and the entry keeps
+#  the columns themselves, so their ids are not reused while it is cached.
+# The cache is kept within QUERY_CACHE_SIZE bytes.
+
+QUERY_CACHE = OrderedDict()
+
+def normalizeExpression(root):
+    # expression with tuples instead of lists and operator names in upper case
+    if type(root) not in set([list,tuple]):
+        return root
+    if root and type(root[0])==str:
+        head = root[0].upper()
+        if head in set(['STR','STRING','SET']):
+            return (head,)+tuple(root[1:])
+        return (head,)+tuple(normalizeExpression(element) for element in root[1:])
+    return tuple(normalizeExpression(element) for element in root)
+
+def getQueryKey(TableName,ParameterNames,Conditions):
+    # key of the select in QUERY_CACHE, None if the query can not be cached
+    ParameterNames = tuple(normalizeExpression(par) for par in ParameterNames)
+    ParameterKey = getExpressionKey(ParameterNames)
+    ConditionsKey = getExpressionKey(normalizeExpression(Conditions))
+    if ParameterKey is None or ConditionsKey is None:
+        return None
+    ColumnsKey = tuple((par_name,id(column),len(column))
+                       for par_name,column in getQueryColumns(TableName,ParameterNames,Conditions))
+    return (TableName,LOCAL_TABLE_GENERATION.get(TableName,0),ParameterKey,ConditionsKey,
+            LOCAL_TABLE_CACHE[TableName]['header']['number_of_rows'],ColumnsKey)
+
+def getQueryColumns(TableName,ParameterNames,Conditions):
+    # (par_name,column) of the columns of the table used by the query
+    data = LOCAL_TABLE_CACHE[TableName]['data']
+    Variables = getExpressionVariables(Conditions) if Conditions else set()
+    for par_name,par_expr,par_format in getParameterExpressions(ParameterNames):
+        Variables |= set([par_name]) if par_expr is None else getExpressionVariables(par_expr)
+    return [(par_name,data[par_name]) for par_name in sorted(Variables) if par_name in data]
+
+def isQueryKeyValid(Key,entry):
+    # True if the columns of the source table are still those the entry was made from
+    data = LOCAL_TABLE_CACHE.get(Key[0],{}).get('data')
+    if data is None:
+        return False
+    for (par_name,ident,length),column in zip(Key[5],entry['columns']):
+        if data.get(par_name) is not column or len(column)!=length:
+            return False
+    return True
+
+def copyColumn(column):
+    return np.array(column) if isinstance(column,ndarray) else list(column)
+
+def getColumnSize(column):
+    # approximate size of the column in bytes
+    if isinstance(column,ndarray):
+        return column.nbytes
+    return 8*len(column)
+
+def storeQueryResult(Key,TableName):
+    # put the contents of the table to QUERY_CACHE under the Key
+    budget = VARIABLES['QUERY_CACHE_SIZE']
+    if Key is None or not budget:
+        return
+    data = LOCAL_TABLE_CACHE[TableName]['data']
+    source = LOCAL_TABLE_CACHE[Key[0]]['data']
+    entry = {'view':None,'data':None,
+             'columns':[source[par_name] for par_name,ident,length in Key[5]],
+             'number_of_rows':LOCAL_TABLE_CACHE[TableName]['header']['number_of_rows']}
+    if isinstance(data,TableViewData):
+        entry['view'] = (data.parent,data.source,data.rows,list(data.names))
+        entry['size'] = getColumnSize(data.rows) if isinstance(data.rows,ndarray) else 0
+    else:
+        entry['size'] = sum(getColumnSize(data[par_name]) for par_name in data)
+        if entry['size']>budget:
+            return
+        entry['data'] = {par_name:copyColumn(data[par_name]) for par_name in data}
+    QUERY_CACHE[Key] = entry
+    size = sum(cached['size'] for cached in QUERY_CACHE.values())
+    while size>budget and QUERY_CACHE:
+        size -= QUERY_CACHE.popitem(last=False)[1]['size']
+
+def restoreQueryResult(Key,TableName):
+    # fill the (already created) table from QUERY_CACHE, False if the Key is not there
+    entry = QUERY_CACHE.get(Key) if Key is not None else None
+    if entry is None:
+        return False
+    if not isQueryKeyValid(Key,entry):
+        del QUERY_CACHE[Key]
+        return False
+    QUERY_CACHE.move_to_end(Key)
+    touchTable(TableName)
+    if entry['view'] is not None:
+        parent,source,rows,names = entry['view']
+        LOCAL_TABLE_CACHE[TableName]['data'] = TableViewData(parent,source,rows,names)
+        LOCAL_TABLE_VIEWS.setdefault(parent,set()).add(TableName)
+        if not VARIABLES['SELECT_VIEWS']:
+            materializeTable(TableName)
+    else:
+        LOCAL_TABLE_CACHE[TableName]['data'] = \
+            {par_name:copyColumn(column) for par_name,column in entry['data'].items()}
+    LOCAL_TABLE_CACHE[TableName]['header']['number_of_rows'] = entry['number_of_rows']
+    return True
+
+def dropQueryResults(TableName):
+    # forget the cached selects from the table and the cached views of it
+    for Key,entry in list(QUERY_CACHE.items()):
+        if Key[0]==TableName or (entry['view'] is not None and entry['view'][0]==TableName):
+            del QUERY_CACHE[Key]
+
 # select from table to another table
 def selectInto(DestinationTableName,TableName,ParameterNames,Conditions):
     # TableName must refer to an existing table in cache!!
@@ -2486,20 +4230,76 @@ def selectInto(DestinationTableName,TableName,ParameterNames,Conditions):
     # do full scan each time
     if DestinationTableName == TableName:
        raise Exception('Selecting into source table is forbidden')
+    loadTableOnDemand(TableName)
+    try:
+        return selectColumnsInto(DestinationTableName,TableName,ParameterNames,Conditions)
+    except ColumnwiseError:
+        pass # fall back to the row-wise scan
     table_length = LOCAL_TABLE_CACHE[TableName]['header']['number_of_rows']
+    CompiledNames = compileParameterNames(ParameterNames)
+    ConditionsPlan = compileExpression(Conditions) if Conditions else None
+    touchTable(DestinationTableName)
     row_count = 0
     for RowID in range(0,table_length):
         RowObject = getRowObject(RowID,TableName)
         VarDictionary = getVarDictionary(RowObject)
         VarDictionary['LineNumber'] = RowID
         ContextFormat = getContextFormat(RowObject)
-        RowObjectNew = newRowObject(ParameterNames,RowObject,VarDictionary,ContextFormat)
-        if checkRowObject(RowObject,Conditions,VarDictionary):
+        RowObjectNew = newRowObject(ParameterNames,RowObject,VarDictionary,ContextFormat,
+                                    CompiledNames=CompiledNames)
+        if ConditionsPlan is None or ConditionsPlan(VarDictionary):
            addRowObject(RowObjectNew,DestinationTableName)
            row_count += 1
     LOCAL_TABLE_CACHE[DestinationTableName]['header']['number_of_rows'] += row_count
 
+def selectColumnsInto(DestinationTableName,TableName,ParameterNames,Conditions):
+    # column-wise version of selectInto: Conditions give a mask over the
+    #  whole table, the selected rows are gathered with fancy indexing
+    table_length = LOCAL_TABLE_CACHE[TableName]['header']['number_of_rows']
+    CompiledNames = compileParameterNames(ParameterNames,Columnwise=True)
+    if Conditions:
+        RowIDs = getSelectedRowIDs(TableName,Conditions)
+    else:
+        RowIDs = arange(table_length)
+    data = LOCAL_TABLE_CACHE[TableName]['data']
+    DestinationHeader = LOCAL_TABLE_CACHE[DestinationTableName]['header']
+    ViewNames = [par_name for par_name,plan,par_format in CompiledNames if plan is None]
+    if VARIABLES['SELECT_VIEWS'] and len(ViewNames)==len(CompiledNames) and \
+       len(set(ViewNames))==len(ViewNames) and DestinationHeader['number_of_rows']==0 and \
+       set(ViewNames)==set(DestinationHeader['order']):
+        # plain parameters into an empty table: make it a view
+        for par_name in ViewNames:
+            if par_name not in data:
+                raise KeyError(par_name)
+        touchTable(DestinationTableName)
+        createView(DestinationTableName,TableName,RowIDs,ViewNames)
+        return
+    Columns = getColumnResolver(TableName,RowIDs)
+    NewColumns = []
+    for par_name,plan,par_format in CompiledNames:
+        if plan is not None: # bind
+           column = getColumnValues(plan(Columns),len(RowIDs))
+        else: # parname
+           column = gatherColumn(data[par_name],RowIDs)
+        NewColumns.append((par_name,column))
+    # all columns are ready: put them to the destination table
+    touchTable(DestinationTableName)
+    DestinationData = LOCAL_TABLE_CACHE[DestinationTableName]['data']
+    for par_name,column in NewColumns:
+        if par_name not in DestinationData:
+            raise KeyError(par_name)
+    for par_name,column in NewColumns:
+        DestinationColumn = DestinationData[par_name]
+        if len(DestinationColumn)==0:
+            DestinationData[par_name] = column
+        elif isinstance(DestinationColumn,ndarray):
+            DestinationData[par_name] = np.concatenate([DestinationColumn,column])
+        else:
+            DestinationColumn.extend(column)
+    LOCAL_TABLE_CACHE[DestinationTableName]['header']['number_of_rows'] += len(RowIDs)
+
 def length(TableName):
+    loadTableOnDemand(TableName)
     tab_len = LOCAL_TABLE_CACHE[TableName]['header']['number_of_rows']
     #print(str(tab_len)+' rows in '+TableName)
     return tab_len
@@ -2523,7 +4323,12 @@ def select(TableName,DestinationTableName=QUERY_BUFFER,ParameterNames=None,Condi
     ---
     DESCRIPTION:
         Select or filter the data in some table 
-        either to standard output or to file (if specified)
+        either to standard output or to file (if specified).
+        With VARIABLES['SELECT_VIEWS'] the result of a select of plain
+        parameters is a view sharing memory with TableName: it is copied
+        when either table is edited through hapi (setRowObject, addColumn, ...),
+        but in-place writes to the columns of TableName (data['p1'][:] = ...)
+        change the view as well.
     ---
     EXAMPLE OF USAGE:
         select('sampletab',DestinationTableName='outtab',ParameterNames=(p1,p2),
@@ -2535,15 +4340,21 @@ def select(TableName,DestinationTableName=QUERY_BUFFER,ParameterNames=None,Condi
     # check if table exists
     if TableName not in LOCAL_TABLE_CACHE.keys():
         raise Exception('%s: no such table. Check tableList() for more info.' % TableName)
+    loadTableOnDemand(TableName)
     if not ParameterNames: ParameterNames=LOCAL_TABLE_CACHE[TableName]['header']['order']
+    checkQuery(TableName,ParameterNames,Conditions)
     LOCAL_TABLE_CACHE[DestinationTableName] = {} # clear QUERY_BUFFER for the new result
     RowObjectDefault = getDefaultRowObject(TableName)
     VarDictionary = getVarDictionary(RowObjectDefault)
+    VarDictionary['LineNumber'] = 0
     ContextFormat = getContextFormat(RowObjectDefault)
     RowObjectDefaultNew = newRowObject(ParameterNames,RowObjectDefault,VarDictionary,ContextFormat)
     dropTable(DestinationTableName) # redundant
     createTable(DestinationTableName,RowObjectDefaultNew)
-    selectInto(DestinationTableName,TableName,ParameterNames,Conditions)
+    QueryKey = getQueryKey(TableName,ParameterNames,Conditions)
+    if not restoreQueryResult(QueryKey,DestinationTableName):
+        selectInto(DestinationTableName,TableName,ParameterNames,Conditions)
+        storeQueryResult(QueryKey,DestinationTableName)
     if DestinationTableName!=QUERY_BUFFER:
         if File: outputTable(DestinationTableName,File=File)
     elif Output:
@@ -2552,73 +4363,62 @@ def select(TableName,DestinationTableName=QUERY_BUFFER,ParameterNames=None,Condi
 # SORTING ===========================================================
 
 def arrangeTable(TableName,DestinationTableName=None,RowIDList=None):
-    #print 'AT/'
-    #print 'AT: RowIDList = '+str(RowIDList)
-    # make a subset of table rows according to RowIDList
+    # make a subset of table rows according to RowIDList;
+    #  every column is gathered at once with fancy indexing
+    loadTableOnDemand(TableName)
     if not DestinationTableName:
        DestinationTableName = TableName
+    RowIDs = np.asarray(RowIDList,dtype=int)
+    data = LOCAL_TABLE_CACHE[TableName]['data']
+    header = LOCAL_TABLE_CACHE[TableName]['header']
     if DestinationTableName != TableName:
        dropTable(DestinationTableName)
-       LOCAL_TABLE_CACHE[DestinationTableName]['header']=LOCAL_TABLE_CACHE[TableName]['header']
-       LOCAL_TABLE_CACHE[DestinationTableName]['data']={}
-    LOCAL_TABLE_CACHE[DestinationTableName]['header']['number_of_rows'] = len(RowIDList)
-    #print 'AT: RowIDList = '+str(RowIDList)
-    for par_name in LOCAL_TABLE_CACHE[DestinationTableName]['header']['order']:
-        par_data = LOCAL_TABLE_CACHE[TableName]['data'][par_name]
-        LOCAL_TABLE_CACHE[DestinationTableName]['data'][par_name] = [par_data[i] for i in RowIDList]
-    
-def compareLESS(RowObject1,RowObject2,ParameterNames):
-    #print 'CL/'
-    # arg1 and arg2 are RowObjects
-    # Compare them according to ParameterNames
-    # Simple validity check:
-    #if len(arg1) != len(arg2):
-    #   raise Exception('Arguments have different lengths')
-    #RowObject1Subset = subsetOfRowObject(ParameterNames,RowObject1)
-    #RowObject2Subset = subsetOfRowObject(ParameterNames,RowObject2)
-    #return RowObject1Subset < RowObject2Subset
-    row1 = []
-    row2 = []
-    #n = len(RowObject1)
-    #for i in range(0,n):
-    #    par_name1 = RowObject1[i][0]
-    #    if par_name1 in ParameterNames:
-    #       par_value1 = RowObject1[i][1]
-    #       par_value2 = RowObject2[i][1]
-    #       row1 += [par_value1]
-    #       row2 += [par_value2]
-    VarDictionary1 = getVarDictionary(RowObject1)
-    VarDictionary2 = getVarDictionary(RowObject2)
-    for par_name in ParameterNames:
-        par_value1 = VarDictionary1[par_name]
-        par_value2 = VarDictionary2[par_name]
-        row1 += [par_value1]
-        row2 += [par_value2]
-    Flag = row1 < row2
-    return Flag
-
-def quickSort(index,TableName,ParameterNames,Accending=True):
-    # ParameterNames: names of parameters which are
-    #  taking part in the sorting
-    if index == []:
-       return []
+       LOCAL_TABLE_CACHE[DestinationTableName] = {}
+       LOCAL_TABLE_CACHE[DestinationTableName]['header'] = header.copy()
+       for key in ('order','format','default'):
+           LOCAL_TABLE_CACHE[DestinationTableName]['header'][key] = header[key].copy()
+       LOCAL_TABLE_CACHE[DestinationTableName]['data'] = {}
+    touchTable(DestinationTableName)
+    data = LOCAL_TABLE_CACHE[TableName]['data'] # touchTable could materialize it
+    LOCAL_TABLE_CACHE[DestinationTableName]['header']['number_of_rows'] = len(RowIDs)
+    for par_name in header['order']:
+        LOCAL_TABLE_CACHE[DestinationTableName]['data'][par_name] = gatherColumn(data[par_name],RowIDs)
+
+def getSortKey(column):
+    # column (or the value of an expression) as an array for numpy.lexsort
+    if isinstance(column,ndarray) and column.dtype!=object:
+       return column
+    values = list(column)
+    key = np.array(values)
+    if key.dtype==object or key.ndim!=1:
+       # values which numpy cannot compare: rank them with the python ordering
+       order = sorted(range(len(values)),key=values.__getitem__)
+       key = np.empty(len(values),dtype=int)
+       rank = 0
+       for n,i in enumerate(order):
+           if n>0 and values[order[n-1]] < values[i]: rank += 1
+           key[i] = rank
+    return key
+
+def getSortedRowIDs(TableName,ParameterNames,Accending=True):
+    # indices of the table rows ordered by ParameterNames (names or expressions);
+    #  the sort is stable, descending order is the reversed ascending one
+    number_of_rows = LOCAL_TABLE_CACHE[TableName]['header']['number_of_rows']
+    Columns = getColumnResolver(TableName)
+    keys = []
+    for expr in ParameterNames:
+        value = compileExpression(expr,Columnwise=True)(Columns)
+        if isinstance(value,ndarray) or type(value) in set([list,tuple]) and len(value)==number_of_rows:
+           keys.append(getSortKey(value))
+        # constant expressions do not change the order
+    if keys:
+       # the last key passed to lexsort is the primary one
+       RowIDs = np.lexsort(keys[::-1])
     else:
-       PivotID = index[0]
-       Pivot = getRowObject(PivotID,TableName)
-       lesser_index = []
-       greater_index = [];
-       for RowID in index[1:]:
-           RowObject = getRowObject(RowID,TableName)           
-           if compareLESS(RowObject,Pivot,ParameterNames): 
-              lesser_index += [RowID]
-           else:
-              greater_index += [RowID]
-       lesser = quickSort(lesser_index,TableName,ParameterNames,Accending)
-       greater = quickSort(greater_index,TableName,ParameterNames,Accending)
-       if Accending:
-          return lesser + [PivotID] + greater
-       else:
-          return greater + [PivotID] + lesser
+       RowIDs = arange(number_of_rows)
+    if not Accending:
+       RowIDs = RowIDs[::-1]
+    return RowIDs
 
 # Sorting must work well on the table itself!
 def sort(TableName,DestinationTableName=None,ParameterNames=None,Accending=True,Output=False,File=None):
@@ -2641,16 +4441,17 @@ def sort(TableName,DestinationTableName=None,ParameterNames=None,Accending=True,
         sort('sampletab',ParameterNames=(p1,('+',p1,p2)))
     ---
     """
-    number_of_rows = LOCAL_TABLE_CACHE[TableName]['header']['number_of_rows']
-    index = range(0,number_of_rows)
+    loadTableOnDemand(TableName)
     if not DestinationTableName:
        DestinationTableName = TableName
     # if names are not provided use all parameters in sorting
     if not ParameterNames:
        ParameterNames = LOCAL_TABLE_CACHE[TableName]['header']['order']
-    elif type(ParameterNames) not in set([list,tuple]):
+    elif type(ParameterNames) not in set([list,tuple]) or \
+         type(ParameterNames[0])==str and ParameterNames[0].upper() in OPERATORS:
        ParameterNames = [ParameterNames] # fix of stupid bug where ('p1',) != ('p1')
-    index_sorted = quickSort(index,TableName,ParameterNames,Accending)
+    checkQuery(TableName,ParameterNames,None)
+    index_sorted = getSortedRowIDs(TableName,ParameterNames,Accending)
     arrangeTable(TableName,DestinationTableName,index_sorted)
     if Output:
        outputTable(DestinationTableName,File=File)
@@ -2660,18 +4461,68 @@ def sort(TableName,DestinationTableName=None,ParameterNames=None,Accending=True,
 
 # GROUPING ==========================================================
 
-# GROUP_INDEX global auxiliary structure is a Dictionary,
-#   which has the following properties:
-#      1) Each key is a composite variable:
-#          [array of values of ParameterNames variable
-#           STREAM_UPDATE_FLAG]
-#      2) Each value is an index in LOCAL_TABLE_CACHE[TableName]['data'][...],
-#          corresponding to this key
-#   STREAM_UPDATE_FLAG = TRUE if value in GROUP_INDEX needs updating
-#                      = FALSE otherwise
+# Grouping is done in two stages:
+#   1) rows are factorized into groups by the values of GroupParameterNames (getGroups)
+#   2) every expression in ParameterNames is evaluated for all groups at once:
+#       group functions (COUNT,SUM,MUL,AVG,MIN,MAX,SSQ) reduce their argument
+#       over the rows of each group, other parameters and expressions
+#       are taken from the first row of the group.
 #   If no grouping variables are specified (GroupParameterNames==None)
-#    than the following key is used: "__GLOBAL__"
+#    than the whole table is one group.
+# N.B. SUM and MUL with one argument are group functions,
+#    with more arguments they are arithmetic operations.
+
+def isGroupFunctionCall(root):
+    head = root[0].upper()
+    if head not in GROUP_FUNCTIONS:
+       return False
+    if head in set(['SUM','MUL']):
+       return len(root)==2
+    return True
+
+def isGroupExpression(root):
+    # True if the expression contains group functions
+    if type(root) not in set([list,tuple]) or not root or type(root[0])!=str:
+       return False
+    if root[0].upper() in set(['STR','STRING','SET']):
+       return False
+    if isGroupFunctionCall(root):
+       return True
+    for element in root[1:]:
+        if isGroupExpression(element): return True
+    return False
 
+def evaluateGroupExpression(root,Columns,Groups):
+    # value of the expression for every group (see description above)
+    if isGroupExpression(root):
+       head = root[0].upper()
+       if isGroupFunctionCall(root):
+          if head=='COUNT':
+             values = None
+          elif len(root)!=2:
+             raise Exception('%s: expected 1 argument, got %d' % (head,len(root)-1))
+          else:
+             values = compileExpression(root[1],Columnwise=True)(Columns)
+          return GROUP_FUNCTIONS[head](values,Groups)
+       args = [evaluateGroupExpression(element,Columns,Groups) for element in root[1:]]
+       try:
+          function = COLUMN_OPERATORS[head]
+       except KeyError:
+          raise Exception('Unknown operator: %s' % head)
+       return function(args)
+    value = compileExpression(root,Columnwise=True)(Columns)
+    if isinstance(value,ndarray):
+       return value[Groups['first']]
+    return value
+
+def getColumnValueType(column):
+    # python type of the column values (see getDefaultFormat)
+    if isinstance(column,ndarray) and column.dtype!=object:
+       return {'b':bool,'i':int,'u':int,'f':float}.get(column.dtype.kind,str)
+    elif len(column)>0:
+       Type = type(column[0])
+       return Type if Type in set([bool,int,float,str]) else str
+    return float
 
 def group(TableName,DestinationTableName=QUERY_BUFFER,ParameterNames=None,GroupParameterNames=None,File=None,Output=True):
     """
@@ -2680,64 +4531,63 @@ def group(TableName,DestinationTableName=QUERY_BUFFER,ParameterNames=None,GroupP
         DestinationTableName:     name of resulting table       (optional)
         ParameterNames:       list of parameters or expressions to take       (optional)
         GroupParameterNames:  list of parameters or expressions to group by   (optional)
-        Accending:       sort in ascending (True) or descending (False) order (optional)
         Output:   enable (True) or suppress (False) text output (optional)
     OUTPUT PARAMETERS: 
         none
     ---
     DESCRIPTION:
-        none
+        Group the rows of the table by the values of GroupParameterNames
+        and calculate group functions for each group:
+        COUNT, SUM, MUL, AVG, MIN, MAX, SSQ (sum of squares).
+        Groups are placed in the order of their first rows.
     ---
     EXAMPLE OF USAGE:
         group('sampletab',ParameterNames=('p1',('sum','p2')),GroupParameterNames=('p1'))
-        ... makes grouping by p1,p2. For each group it calculates sum of p2 values.
+        ... makes grouping by p1. For each group it calculates sum of p2 values.
     ---
     """
-    # Implements such functions as:
-    # count,sum,avg,min,max,ssq etc...
     # 1) ParameterNames can contain group functions
     # 2) GroupParameterNames can't contain group functions
-    # 3) If ParameterNames contains parameters defined by LET directive,
-    #    it IS visible in the sub-context of GroupParameterNames
-    # 4) Parameters defined in GroupParameterNames are NOT visible in ParameterNames
-    # 5) ParameterNames variable represents the structure of the resulting table/collection
-    # 6) GroupParameterNames can contain either par_names or expressions with par_names
-    # Clear old GROUP_INDEX value
-    clearGroupIndex()
+    # 3) Parameters defined in GroupParameterNames are NOT visible in ParameterNames
+    # 4) ParameterNames variable represents the structure of the resulting table/collection
+    # 5) GroupParameterNames can contain either par_names or expressions with par_names
+    loadTableOnDemand(TableName)
     # Consistency check
     if TableName == DestinationTableName:
        raise Exception('TableName and DestinationTableName must be different')
-    #if not ParameterNames: ParameterNames=LOCAL_TABLE_CACHE[TableName]['header']['order']
-    # Prepare the new DestinationTable
-    RowObjectDefault = getDefaultRowObject(TableName)
-    VarDictionary = getVarDictionary(RowObjectDefault)
-    ContextFormat = getContextFormat(RowObjectDefault)
-    RowObjectDefaultNew = newRowObject(ParameterNames,RowObjectDefault,VarDictionary,ContextFormat)
-    dropTable(DestinationTableName) # redundant
-    createTable(DestinationTableName,RowObjectDefaultNew)
-    # Loop through rows of source Table
-    # On each iteration group functions update GROUP_INDEX (see description above)
-    number_of_rows = LOCAL_TABLE_CACHE[TableName]['header']['number_of_rows']   
+    if not GroupParameterNames:
+       GroupParameterNames = []
+    elif type(GroupParameterNames) not in set([list,tuple]):
+       GroupParameterNames = [GroupParameterNames]
+    if not ParameterNames:
+       ParameterNames = list(GroupParameterNames) + [('COUNT',)]
+    checkQuery(TableName,GroupParameterNames,None)
+    header = LOCAL_TABLE_CACHE[TableName]['header']
+    number_of_rows = header['number_of_rows']
     # STAGE 1: CREATE GROUPS
-    print('LOOP:')
-    for RowID in range(0,number_of_rows):
-        print('--------------------------------')
-        print('RowID='+str(RowID))
-        RowObject = getRowObject(RowID,TableName) # RowObject from source table
-        VarDictionary = getVarDictionary(RowObject)
-        print('VarDictionary='+str(VarDictionary))
-        # This is a trick which makes evaluateExpression function
-        #   not consider first expression as an operation
-        GroupParameterNames_ = ['LIST'] + list(GroupParameterNames)
-        GroupIndexKey = evaluateExpression(GroupParameterNames_,VarDictionary)
-        # List is an unhashable type in Python!
-        GroupIndexKey = tuple(GroupIndexKey)       
-        initializeGroup(GroupIndexKey)
-        print('GROUP_INDEX='+str(GROUP_INDEX))
-        ContextFormat = getContextFormat(RowObject)
-        RowObjectNew = newRowObject(ParameterNames,RowObject,VarDictionary,ContextFormat,GroupIndexKey)
-        RowIDGroup = GROUP_INDEX[GroupIndexKey]['ROWID']
-        setRowObject(RowIDGroup,RowObjectNew,DestinationTableName)
+    Columns = getColumnResolver(TableName)
+    KeyColumns = [compileExpression(expr,Columnwise=True)(Columns) for expr in GroupParameterNames]
+    Groups = getGroups(KeyColumns,number_of_rows)
+    # STAGE 2: CALCULATE PARAMETERS FOR ALL GROUPS
+    RowObjectDefault = []
+    NewColumns = []
+    for par_name,par_expr,par_format in getParameterExpressions(ParameterNames):
+        if par_expr is None: # parname
+           column = evaluateGroupExpression(par_name,Columns,Groups)
+           column = getColumnValues(column,Groups['number_of_groups'])
+           RowObjectDefault.append((par_name,header['default'][par_name],header['format'][par_name]))
+        else:
+           column = evaluateGroupExpression(par_expr,Columns,Groups)
+           column = getColumnValues(column,Groups['number_of_groups'])
+           Type = getColumnValueType(column)
+           if par_format is None: par_format = getDefaultFormat(Type)
+           RowObjectDefault.append((par_name,getDefaultValue(Type),par_format))
+        NewColumns.append((par_name,column))
+    dropTable(DestinationTableName) # redundant
+    createTable(DestinationTableName,RowObjectDefault)
+    for par_name,column in NewColumns:
+        LOCAL_TABLE_CACHE[DestinationTableName]['data'][par_name] = column
+    LOCAL_TABLE_CACHE[DestinationTableName]['header']['number_of_rows'] = Groups['number_of_groups']
     # Output result if required
     if Output and DestinationTableName==QUERY_BUFFER:
        outputTable(DestinationTableName,File=File)
@@ -3067,7 +4917,7 @@ def queryHITRAN(TableName,iso_id_list,numin,numax,pargroups=[],params=[],dotpar=
     ParameterList = prepareParlist(pargroups=pargroups,params=params,dotpar=dotpar)
     TableHeader = prepareHeader(ParameterList)
     TableHeader['table_name'] = TableName
-    DataFileName = VARIABLES['BACKEND_DATABASE_NAME'] + '/' + TableName + '.data'
+    DataFileName = getDataFileName(TableName)
     HeaderFileName = VARIABLES['BACKEND_DATABASE_NAME'] + '/' + TableName + '.header'
     # create URL
     iso_id_list_str = [str(iso_id) for iso_id in iso_id_list]
@@ -3103,6 +4953,7 @@ def queryHITRAN(TableName,iso_id_list,numin,numax,pargroups=[],params=[],dotpar=
         raise Exception('Cannot connect to %s. Try again or edit GLOBAL_HOST variable.' % GLOBAL_HOST)
     CHUNK = 64 * 1024
     print('BEGIN DOWNLOAD: '+TableName)
+    removeOtherDataFiles(DataFileName)
     with open_(DataFileName,'w') as fp:
        while True:
           chunk = req.read(CHUNK)
@@ -5326,6 +7177,43 @@ def AtoB(aa,A,B,npt):
 
     return bb
 
+def AtoBArray(aa,A,B,npt):
+#***************************
+#...array version of AtoB: same LaGrange 3- and 4-point interpolation
+#...evaluated for every value of aa at once
+#...A must be increasing, values of aa must lie within A[0]..A[npt-1]
+#
+#...input:  aa (array)
+#...output: bb (array)
+    aa = np.asarray(aa,dtype=__FloatType__)
+    A = np.asarray(A,dtype=__FloatType__)
+    B = np.asarray(B,dtype=__FloatType__)
+    # same node as the search loop of AtoB: first I in 2..npt with A[I-1]>=aa
+    I = np.searchsorted(A[1:npt],aa,side='left')+2
+    I = np.minimum(I,npt)
+    D = lambda a,b: np.where(a-b==0.0,0.0001,a-b)
+    # 3-point interpolation at the ends of the grid
+    K = np.where(I<3,0,npt-3)
+    A_0 = A[K]; A_1 = A[K+1]; A_2 = A[K+2]
+    A0=(aa-A_1)*(aa-A_2)/(D(A_0,A_1)*D(A_0,A_2))
+    A1=(aa-A_0)*(aa-A_2)/(D(A_1,A_0)*D(A_1,A_2))
+    A2=(aa-A_0)*(aa-A_1)/(D(A_2,A_0)*D(A_2,A_1))
+    bb3 = A0*B[K] + A1*B[K+1] + A2*B[K+2]
+    # 4-point interpolation elsewhere
+    K = np.clip(I-3,0,npt-4)
+    A_0 = A[K]; A_1 = A[K+1]; A_2 = A[K+2]; A_3 = A[K+3]
+    A0=(aa-A_1)*(aa-A_2)*(aa-A_3)
+    A0=A0/(D(A_0,A_1)*D(A_0,A_2)*D(A_0,A_3))
+    A1=(aa-A_0)*(aa-A_2)*(aa-A_3)
+    A1=A1/(D(A_1,A_0)*D(A_1,A_2)*D(A_1,A_3))
+    A2=(aa-A_0)*(aa-A_1)*(aa-A_3)
+    A2=A2/(D(A_2,A_0)*D(A_2,A_1)*D(A_2,A_3))
+    A3=(aa-A_0)*(aa-A_1)*(aa-A_2)
+    A3=A3/(D(A_3,A_0)*D(A_3,A_1)*D(A_3,A_2))
+    bb4 = A0*B[K] + A1*B[K+1] + A2*B[K+2] + A3*B[K+3]
+
+    return np.where((I<3)|(I==npt),bb3,bb4)
+
 
 #  --------------- ISOTOPOLOGUE HASH ----------------------
 
@@ -17473,22 +19361,48 @@ TIPS_2017_ISOQ_HASH[(M,I)] = float64([
 
 #  --------------- /TIPS-2017 IMPLEMENTATION ----------------------
 
+# partition sums already interpolated, keyed on (M,I,T)
+PARTITION_SUMS = {}
+PARTITION_SUMS_LIMIT = 100000
+
 def BD_TIPS_2017_PYTHON(M,I,T):
-    # get temperature grid
-    TT = TIPS_2017_ISOT_HASH[(M,I)]
-    Tmin = min(TT); Tmax = max(TT)
-    
-    # out of temperature range
-    if T<Tmin or T>Tmax:
-        raise Exception('TIPS2017: T(%.1fK) must be between %.1fK and %.1fK.'%(T,Tmin,Tmax))
+    """
+    Interpolate TIPS-2017 partition sum of the isotopologue (M,I).
+    T is either a scalar or an array of temperatures; in the latter case
+    the whole array is interpolated in a single call and an array is returned.
+    Scalar results are memoized in PARTITION_SUMS.
+    """
+    scalar = np.ndim(T)==0
+    if scalar:
+        try:
+            return None,PARTITION_SUMS[(M,I,T)]
+        except (KeyError,TypeError):
+            pass
     
+    # get temperature grid (increasing)
     try:
-        # get statistical weight for specified isotopologue
-        #gi = TIPS_GSI_HASH[(M,I)] # Take from TIPS-2011?
-        # interpolate partition sum for specified isotopologue
-        Qt = AtoB(T,TT,TIPS_2017_ISOQ_HASH[(M,I)],len(TT))
+        TT = TIPS_2017_ISOT_HASH[(M,I)]
+        QQ = TIPS_2017_ISOQ_HASH[(M,I)]
     except KeyError:
         raise Exception('TIPS2017: no data for M,I = %d,%d.' % (M,I))
+    Tmin = TT[0]; Tmax = TT[-1]
+    
+    # out of temperature range
+    TArray = np.asarray(T,dtype=__FloatType__)
+    if TArray.size:
+        T_ = TArray.min() if TArray.min()<Tmin else TArray.max()
+        if not Tmin<=T_<=Tmax:
+            raise Exception('TIPS2017: T(%.1fK) must be between %.1fK and %.1fK.'%(T_,Tmin,Tmax))
+    
+    # get statistical weight for specified isotopologue
+    #gi = TIPS_GSI_HASH[(M,I)] # Take from TIPS-2011?
+    # interpolate partition sum for specified isotopologue
+    Qt = AtoBArray(TArray,TT,QQ,len(TT))
+    if scalar:
+        Qt = Qt[()]
+        if len(PARTITION_SUMS)>=PARTITION_SUMS_LIMIT:
+            PARTITION_SUMS.clear()
+        PARTITION_SUMS[(M,I,T)] = Qt
     
     return None,Qt
 
@@ -17571,6 +19485,8 @@ def partitionSum(M,I,T,step=None,version=2017):
             2) If T is a list and step parameter IS provided,
                 then calculate partition sums between T[0] and T[1]
                 with a given step.
+        For TIPS-2017 the list of temperatures is interpolated in a single
+        array call, and scalar partition sums are memoized per (M,I,T).
     ---
     EXAMPLE OF USAGE:
         PartSum = partitionSum(1,1,[296,1000])
@@ -17588,11 +19504,16 @@ def partitionSum(M,I,T,step=None,version=2017):
     if not step:
        if type(T) not in set([list,tuple]):
           return BD_TIPS(M,I,T)[1]
+       elif version==2017:
+          return list(BD_TIPS(M,I,T)[1])
        else:
           return [BD_TIPS(M,I,temp)[1] for temp in T]
     else:
        TT = arange(T[0],T[1],step)
-       return TT,array([BD_TIPS(M,I,temp)[1] for temp in TT])
+       if version==2017:
+          return TT,BD_TIPS(M,I,TT)[1]
+       else:
+          return TT,array([BD_TIPS(M,I,temp)[1] for temp in TT])
 
 # ------------------ partition sum --------------------------------------
 
@@ -17774,19 +19695,25 @@ def polyval(p, x):
     return y
 """;
     
+# coefficients of the rational series of cef, computed once for each N
+CEF_COEFFICIENTS = {}
+
 def cef(x,y,N):
     # Computes the function w(z) = exp(-zA2) erfc(-iz) using a rational
     # series with N terms. It is assumed that Im(z) > 0 or Im(z) = 0.
     z = x + 1.0j*y
-    M = 2*N; M2 = 2*M; k = arange(-M+1,M) #'; # M2 = no. of sampling points.
-    L = sqrt(N/sqrt(2)); # Optimal choice of L.
-    theta = k*pi/M; t = L*tan(theta/2); # Variables theta and t.
-    #f = exp(-t.A2)*(LA2+t.A2); f = [0; f]; # Function to be transformed.
-    f = zeros(len(t)+1); f[0] = 0
-    f[1:] = exp(-t**2)*(L**2+t**2)
-    #f = insert(exp(-t**2)*(L**2+t**2),0,0)
-    a = real(fft(fftshift(f)))/M2; # Coefficients of transform.
-    a = flipud(a[1:N+1]); # Reorder coefficients.
+    if N not in CEF_COEFFICIENTS:
+        M = 2*N; M2 = 2*M; k = arange(-M+1,M) #'; # M2 = no. of sampling points.
+        L = sqrt(N/sqrt(2)); # Optimal choice of L.
+        theta = k*pi/M; t = L*tan(theta/2); # Variables theta and t.
+        #f = exp(-t.A2)*(LA2+t.A2); f = [0; f]; # Function to be transformed.
+        f = zeros(len(t)+1); f[0] = 0
+        f[1:] = exp(-t**2)*(L**2+t**2)
+        #f = insert(exp(-t**2)*(L**2+t**2),0,0)
+        a = real(fft(fftshift(f)))/M2; # Coefficients of transform.
+        a = flipud(a[1:N+1]); # Reorder coefficients.
+        CEF_COEFFICIENTS[N] = L,a
+    L,a = CEF_COEFFICIENTS[N]
     Z = (L+1.0j*z)/(L-1.0j*z); p = polyval(a,Z); # Polynomial evaluation.
     w = 2*p/(L-1.0j*z)**2+(1/sqrt(pi))/(L-1.0j*z); # Evaluate w(z).
     return w
@@ -17808,11 +19735,124 @@ def hum1_wei(x,y,n=24):
         place(cerf,mask,w24)
     return cerf.real,cerf.imag
 
+def humlicek_w4(x,y):
+    # Humlicek's W4 rational approximation in four regions,
+    #  relative accuracy about 1e-4 (for Im(z) >= 0).
+    #  J. Humlicek. JQSRT 27 (1982) 437-444
+    #  doi:10.1016/0022-4073(82)90078-4
+    t = y-1.0j*x
+    s = abs(x)+y
+    w = zeros(t.shape,dtype=__ComplexType__)
+    mask1 = s>=15.0
+    mask2 = (s>=5.5) & ~mask1
+    mask3 = (s<5.5) & (y>=0.195*abs(x)-0.176)
+    mask4 = ~(mask1|mask2|mask3)
+    if any(mask1):
+        t1 = t[mask1]
+        w[mask1] = t1*0.5641896/(0.5+t1*t1)
+    if any(mask2):
+        t2 = t[mask2]; u = t2*t2
+        w[mask2] = t2*(1.410474+u*0.5641896)/(0.75+u*(3.0+u))
+    if any(mask3):
+        t3 = t[mask3]
+        w[mask3] = (16.4955+t3*(20.20933+t3*(11.96482+t3*(3.778987+t3*0.5642236))))/ \
+                   (16.4955+t3*(38.82363+t3*(39.27121+t3*(21.69274+t3*(6.699398+t3)))))
+    if any(mask4):
+        t4 = t[mask4]; u = t4*t4
+        w[mask4] = exp(u)-t4*(36183.31-u*(3321.9905-u*(1540.787-u*(219.0313-u*(35.76683-
+                   u*(1.320522-u*0.56419))))))/(32066.6-u*(24322.84-u*(9022.228-u*(2186.181-
+                   u*(364.2191-u*(61.57037-u*(1.841439-u)))))))
+    return w.real,w.imag
+
+def weideman_cpf(x,y,n=24):
+    # Weideman's rational series with n terms in the whole plane
+    w = weideman(x,y,n)
+    return w.real,w.imag
+
+# Complex probability functions which can be used by the profiles based on HTP.
+#  'error': maximal relative error |w-w_ref|/|w_ref| for 1e-6<=y<=1e3 and |x|<=1e4,
+#           w_ref being the Weideman series with 128 terms;
+#  'time': time relative to hum1_wei (numpy, 1e6 points).
+CPF_MAP = {
+    'hum1_wei':    {'function':hum1_wei,'error':4e-5,'time':1.0,
+                    'description':'Humlicek region 1 and Weideman N=24 (default)'},
+    'humlicek_w4': {'function':humlicek_w4,'error':5e-5,'time':0.75,
+                    'description':'Humlicek W4, fast preview'},
+    'weideman24':  {'function':lambda x,y: weideman_cpf(x,y,24),'error':4e-10,'time':1.45,
+                    'description':'Weideman N=24 in the whole plane'},
+    'weideman32':  {'function':lambda x,y: weideman_cpf(x,y,32),'error':3e-13,'time':1.75,
+                    'description':'Weideman N=32 in the whole plane'},
+    'cpf':         {'function':cpf,'error':5e-7,'time':9.95,
+                    'description':'Humlicek CPF12 (1979)'},
+}
+try:
+    from scipy.special import wofz
+    def scipy_wofz(x,y):
+        w = wofz(x+1.0j*y)
+        return w.real,w.imag
+    CPF_MAP['wofz'] = {'function':scipy_wofz,'error':None,'time':None,
+                       'description':'scipy.special.wofz (Faddeeva package)'}
+except ImportError:
+    pass
+
+def getCPF(CPF=None):
+    # complex probability function given by its name in CPF_MAP or by itself,
+    #  VARIABLES['CPF'] for None
+    if CPF is None:
+        return VARIABLES['CPF']
+    if callable(CPF):
+        return CPF
+    try:
+        return CPF_MAP[CPF]['function']
+    except KeyError:
+        raise Exception('Unknown complex probability function: %s (see describeCPF())' % CPF)
+
+def setCPF(CPF):
+    """
+    INPUT PARAMETERS:
+        CPF: name of the function in CPF_MAP, or a function f(x,y) returning (Re w, Im w)
+    OUTPUT PARAMETERS:
+        none
+    ---
+    DESCRIPTION:
+        Set the complex probability function used by the Voigt, SDVoigt and HT
+        profiles by default. The function can also be given per call
+        by the CPF parameter of absorptionCoefficient_Voigt/SDVoigt/HT.
+    ---
+    EXAMPLE OF USAGE:
+        setCPF('humlicek_w4')
+    ---
+    """
+    VARIABLES['CPF'] = getCPF(CPF)
+
+def describeCPF():
+    """
+    INPUT PARAMETERS:
+        none
+    OUTPUT PARAMETERS:
+        none
+    ---
+    DESCRIPTION:
+        Print the available complex probability functions
+        with their accuracy and speed.
+    ---
+    EXAMPLE OF USAGE:
+        describeCPF()
+    ---
+    """
+    print('%-12s %10s %6s  %s' % ('name','rel.error','time','description'))
+    for name,entry in CPF_MAP.items():
+        print('%-12s %10s %6s  %s%s' % (name,
+              '%.0e' % entry['error'] if entry['error'] is not None else '-',
+              '%.2f' % entry['time'] if entry['time'] is not None else '-',
+              entry['description'],
+              ' [current]' if entry['function'] is VARIABLES['CPF'] else ''))
+
 VARIABLES['CPF'] = hum1_wei
 #VARIABLES['CPF'] = cpf
     
 # ------------------ Hartmann-Tran Profile (HTP) ------------------------
-def pcqsdhc(sg0,GamD,Gam0,Gam2,Shift0,Shift2,anuVC,eta,sg):
+def pcqsdhc(sg0,GamD,Gam0,Gam2,Shift0,Shift2,anuVC,eta,sg,CPF=None):
     #-------------------------------------------------
     #      "pCqSDHC": partially-Correlated quadratic-Speed-Dependent Hard-Collision
     #      Subroutine to Compute the complex normalized spectral shape of an 
@@ -17837,6 +19877,7 @@ def pcqsdhc(sg0,GamD,Gam0,Gam2,Shift0,Shift2,anuVC,eta,sg):
     #      Shift0     : Speed-averaged line-shift in cm-1 (Input).
     #      Shift2     : Speed dependence of the line-shift in cm-1 (Input)       
     #      sg         : Current WaveNumber of the Computation in cm-1 (Input).
+    #      CPF        : Complex Probability Function, see getCPF (Input, optional).
     #
     #      Output Quantities (through Common Statements)
     #      -----------------
@@ -17858,6 +19899,8 @@ def pcqsdhc(sg0,GamD,Gam0,Gam2,Shift0,Shift2,anuVC,eta,sg):
     if type(sg) not in set([array,ndarray,list,tuple]):
         sg = array([sg])
     
+    CPF = getCPF(CPF)
+
     number_of_points = len(sg)
     Aterm_GLOBAL = zeros(number_of_points,dtype=__ComplexType__)
     Bterm_GLOBAL = zeros(number_of_points,dtype=__ComplexType__)
@@ -17876,7 +19919,7 @@ def pcqsdhc(sg0,GamD,Gam0,Gam2,Shift0,Shift2,anuVC,eta,sg):
         Z1 = (iz*(sg0 - sg) + c0t) * cte
         xZ1 = -Z1.imag
         yZ1 = Z1.real
-        WR1,WI1 = VARIABLES['CPF'](xZ1,yZ1)
+        WR1,WI1 = CPF(xZ1,yZ1)
         Aterm_GLOBAL = rpi*cte*__ComplexType__(WR1 + 1.0e0j*WI1)
         index_Z1 = abs(Z1) <= 4.0e3
         index_NOT_Z1 = ~index_Z1
@@ -17925,8 +19968,8 @@ def pcqsdhc(sg0,GamD,Gam0,Gam2,Shift0,Shift2,anuVC,eta,sg):
                 WR2_PART4[index_CPF3] = WR2
                 WI2_PART4[index_CPF3] = WI2
             if any(index_CPF):
-                WR1,WI1 = VARIABLES['CPF'](xZ1[index_CPF],yZ1[index_CPF])
-                WR2,WI2 = VARIABLES['CPF'](xZ2[index_CPF],yZ2[index_CPF])
+                WR1,WI1 = CPF(xZ1[index_CPF],yZ1[index_CPF])
+                WR2,WI2 = CPF(xZ2[index_CPF],yZ2[index_CPF])
                 WR1_PART4[index_CPF] = WR1
                 WI1_PART4[index_CPF] = WI1
                 WR2_PART4[index_CPF] = WR2
@@ -17948,8 +19991,8 @@ def pcqsdhc(sg0,GamD,Gam0,Gam2,Shift0,Shift2,anuVC,eta,sg):
             yZ1 = Z1.real
             xZ2 = -Z2.imag
             yZ2 = Z2.real
-            WR1_PART2,WI1_PART2 = VARIABLES['CPF'](xZ1,yZ1)
-            WR2_PART2,WI2_PART2 = VARIABLES['CPF'](xZ2,yZ2) 
+            WR1_PART2,WI1_PART2 = CPF(xZ1,yZ1)
+            WR2_PART2,WI2_PART2 = CPF(xZ2,yZ2) 
             Aterm = rpi*cte*(__ComplexType__(WR1_PART2 + 1.0e0j*WI1_PART2) - __ComplexType__(WR2_PART2 + 1.0e0j*WI2_PART2))
             Bterm = (-1.0e0 +
                       rpi/(2.0e0*csqrtY)*(1.0e0 - Z1**2)*__ComplexType__(WR1_PART2 + 1.0e0j*WI1_PART2)-
@@ -17962,7 +20005,7 @@ def pcqsdhc(sg0,GamD,Gam0,Gam2,Shift0,Shift2,anuVC,eta,sg):
             X_TMP = X[index_PART3]
             xZ1 = -sqrt(X_TMP + Y).imag
             yZ1 = sqrt(X_TMP + Y).real
-            WR1_PART3,WI1_PART3 =  VARIABLES['CPF'](xZ1,yZ1) 
+            WR1_PART3,WI1_PART3 =  CPF(xZ1,yZ1) 
             index_ABS = abs(sqrt(X_TMP)) <= 4.0e3
             index_NOT_ABS = ~index_ABS
             Aterm = zeros(len(index_PART3),dtype=__ComplexType__)
@@ -17970,7 +20013,7 @@ def pcqsdhc(sg0,GamD,Gam0,Gam2,Shift0,Shift2,anuVC,eta,sg):
             if any(index_ABS):
                 xXb = -sqrt(X).imag
                 yXb = sqrt(X).real
-                WRb,WIb = VARIABLES['CPF'](xXb,yXb)
+                WRb,WIb = CPF(xXb,yXb)
                 Aterm[index_ABS] = (2.0e0*rpi/c2t)*(1.0e0/rpi - sqrt(X_TMP[index_ABS])*__ComplexType__(WRb + 1.0e0j*WIb))
                 Bterm[index_ABS] = (1.0e0/c2t)*(-1.0e0+
                                   2.0e0*rpi*(1.0e0 - X_TMP[index_ABS]-2.0e0*Y)*(1.0e0/rpi-sqrt(X_TMP[index_ABS])*__ComplexType__(WRb + 1.0e0j*WIb))+
@@ -17993,7 +20036,7 @@ def pcqsdhc(sg0,GamD,Gam0,Gam2,Shift0,Shift2,anuVC,eta,sg):
 
 # set interfaces for profiles
 
-def PROFILE_HT(sg0,GamD,Gam0,Gam2,Shift0,Shift2,anuVC,eta,sg):
+def PROFILE_HT(sg0,GamD,Gam0,Gam2,Shift0,Shift2,anuVC,eta,sg,CPF=None):
     """
     #-------------------------------------------------
     #      "pCqSDHC": partially-Correlated quadratic-Speed-Dependent Hard-Collision
@@ -18031,6 +20074,7 @@ def PROFILE_HT(sg0,GamD,Gam0,Gam2,Shift0,Shift2,anuVC,eta,sg):
     #      Shift0  : Speed-averaged line-shift in cm-1 (Input).
     #      Shift2  : Speed dependence of the line-shift in cm-1 (Input)       
     #      sg      : Current WaveNumber of the Computation in cm-1 (Input).
+    #      CPF     : Complex Probability Function, see getCPF (Input, optional).
     #
     #      The function has two outputs:
     #      -----------------
@@ -18044,11 +20088,11 @@ def PROFILE_HT(sg0,GamD,Gam0,Gam2,Shift0,Shift2,anuVC,eta,sg):
     #
     #-------------------------------------------------
     """
-    return pcqsdhc(sg0,GamD,Gam0,Gam2,Shift0,Shift2,anuVC,eta,sg)
+    return pcqsdhc(sg0,GamD,Gam0,Gam2,Shift0,Shift2,anuVC,eta,sg,CPF)
 
 PROFILE_HTP = PROFILE_HT # stub for backwards compatibility
 
-def PROFILE_SDRAUTIAN(sg0,GamD,Gam0,Gam2,Shift0,Shift2,anuVC,sg):
+def PROFILE_SDRAUTIAN(sg0,GamD,Gam0,Gam2,Shift0,Shift2,anuVC,sg,CPF=None):
     """
     # Speed dependent Rautian profile based on HTP.
     # Input parameters:
@@ -18060,10 +20104,11 @@ def PROFILE_SDRAUTIAN(sg0,GamD,Gam0,Gam2,Shift0,Shift2,anuVC,sg):
     #      Shift0  : Speed-averaged line-shift in cm-1 (Input).
     #      Shift2  : Speed dependence of the line-shift in cm-1 (Input)       
     #      sg      : Current WaveNumber of the Computation in cm-1 (Input).
+    #      CPF     : Complex Probability Function, see getCPF (Input, optional).
     """
-    return pcqsdhc(sg0,GamD,Gam0,Gam2,Shift0,Shift2,anuVC,cZero,sg)
+    return pcqsdhc(sg0,GamD,Gam0,Gam2,Shift0,Shift2,anuVC,cZero,sg,CPF)
 
-def PROFILE_RAUTIAN(sg0,GamD,Gam0,Shift0,anuVC,eta,sg):
+def PROFILE_RAUTIAN(sg0,GamD,Gam0,Shift0,anuVC,eta,sg,CPF=None):
     """
     # Rautian profile based on HTP.
     # Input parameters:
@@ -18073,10 +20118,11 @@ def PROFILE_RAUTIAN(sg0,GamD,Gam0,Shift0,anuVC,eta,sg):
     #      anuVC   : Velocity-changing frequency in cm-1 (Input).
     #      Shift0  : Speed-averaged line-shift in cm-1 (Input).
     #      sg      : Current WaveNumber of the Computation in cm-1 (Input).
+    #      CPF     : Complex Probability Function, see getCPF (Input, optional).
     """
-    return pcqsdhc(sg0,GamD,Gam0,cZero,Shift0,cZero,anuVC,cZero,sg)
+    return pcqsdhc(sg0,GamD,Gam0,cZero,Shift0,cZero,anuVC,cZero,sg,CPF)
 
-def PROFILE_SDVOIGT(sg0,GamD,Gam0,Gam2,Shift0,Shift2,sg):
+def PROFILE_SDVOIGT(sg0,GamD,Gam0,Gam2,Shift0,Shift2,sg,CPF=None):
     """
     # Speed dependent Voigt profile based on HTP.
     # Input parameters:
@@ -18087,10 +20133,11 @@ def PROFILE_SDVOIGT(sg0,GamD,Gam0,Gam2,Shift0,Shift2,sg):
     #      Shift0  : Speed-averaged line-shift in cm-1 (Input).
     #      Shift2  : Speed dependence of the line-shift in cm-1 (Input)       
     #      sg      : Current WaveNumber of the Computation in cm-1 (Input).
+    #      CPF     : Complex Probability Function, see getCPF (Input, optional).
     """
-    return pcqsdhc(sg0,GamD,Gam0,Gam2,Shift0,Shift2,cZero,cZero,sg)
+    return pcqsdhc(sg0,GamD,Gam0,Gam2,Shift0,Shift2,cZero,cZero,sg,CPF)
     
-def PROFILE_VOIGT(sg0,GamD,Gam0,sg):
+def PROFILE_VOIGT(sg0,GamD,Gam0,sg,CPF=None):
     """
     # Voigt profile based on HTP.
     # Input parameters:
@@ -18098,8 +20145,9 @@ def PROFILE_VOIGT(sg0,GamD,Gam0,sg):
     #   GamD: Doppler HWHM in cm-1 (Input)
     #   Gam0: Speed-averaged line-width in cm-1 (Input).       
     #   sg: Current WaveNumber of the Computation in cm-1 (Input).
+    #   CPF: Complex Probability Function, see getCPF (Input, optional).
     """
-    return PROFILE_HTP(sg0,GamD,Gam0,cZero,cZero,cZero,cZero,cZero,sg)
+    return PROFILE_HTP(sg0,GamD,Gam0,cZero,cZero,cZero,cZero,cZero,sg,CPF)
 
 def PROFILE_LORENTZ(sg0,Gam0,sg):
     """
@@ -18194,6 +20242,8 @@ def getDefaultValuesForXsect(Components,SourceTables,Environment,OmegaRange,
                              OmegaStep,OmegaWing,IntensityThreshold,Format):
     if SourceTables[0] == None:
         SourceTables = ['__BUFFER__',]
+    for TableName in SourceTables:
+        loadTableOnDemand(TableName)
     if Environment == None:
         Environment = {'T':296., 'p':1.}
     if Components == [None]:
@@ -18260,6 +20310,164 @@ def save_to_file(fname,fformat,*arg):
 
 
 
+# Line parameters are computed for all lines of a table at once as numpy arrays:
+#  getLineParameters resolves the lines of the components, their intensities
+#  and scaling factors, the profile functions add the broadening parameters;
+#  only the lineshapes are evaluated line by line.
+
+def getLineColumn(TableName,par_name,RowIDs,default=None):
+    # float values of the column for the lines RowIDs;
+    #  default for the missing column (KeyError if default is None)
+    data = LOCAL_TABLE_CACHE[TableName]['data']
+    if par_name not in data:
+        if default is None:
+            raise KeyError(par_name)
+        return np.full(len(RowIDs),default,dtype=float64)
+    return np.asarray(gatherColumn(data[par_name],RowIDs),dtype=float64)
+
+def getLineColumnHT(TableName,NameHT,Name,RowIDs,default):
+    # values of the HT-style column, taken from the Voigt-style one (or default)
+    #  for the lines where they are zero; also return the mask of the lines
+    #  which use the HT-style values
+    if NameHT in LOCAL_TABLE_CACHE[TableName]['data']:
+        ValuesHT = getLineColumn(TableName,NameHT,RowIDs)
+        UseHT = ValuesHT!=0.
+    else:
+        ValuesHT = None
+        UseHT = zeros(len(RowIDs),dtype=bool)
+    if np.all(UseHT):
+        return ValuesHT,UseHT
+    Values = getLineColumn(TableName,Name,RowIDs,default)
+    if ValuesHT is not None:
+        Values = where(UseHT,ValuesHT,Values)
+    return Values,UseHT
+
+def getTempRatioPower(TableName,species,RowIDs):
+    # temperature exponent of the broadening by the species,
+    #  n_air for the missing column and for zero values of n_self
+    n_name = 'n_' + species
+    if n_name not in LOCAL_TABLE_CACHE[TableName]['data']:
+        return getLineColumn(TableName,'n_air',RowIDs)
+    TempRatioPowerDB = getLineColumn(TableName,n_name,RowIDs)
+    if species == 'self' and np.any(TempRatioPowerDB==0.):
+        TempRatioPowerDB = where(TempRatioPowerDB==0.,getLineColumn(TableName,'n_air',RowIDs),
+                                 TempRatioPowerDB)
+    return TempRatioPowerDB
+
+def applyCustomValues(Values,Lines,par_name):
+    # replace the values by the ones given by EnvDependences for the lines
+    if Lines['Custom'] is not None:
+        for i,CustomEnvDependences in enumerate(Lines['Custom']):
+            if par_name in CustomEnvDependences:
+                Values[i] = CustomEnvDependences[par_name]
+    return Values
+
+def getLineParameters(TableName,ABUNDANCES,NATURAL_ABUNDANCES,partitionFunction,
+                      T,Tref,factor,IntensityThreshold,EnvDependences=None,Env=None):
+    # parameters of the lines of the components which pass the intensity threshold:
+    #  'RowIDs','nu','molec_id','local_iso_id','Mass' (molecular mass),
+    #  'LineIntensity','LineFactor' (scaling of the lineshape),
+    #  'Custom' (dictionaries returned by EnvDependences, None without it)
+    data = LOCAL_TABLE_CACHE[TableName]['data']
+    MoleculeNumberDB = np.asarray(data['molec_id'])
+    IsoNumberDB = np.asarray(data['local_iso_id'])
+    # filter by molecule and isotopologue
+    ComponentMask = zeros(len(MoleculeNumberDB),dtype=bool)
+    for M,I in ABUNDANCES:
+        ComponentMask |= (MoleculeNumberDB==M) & (IsoNumberDB==I)
+    RowIDs = np.flatnonzero(ComponentMask)
+    MoleculeNumberDB = MoleculeNumberDB[RowIDs]
+    IsoNumberDB = IsoNumberDB[RowIDs]
+    LineCenterDB = getLineColumn(TableName,'nu',RowIDs)
+    LineIntensityDB = getLineColumn(TableName,'sw',RowIDs)
+    LowerStateEnergyDB = getLineColumn(TableName,'elower',RowIDs)
+    # partition functions, masses and abundances are the same for all lines of a component
+    SigmaT = zeros(len(RowIDs)); SigmaTref = zeros(len(RowIDs))
+    Mass = zeros(len(RowIDs)); AbundanceFactor = zeros(len(RowIDs))
+    for M,I in ABUNDANCES:
+        ComponentRows = (MoleculeNumberDB==M) & (IsoNumberDB==I)
+        if not np.any(ComponentRows): continue
+        SigmaT[ComponentRows] = partitionFunction(M,I,T)
+        SigmaTref[ComponentRows] = partitionFunction(M,I,Tref)
+        Mass[ComponentRows] = molecularMass(M,I)
+        AbundanceFactor[ComponentRows] = factor / NATURAL_ABUNDANCES[(M,I)] * ABUNDANCES[(M,I)]
+    Lines = {'Custom':None}
+    if EnvDependences:
+        parnames = list(data.keys())
+        Lines['Custom'] = [EnvDependences(Env,{parname:data[parname][RowID] for parname in parnames})
+                           for RowID in RowIDs.tolist()]
+    LineIntensity = EnvironmentDependency_Intensity(LineIntensityDB,T,Tref,SigmaT,SigmaTref,
+                                                    LowerStateEnergyDB,LineCenterDB)
+    LineIntensity = applyCustomValues(LineIntensity,Lines,'sw')
+    # FILTER by LineIntensity: compare it with IntencityThreshold
+    Keep = ~(LineIntensity < IntensityThreshold)
+    if Lines['Custom'] is not None:
+        Lines['Custom'] = [Custom for Custom,keep in zip(Lines['Custom'],Keep) if keep]
+    Lines['RowIDs'] = RowIDs[Keep]
+    Lines['nu'] = LineCenterDB[Keep]
+    Lines['molec_id'] = MoleculeNumberDB[Keep]
+    Lines['local_iso_id'] = IsoNumberDB[Keep]
+    Lines['Mass'] = Mass[Keep]
+    Lines['LineIntensity'] = LineIntensity[Keep]
+    Lines['LineFactor'] = AbundanceFactor[Keep] * Lines['LineIntensity']
+    return Lines
+
+def getLineBounds(Omegas,LineCenter,OmegaWingF):
+    # bounds of the lineshapes on the grid (same as bisect for every line)
+    BoundIndexLower = np.searchsorted(Omegas,LineCenter-OmegaWingF,side='right')
+    BoundIndexUpper = np.searchsorted(Omegas,LineCenter+OmegaWingF,side='right')
+    return BoundIndexLower.tolist(),BoundIndexUpper.tolist()
+
+# Evaluate the lineshapes of many lines in one call instead of line by line
+#  (absorptionCoefficient_Voigt, _Lorentz and _Doppler; can be set per call by BatchLines).
+VARIABLES['BATCH_LINES'] = False
+
+# maximal number of grid points (with padding) of a batch of lineshapes
+LINESHAPE_BATCH_SIZE = 2**18
+# lines wider than this (in grid points) are cheaper to add one by one
+LINESHAPE_BATCH_WIDTH = 2048
+
+def addLineshapesBatched(Xsect,Omegas,BoundIndexLower,BoundIndexUpper,LineFactor,
+                         Profile,*LineParameters):
+    # add LineFactor*Profile(*LineParameters,sg) of all lines to Xsect;
+    #  lines are grouped by the number of grid points within their wings
+    #  (rounded up to 1/16 of the next power of 2, so the padding stays below 1/8),
+    #  the lineshapes of a group are evaluated on a padded 2-D grid in a single
+    #  call of Profile, which must be elementwise in all its arguments,
+    #  and scattered onto Xsect by bincount; lines wider than LINESHAPE_BATCH_WIDTH
+    #  are added one by one
+    BoundIndexLower = np.asarray(BoundIndexLower,dtype=int)
+    Widths = np.asarray(BoundIndexUpper,dtype=int) - BoundIndexLower
+    for i in np.flatnonzero(Widths>LINESHAPE_BATCH_WIDTH).tolist():
+        lower = BoundIndexLower[i]; upper = lower + Widths[i]
+        lineshape_vals = Profile(*[Parameter[i] for Parameter in LineParameters],Omegas[lower:upper])
+        Xsect[lower:upper] += LineFactor[i] * lineshape_vals
+    Lines = np.flatnonzero((Widths>0) & (Widths<=LINESHAPE_BATCH_WIDTH))
+    if len(Lines)==0: return Xsect
+    # neighbouring lines go to the same batch, so that it covers a short part of the grid
+    Lines = Lines[np.argsort(BoundIndexLower[Lines],kind='stable')]
+    Quanta = np.left_shift(1,np.maximum(np.ceil(np.log2(Widths[Lines])).astype(int)-4,0))
+    PaddedWidths = -(-Widths[Lines]//Quanta)*Quanta
+    number_of_points = len(Xsect)
+    for PaddedWidth in np.unique(PaddedWidths):
+        GroupLines = Lines[PaddedWidths==PaddedWidth]
+        Offsets = np.arange(PaddedWidth)
+        BatchLength = max(LINESHAPE_BATCH_SIZE//PaddedWidth,1)
+        for start in range(0,len(GroupLines),BatchLength):
+            Batch = GroupLines[start:start+BatchLength]
+            Indexes = BoundIndexLower[Batch,None] + Offsets[None,:]
+            np.minimum(Indexes,number_of_points-1,out=Indexes)
+            lineshape_vals = Profile(*[Parameter[Batch,None] for Parameter in LineParameters],
+                                     Omegas[Indexes])
+            lineshape_vals = LineFactor[Batch,None] * lineshape_vals
+            # padding points do not contribute
+            lineshape_vals[Offsets[None,:] >= Widths[Batch,None]] = 0.
+            IndexMin = Indexes[:,0].min(); IndexMax = Indexes[:,-1].max()
+            Indexes -= IndexMin
+            Xsect[IndexMin:IndexMax+1] += np.bincount(Indexes.ravel(),weights=lineshape_vals.ravel(),
+                                                      minlength=IndexMax-IndexMin+1)
+    return Xsect
+
 def absorptionCoefficient_HT(Components=None,SourceTables=None,partitionFunction=PYTIPS2017,
                                 Environment=None,OmegaRange=None,OmegaStep=None,OmegaWing=None,
                                 IntensityThreshold=DefaultIntensityThreshold,
@@ -18268,7 +20476,7 @@ def absorptionCoefficient_HT(Components=None,SourceTables=None,partitionFunction
                                 File=None, Format=None, OmegaGrid=None,
                                 WavenumberRange=None,WavenumberStep=None,WavenumberWing=None,
                                 WavenumberWingHW=None,WavenumberGrid=None,
-                                Diluent={},EnvDependences=None):
+                                Diluent={},EnvDependences=None,CPF=None):
     """
     INPUT PARAMETERS: 
         Components:  list of tuples [(M,I,D)], where
@@ -18290,6 +20498,7 @@ def absorptionCoefficient_HT(Components=None,SourceTables=None,partitionFunction
         HITRAN_units:  use cm2/molecule (True) or cm-1 (False) for absorption coefficient
         File:   write output to file (if specified)
         Format:  c-format of file output (accounts for significant digits in WavenumberStep)
+        CPF:  complex probability function, name in CPF_MAP or function (default is VARIABLES['CPF'])
     OUTPUT PARAMETERS: 
         Wavenum: wavenumber grid with respect to parameters WavenumberRange and WavenumberStep
         Xsect: absorption coefficient calculated on the grid
@@ -18316,6 +20525,7 @@ def absorptionCoefficient_HT(Components=None,SourceTables=None,partitionFunction
     if WavenumberWing:   OmegaWing=WavenumberWing
     if WavenumberWingHW: OmegaWingHW=WavenumberWingHW
     if WavenumberGrid:   OmegaGrid=WavenumberGrid
+    CPF = getCPF(CPF)
 
     # "bug" with 1-element list
     Components = listOfTuples(Components)
@@ -18380,9 +20590,6 @@ def absorptionCoefficient_HT(Components=None,SourceTables=None,partitionFunction
         factor = volumeConcentration(p,T)
     if VARIABLES['DEBUG']: print('absorptionCoefficient_HT: factor=%f'%factor)        
         
-    # setup the default empty environment dependence function
-    if not EnvDependences:
-        EnvDependences = lambda ENV,LINE:{}
     Env = Environment.copy()
     Env['Tref'] = Tref
     Env['pref'] = pref
@@ -18408,208 +20615,104 @@ def absorptionCoefficient_HT(Components=None,SourceTables=None,partitionFunction
     # SourceTables contain multiple tables
     for TableName in SourceTables:
 
-        # get the number of rows
-        nline = LOCAL_TABLE_CACHE[TableName]['header']['number_of_rows']
+        # parameters of all lines of the table at once
+        Lines = getLineParameters(TableName,ABUNDANCES,NATURAL_ABUNDANCES,partitionFunction,
+                                  T,Tref,factor,IntensityThreshold,
+                                  EnvDependences,Env)
+        RowIDs = Lines['RowIDs']
+        LineCenterDB = Lines['nu']
+        LineFactor = Lines['LineFactor']
         
-        # get parameter names for each table
-        parnames = LOCAL_TABLE_CACHE[TableName]['data'].keys()
+        #   doppler broadening coefficient (GammaD)
+        cMassMol = 1.66053873e-27 # hapi
+        m = Lines['Mass'] * cMassMol * 1000
+        GammaD = sqrt(2*cBolts*T*log(2)/m/cc**2)*LineCenterDB
         
-        # loop through line centers (single stream)
-        for RowID in range(nline):
+        #   pressure broadening coefficient
+        Gamma0 = zeros(len(RowIDs)); Shift0 = zeros(len(RowIDs)); Gamma2 = zeros(len(RowIDs))
+        Shift2 = zeros(len(RowIDs)); NuVC = zeros(len(RowIDs)); EtaNumer = zeros(len(RowIDs),dtype=complex128)
+        for species in Diluent:
+            species_lower = species # species_lower = species.lower() # CHANGED RJH 23MAR18
             
-            # Get the custom environment dependences
-            Line = {}
-            for parname in parnames:
-                Line[parname] = LOCAL_TABLE_CACHE[TableName]['data'][parname][RowID]
-            CustomEnvDependences = EnvDependences(Env,Line)
+            abun = Diluent[species]
             
-            # get basic line parameters (lower level)
-            LineCenterDB = LOCAL_TABLE_CACHE[TableName]['data']['nu'][RowID]
-            LineIntensityDB = LOCAL_TABLE_CACHE[TableName]['data']['sw'][RowID]
-            LowerStateEnergyDB = LOCAL_TABLE_CACHE[TableName]['data']['elower'][RowID]
-            MoleculeNumberDB = LOCAL_TABLE_CACHE[TableName]['data']['molec_id'][RowID]
-            IsoNumberDB = LOCAL_TABLE_CACHE[TableName]['data']['local_iso_id'][RowID]
+            # Broadening HWHM: HT-style name, Voigt-style name for the zero values.
+            Gamma0DB,_ = getLineColumnHT(TableName,'gamma_HT_0_%s_%d'%(species_lower,TrefHT),
+                                         'gamma_%s'%species_lower,RowIDs,0.0)
             
-            # filter by molecule and isotopologue
-            if (MoleculeNumberDB,IsoNumberDB) not in ABUNDANCES: continue
+            # Temperature exponent for broadening HWHM: the reference temperature is
+            #  TrefHT for HT-style values and 296K for Voigt-style ones.
+            if 'n_HT_%s_%d'%(species_lower,TrefHT) in LOCAL_TABLE_CACHE[TableName]['data']:
+                TempRatioPowerDB = getLineColumn(TableName,'n_HT_%s_%d'%(species_lower,TrefHT),RowIDs)
+                UseHT = TempRatioPowerDB!=0.
+                if not np.all(UseHT):
+                    TempRatioPowerDB = where(UseHT,TempRatioPowerDB,
+                                             getTempRatioPower(TableName,species_lower,RowIDs))
+            else:
+                TempRatioPowerDB = getTempRatioPower(TableName,species_lower,RowIDs)
+                UseHT = zeros(len(RowIDs),dtype=bool)
+            TrefGamma = where(UseHT,TrefHT,296.)
             
-            # partition functions for T and Tref
-            SigmaT = partitionFunction(MoleculeNumberDB,IsoNumberDB,T)
-            SigmaTref = partitionFunction(MoleculeNumberDB,IsoNumberDB,Tref)
+            # Add to the final Gamma0
+            Gamma0T = EnvironmentDependency_Gamma0(Gamma0DB,T,TrefGamma,p,pref,TempRatioPowerDB)
+            Gamma0T = applyCustomValues(Gamma0T,Lines,'gamma_%s'%species_lower)
+            Gamma0T = applyCustomValues(Gamma0T,Lines,'gamma_HT_0_%s_%d'%(species_lower,TrefHT))
+            Gamma0 += abun*Gamma0T
+
+            # Shift: HT-style name, Voigt-style name for the zero values.
+            Shift0DB,_ = getLineColumnHT(TableName,'delta_HT_0_%s_%d'%(species_lower,TrefHT),
+                                         'delta_%s'%species_lower,RowIDs,0.0)
             
-            # get all environment dependences from voigt parameters
+            # Temperature dependence for shift, with the reference temperature as above.
+            deltap,UseHT = getLineColumnHT(TableName,'deltap_HT_%s_%d'%(species_lower,TrefHT),
+                                           'deltap_%s'%species_lower,RowIDs,0.0)
+            TrefShift = where(UseHT,TrefHT,296.)
+
+            Shift0T = (Shift0DB + deltap*(T-TrefShift))*p/pref
+            Shift0T = applyCustomValues(Shift0T,Lines,'deltap_%s'%species_lower)
+            Shift0T = applyCustomValues(Shift0T,Lines,'deltap_HT_%s_%d'%(species_lower,TrefHT))
+            Shift0 += abun*Shift0T
             
-            #   intensity
-            if 'sw' in CustomEnvDependences:
-                LineIntensity = CustomEnvDependences['sw']
+            # Speed dependence for HWHM: HT-style name, SD_* times Gamma0DB for the zero values.
+            if 'gamma_HT_2_%s_%d'%(species_lower,TrefHT) in LOCAL_TABLE_CACHE[TableName]['data']:
+                Gamma2DB = getLineColumn(TableName,'gamma_HT_2_%s_%d'%(species_lower,TrefHT),RowIDs)
             else:
-                LineIntensity = EnvironmentDependency_Intensity(LineIntensityDB,T,Tref,SigmaT,SigmaTref,
-                                                                LowerStateEnergyDB,LineCenterDB)
+                Gamma2DB = zeros(len(RowIDs))
+            Gamma2DB = where(Gamma2DB!=0.,Gamma2DB,
+                             getLineColumn(TableName,'SD_%s'%species_lower,RowIDs,0.0)*Gamma0DB)
+
+            Gamma2 += abun*applyCustomValues(Gamma2DB*(p/pref),Lines,
+                                             'gamma_HT_2_%s_%d'%(species_lower,TrefHT))
             
-            #   FILTER by LineIntensity: compare it with IntencityThreshold
-            if LineIntensity < IntensityThreshold: continue
+            # Speed dependence for shift.
+            Shift2DB = getLineColumn(TableName,'delta_HT_2_%s_%d'%(species_lower,TrefHT),RowIDs,0.0)
             
-            #   doppler broadening coefficient (GammaD)
-            cMassMol = 1.66053873e-27 # hapi
-            m = molecularMass(MoleculeNumberDB,IsoNumberDB) * cMassMol * 1000
-            GammaD = sqrt(2*cBolts*T*log(2)/m/cc**2)*LineCenterDB
+            Shift2 += abun*applyCustomValues(Shift2DB*p/pref,Lines,
+                                             'delta_HT_2_%s_%d'%(species_lower,TrefHT))
             
-            #   pressure broadening coefficient
-            Gamma0 = 0.; Shift0 = 0.; Gamma2 = 0.; Shift2 = 0.; NuVC = 0.; EtaNumer = 0.;
-            for species in Diluent:
-                species_lower = species # species_lower = species.lower() # CHANGED RJH 23MAR18
-                
-                abun = Diluent[species]
-                
-                # Search for broadening HWHM.
-                try:
-                    # search for HT-style name
-                    Gamma0DB = LOCAL_TABLE_CACHE[TableName]['data']['gamma_HT_0_%s_%d'%(species_lower,TrefHT)][RowID]
-                    if Gamma0DB == 0.: raise KeyError
-                    if VARIABLES['DEBUG']: print('absorptionCoefficient_HT: Gamma0DB=%f (found as %s)'%(Gamma0DB,'gamma_HT_0_%s_%d'%(species_lower,TrefHT)))
-                except KeyError:
-                    try:
-                        # search for Voigt-style name
-                        Gamma0DB = LOCAL_TABLE_CACHE[TableName]['data']['gamma_%s'%species_lower][RowID]
-                        if VARIABLES['DEBUG']: print('absorptionCoefficient_HT: Gamma0DB=%f (found as %s)'%(Gamma0DB,'gamma_%s'%species_lower))
-                    except KeyError:
-                        Gamma0DB = 0.0
-                        if VARIABLES['DEBUG']: print('absorptionCoefficient_HT: Gamma0DB=%f (not found in database)'%Gamma0DB)
-                
-                # Search for temperature exponent for broadening HWHM.
-                try:
-                    # search for HT-style name
-                    TempRatioPowerDB = LOCAL_TABLE_CACHE[TableName]['data']['n_HT_%s_%d'%(species_lower,TrefHT)][RowID]
-                    if TempRatioPowerDB == 0.: raise KeyError
-                    Tref = TrefHT
-                    if VARIABLES['DEBUG']: print('absorptionCoefficient_HT: TempRatioPowerDB=%f (found as %s)'%(TempRatioPowerDB,'n_HT_%s_%d'%(species_lower,TrefHT)))
-                except KeyError:
-                    Tref = 296.
-                    try:
-                        # search for Voigt-style name
-                        TempRatioPowerDB = LOCAL_TABLE_CACHE[TableName]['data']['n_%s'%species_lower][RowID]
-                        if VARIABLES['DEBUG']: print('absorptionCoefficient_HT: TempRatioPowerDB=%f (found as %s). Tref is set to 296K.'%(TempRatioPowerDB,'n_%s'%species_lower))
-                        if species_lower == 'self' and TempRatioPowerDB == 0.:
-                            TempRatioPowerDB = LOCAL_TABLE_CACHE[TableName]['data']['n_air'][RowID] # same for self as for air
-                            if VARIABLES['DEBUG']: print('absorptionCoefficient_HT: using n_air for self species because n_self=0.0')
-                    except KeyError:
-                        #print('TempRatioPowerDB is set to zero')
-                        #TempRatioPowerDB = 0                    
-                        TempRatioPowerDB = LOCAL_TABLE_CACHE[TableName]['data']['n_air'][RowID]
-                        if VARIABLES['DEBUG']: print('absorptionCoefficient_HT: TempRatioPowerDB=%f (found as n_air). Tref is set to 296K.'%TempRatioPowerDB)
+            # Frequency of VC and its temperature exponent
+            NuVCDB = getLineColumn(TableName,'nu_HT_%s'%species_lower,RowIDs,0.0)
+            KappaDB = getLineColumn(TableName,'kappa_HT_%s'%species_lower,RowIDs,0.0)
                 
-                # Add to the final Gamma0
-                Gamma0T = CustomEnvDependences.get('gamma_HT_0_%s_%d'%(species_lower,TrefHT),
-                           CustomEnvDependences.get('gamma_%s'%species_lower, 
-                            EnvironmentDependency_Gamma0(Gamma0DB,T,Tref,p,pref,TempRatioPowerDB)))
-                Gamma0 += abun*Gamma0T
+            NuVC += abun*applyCustomValues(NuVCDB*(TrefShift/T)**KappaDB*p,Lines,
+                                           'nu_HT_%s'%species_lower)
+                         
+            # Setup correlation parameter
+            EtaDB = getLineColumn(TableName,'eta_HT_%s'%species_lower,RowIDs,0.0)
+            
+            EtaNumer += EtaDB*abun*(Gamma0T+1j*Shift0T)
+            
+        Eta = EtaNumer/(Gamma0 + 1j*Shift0)
+        
+        #   get final wing of the line according to Gamma0, OmegaWingHW and OmegaWing
+        OmegaWingF = maximum(maximum(OmegaWing,OmegaWingHW*Gamma0),OmegaWingHW*GammaD)
+        BoundIndexLower,BoundIndexUpper = getLineBounds(Omegas,LineCenterDB,OmegaWingF)
 
-                # Search for shift.
-                try:
-                    # search for HT-style name
-                    Shift0DB = LOCAL_TABLE_CACHE[TableName]['data']['delta_HT_0_%s_%d'%(species_lower,TrefHT)][RowID]
-                    if Shift0DB == 0.: raise KeyError
-                    if VARIABLES['DEBUG']: print('absorptionCoefficient_HT: Shift0DB=%f (found as %s)'%(Shift0DB,'delta_HT_0_%s_%d'%(species_lower,TrefHT)))
-                except KeyError:
-                    try:
-                        # search for Voigt-style name
-                        Shift0DB = LOCAL_TABLE_CACHE[TableName]['data']['delta_%s'%species_lower][RowID]
-                        if VARIABLES['DEBUG']: print('absorptionCoefficient_HT: Shift0DB=%f (found as %s)'%(Shift0DB,'delta_%s'%species_lower))
-                    except KeyError:
-                        Shift0DB = 0.0
-                        if VARIABLES['DEBUG']: print('absorptionCoefficient_HT: Shift0DB=%f (not found in database)'%Shift0DB)
-                
-                # Search for temperature dependence for shift.
-                try:
-                    # search for HT-style name
-                    deltap = LOCAL_TABLE_CACHE[TableName]['data']['deltap_HT_%s_%d'%(species_lower,TrefHT)][RowID]
-                    if deltap ==0.: raise KeyError
-                    Tref = TrefHT
-                    if VARIABLES['DEBUG']: print('absorptionCoefficient_HT: deltap=%f (found as %s)'%(deltap,'deltap_HT_%s_%d'%(species_lower,TrefHT)))
-                except KeyError:
-                    Tref = 296.
-                    try:
-                        # search for Voigt-style name
-                        deltap = LOCAL_TABLE_CACHE[TableName]['data']['deltap_%s'%species_lower][RowID]
-                        if VARIABLES['DEBUG']: print('absorptionCoefficient_HT: deltap=%f (found as %s). Tref is set to 296K.'%(deltap,'deltap_%s'%species_lower))
-                    except KeyError:
-                        deltap = 0.0
-                        if VARIABLES['DEBUG']: print('absorptionCoefficient_HT: deltap=%f (not found in database)'%deltap)
-
-                Shift0T = CustomEnvDependences.get('deltap_HT_%s_%d'%(species_lower,TrefHT),
-                                CustomEnvDependences.get('deltap_%s'%species_lower,
-                                 ((Shift0DB + deltap*(T-Tref))*p/pref)))
-                Shift0 += abun*Shift0T
-                
-                # Search for speed dependence for HWHM.
-                try:
-                    Gamma2DB = LOCAL_TABLE_CACHE[TableName]['data']['gamma_HT_2_%s_%d'%(species_lower,TrefHT)][RowID]
-                    if Gamma2DB ==0.: raise KeyError
-                    if VARIABLES['DEBUG']: print('absorptionCoefficient_HT: Gamma2DB=%f (found as %s)'%(Gamma2DB,'gamma_HT_2_%s_%d'%(species_lower,TrefHT)))
-                except KeyError:
-                    try:
-                        SDDB = LOCAL_TABLE_CACHE[TableName]['data']['SD_%s'%species_lower][RowID]
-                        Gamma2DB = SDDB*Gamma0DB
-                        if VARIABLES['DEBUG']: print('absorptionCoefficient_HT: SDDB=%f (found as %s)'%(SDDB,'SD_%s'%species_lower))
-                        if VARIABLES['DEBUG']: print('absorptionCoefficient_HT: Gamma2DB = SDDB*Gamma0DB')
-                    except KeyError:
-                        Gamma2DB = 0.0
-                        if VARIABLES['DEBUG']: print('absorptionCoefficient_HT: Gamma2DB=%f (not found in database)'%Gamma2DB)
-
-                Gamma2 += abun*CustomEnvDependences.get('gamma_HT_2_%s_%d'%(species_lower,TrefHT),Gamma2DB*(p/pref))
-                
-                # Search for speed dependence for shift.
-                try:
-                    Shift2DB = LOCAL_TABLE_CACHE[TableName]['data']['delta_HT_2_%s_%d'%(species_lower,TrefHT)][RowID]
-                    if VARIABLES['DEBUG']: print('absorptionCoefficient_HT: Shift2DB=%f (found as %s)'%(Shift2DB,'delta_HT_2_%s_%d'%(species_lower,TrefHT)))
-                except KeyError:
-                    Shift2DB = 0.
-                    if VARIABLES['DEBUG']: print('absorptionCoefficient_HT: Shift2DB=%f (not found in database)'%Shift2DB)
-                
-                Shift2 += abun*CustomEnvDependences.get('delta_HT_2_%s_%d'%(species_lower,TrefHT),
-                                Shift2DB*p/pref)
-                
-                # Search for frequency of VC
-                try:
-                    NuVCDB = LOCAL_TABLE_CACHE[TableName]['data']['nu_HT_%s'%species_lower][RowID]
-                    if VARIABLES['DEBUG']: print('absorptionCoefficient_HT: NuVCDB=%f (found as %s)'%(NuVCDB,'nu_HT_%s'%species_lower))
-                except KeyError:
-                    NuVCDB = 0.
-                    if VARIABLES['DEBUG']: print('absorptionCoefficient_HT: NuVCDB=%f (not found in database)'%NuVCDB)
-                
-                # Search for temperature exponent for frequency of VC
-                try:
-                    KappaDB = LOCAL_TABLE_CACHE[TableName]['data']['kappa_HT_%s'%species_lower][RowID]
-                    if VARIABLES['DEBUG']: print('absorptionCoefficient_HT: KappaDB=%f (found as %s)'%(KappaDB,'kappa_HT_%s'%species_lower))
-                except KeyError:
-                    KappaDB = 0.
-                    if VARIABLES['DEBUG']: print('absorptionCoefficient_HT: KappaDB=%f (not found in database)'%KappaDB)
-                    
-                NuVC += abun*CustomEnvDependences.get('nu_HT_%s'%species_lower,
-                             NuVCDB*(Tref/T)**KappaDB*p)
-                             
-                # Setup correlation parameter
-                try:
-                    EtaDB = LOCAL_TABLE_CACHE[TableName]['data']['eta_HT_%s'%species_lower][RowID]
-                    if VARIABLES['DEBUG']: print('absorptionCoefficient_HT: EtaDB=%f (found as %s)'%(EtaDB,'eta_HT_%s'%species_lower))
-                except KeyError:
-                    EtaDB = 0.
-                    if VARIABLES['DEBUG']: print('absorptionCoefficient_HT: EtaDB=%f (not found in database)'%EtaDB)
-                
-                EtaNumer += EtaDB*abun*(Gamma0T+1j*Shift0T)
-                
-            Eta = EtaNumer/(Gamma0 + 1j*Shift0)
-                    
-            #   get final wing of the line according to Gamma0, OmegaWingHW and OmegaWing
-            OmegaWingF = max(OmegaWing,OmegaWingHW*Gamma0,OmegaWingHW*GammaD)
-
-            BoundIndexLower = bisect(Omegas,LineCenterDB-OmegaWingF)
-            BoundIndexUpper = bisect(Omegas,LineCenterDB+OmegaWingF)
-            lineshape_vals = PROFILE_HT(LineCenterDB,GammaD,Gamma0,Gamma2,Shift0,Shift2,NuVC,Eta,Omegas[BoundIndexLower:BoundIndexUpper])[0]
-            Xsect[BoundIndexLower:BoundIndexUpper] += factor / NATURAL_ABUNDANCES[(MoleculeNumberDB,IsoNumberDB)] * \
-                                                      ABUNDANCES[(MoleculeNumberDB,IsoNumberDB)] * \
-                                                      LineIntensity * lineshape_vals
-   
+        # loop through line centers (single stream)
+        for i in range(len(RowIDs)):
+            lineshape_vals = PROFILE_HT(LineCenterDB[i],GammaD[i],Gamma0[i],Gamma2[i],Shift0[i],Shift2[i],NuVC[i],Eta[i],Omegas[BoundIndexLower[i]:BoundIndexUpper[i]],CPF)[0]
+            Xsect[BoundIndexLower[i]:BoundIndexUpper[i]] += LineFactor[i] * lineshape_vals
+    
     if File: save_to_file(File,Format,Omegas,Xsect)
     return Omegas,Xsect
     
@@ -18622,7 +20725,7 @@ def absorptionCoefficient_SDVoigt(Components=None,SourceTables=None,partitionFun
                                 File=None, Format=None, OmegaGrid=None,
                                 WavenumberRange=None,WavenumberStep=None,WavenumberWing=None,
                                 WavenumberWingHW=None,WavenumberGrid=None,
-                                Diluent={},EnvDependences=None):
+                                Diluent={},EnvDependences=None,CPF=None):
     """
     INPUT PARAMETERS: 
         Components:  list of tuples [(M,I,D)], where
@@ -18644,6 +20747,7 @@ def absorptionCoefficient_SDVoigt(Components=None,SourceTables=None,partitionFun
         HITRAN_units:  use cm2/molecule (True) or cm-1 (False) for absorption coefficient
         File:   write output to file (if specified)
         Format:  c-format of file output (accounts for significant digits in WavenumberStep)
+        CPF:  complex probability function, name in CPF_MAP or function (default is VARIABLES['CPF'])
     OUTPUT PARAMETERS: 
         Wavenum: wavenumber grid with respect to parameters WavenumberRange and WavenumberStep
         Xsect: absorption coefficient calculated on the grid
@@ -18670,6 +20774,7 @@ def absorptionCoefficient_SDVoigt(Components=None,SourceTables=None,partitionFun
     if WavenumberWing:   OmegaWing=WavenumberWing
     if WavenumberWingHW: OmegaWingHW=WavenumberWingHW
     if WavenumberGrid:   OmegaGrid=WavenumberGrid
+    CPF = getCPF(CPF)
 
     # "bug" with 1-element list
     Components = listOfTuples(Components)
@@ -18725,9 +20830,6 @@ def absorptionCoefficient_SDVoigt(Components=None,SourceTables=None,partitionFun
     else:
         factor = volumeConcentration(p,T) 
         
-    # setup the default empty environment dependence function
-    if not EnvDependences:
-        EnvDependences = lambda ENV,LINE:{}
     Env = Environment.copy()
     Env['Tref'] = Tref
     Env['pref'] = pref
@@ -18752,112 +20854,54 @@ def absorptionCoefficient_SDVoigt(Components=None,SourceTables=None,partitionFun
     # SourceTables contain multiple tables
     for TableName in SourceTables:
 
-        # get the number of rows
-        nline = LOCAL_TABLE_CACHE[TableName]['header']['number_of_rows']
+        # parameters of all lines of the table at once
+        Lines = getLineParameters(TableName,ABUNDANCES,NATURAL_ABUNDANCES,partitionFunction,
+                                  T,Tref,factor,IntensityThreshold,
+                                  EnvDependences,Env)
+        RowIDs = Lines['RowIDs']
+        LineCenterDB = Lines['nu']
+        LineFactor = Lines['LineFactor']
         
-        # get parameter names for each table
-        parnames = LOCAL_TABLE_CACHE[TableName]['data'].keys()
+        #   doppler broadening coefficient (GammaD)
+        cMassMol = 1.66053873e-27 # hapi
+        m = Lines['Mass'] * cMassMol * 1000
+        GammaD = sqrt(2*cBolts*T*log(2)/m/cc**2)*LineCenterDB
         
-        # loop through line centers (single stream)
-        for RowID in range(nline):
-            
-            # Get the custom environment dependences
-            Line = {}
-            for parname in parnames:
-                Line[parname] = LOCAL_TABLE_CACHE[TableName]['data'][parname][RowID]
-            CustomEnvDependences = EnvDependences(Env,Line)
-            
-            # get basic line parameters (lower level)
-            LineCenterDB = LOCAL_TABLE_CACHE[TableName]['data']['nu'][RowID]
-            LineIntensityDB = LOCAL_TABLE_CACHE[TableName]['data']['sw'][RowID]
-            LowerStateEnergyDB = LOCAL_TABLE_CACHE[TableName]['data']['elower'][RowID]
-            MoleculeNumberDB = LOCAL_TABLE_CACHE[TableName]['data']['molec_id'][RowID]
-            IsoNumberDB = LOCAL_TABLE_CACHE[TableName]['data']['local_iso_id'][RowID]
-            
-            # filter by molecule and isotopologue
-            if (MoleculeNumberDB,IsoNumberDB) not in ABUNDANCES: continue
-            
-            # partition functions for T and Tref
-            SigmaT = partitionFunction(MoleculeNumberDB,IsoNumberDB,T)
-            SigmaTref = partitionFunction(MoleculeNumberDB,IsoNumberDB,Tref)
-            
-            # get all environment dependences from voigt parameters
+        #   pressure broadening coefficient
+        Gamma0 = zeros(len(RowIDs)); Shift0 = zeros(len(RowIDs)); Gamma2 = zeros(len(RowIDs)); Shift2 = 0.
+        for species in Diluent:
+            species_lower = species # species_lower = species.lower() # CHANGED RJH 23MAR18
             
-            #   intensity
-            if 'sw' in CustomEnvDependences:
-                LineIntensity = CustomEnvDependences['sw']
-            else:
-                LineIntensity = EnvironmentDependency_Intensity(LineIntensityDB,T,Tref,SigmaT,SigmaTref,
-                                                                LowerStateEnergyDB,LineCenterDB)
-            
-            #   FILTER by LineIntensity: compare it with IntencityThreshold
-            if LineIntensity < IntensityThreshold: continue
+            abun = Diluent[species]
             
-            #   doppler broadening coefficient (GammaD)
-            cMassMol = 1.66053873e-27 # hapi
-            m = molecularMass(MoleculeNumberDB,IsoNumberDB) * cMassMol * 1000
-            GammaD = sqrt(2*cBolts*T*log(2)/m/cc**2)*LineCenterDB
+            gamma_name = 'gamma_' + species_lower
+            Gamma0DB = getLineColumn(TableName,gamma_name,RowIDs,0.0)
+            TempRatioPowerDB = getTempRatioPower(TableName,species_lower,RowIDs)
             
-            #   pressure broadening coefficient
-            Gamma0 = 0.; Shift0 = 0.; Gamma2 = 0.; Shift2 = 0.
-            for species in Diluent:
-                species_lower = species # species_lower = species.lower() # CHANGED RJH 23MAR18
-                
-                abun = Diluent[species]
-                
-                gamma_name = 'gamma_' + species_lower
-                try:
-                    Gamma0DB = LOCAL_TABLE_CACHE[TableName]['data'][gamma_name][RowID]
-                except:
-                    Gamma0DB = 0.0
-                
-                n_name = 'n_' + species_lower
-                try:
-                    TempRatioPowerDB = LOCAL_TABLE_CACHE[TableName]['data'][n_name][RowID]
-                    if species_lower == 'self' and TempRatioPowerDB == 0.:
-                        TempRatioPowerDB = LOCAL_TABLE_CACHE[TableName]['data']['n_air'][RowID] # same for self as for air
-                except:
-                    #TempRatioPowerDB = 0                    
-                    TempRatioPowerDB = LOCAL_TABLE_CACHE[TableName]['data']['n_air'][RowID]
-                
-                # Add to the final Gamma0
-                Gamma0 += abun*CustomEnvDependences.get(gamma_name, # default ->
-                          EnvironmentDependency_Gamma0(Gamma0DB,T,Tref,p,pref,TempRatioPowerDB))
-
-                delta_name = 'delta_' + species_lower
-                try:
-                    Shift0DB = LOCAL_TABLE_CACHE[TableName]['data'][delta_name][RowID]
-                except:
-                    Shift0DB = 0.0
-                
-                deltap_name = 'deltap_' + species_lower
-                try:
-                    deltap = LOCAL_TABLE_CACHE[TableName]['data'][deltap_name][RowID]
-                except:
-                    deltap = 0.0
+            # Add to the final Gamma0
+            Gamma0 += abun*applyCustomValues(EnvironmentDependency_Gamma0(Gamma0DB,T,Tref,p,pref,TempRatioPowerDB),
+                                             Lines,gamma_name)
 
-                Shift0 += abun*CustomEnvDependences.get(delta_name, # default ->
-                          ((Shift0DB + deltap*(T-Tref))*p/pref))
-            
-                SD_name = 'SD_' + species_lower
-                try:
-                    SDDB = LOCAL_TABLE_CACHE[TableName]['data'][SD_name][RowID]
-                except:
-                    SDDB = 0.0
+            delta_name = 'delta_' + species_lower
+            Shift0DB = getLineColumn(TableName,delta_name,RowIDs,0.0)
+            deltap = getLineColumn(TableName,'deltap_' + species_lower,RowIDs,0.0)
 
-                Gamma2 += abun*CustomEnvDependences.get(SD_name, # default ->
-                          SDDB*p/pref) * Gamma0DB
+            Shift0 += abun*applyCustomValues((Shift0DB + deltap*(T-Tref))*p/pref,Lines,delta_name)
+        
+            SD_name = 'SD_' + species_lower
+            SDDB = getLineColumn(TableName,SD_name,RowIDs,0.0)
 
-            #   get final wing of the line according to Gamma0, OmegaWingHW and OmegaWing
-            OmegaWingF = max(OmegaWing,OmegaWingHW*Gamma0,OmegaWingHW*GammaD)
+            Gamma2 += abun*applyCustomValues(SDDB*p/pref,Lines,SD_name) * Gamma0DB
+        
+        #   get final wing of the line according to Gamma0, OmegaWingHW and OmegaWing
+        OmegaWingF = maximum(maximum(OmegaWing,OmegaWingHW*Gamma0),OmegaWingHW*GammaD)
+        BoundIndexLower,BoundIndexUpper = getLineBounds(Omegas,LineCenterDB,OmegaWingF)
 
-            BoundIndexLower = bisect(Omegas,LineCenterDB-OmegaWingF)
-            BoundIndexUpper = bisect(Omegas,LineCenterDB+OmegaWingF)
-            lineshape_vals = PROFILE_SDVOIGT(LineCenterDB,GammaD,Gamma0,Gamma2,Shift0,Shift2,Omegas[BoundIndexLower:BoundIndexUpper])[0]
-            Xsect[BoundIndexLower:BoundIndexUpper] += factor / NATURAL_ABUNDANCES[(MoleculeNumberDB,IsoNumberDB)] * \
-                                                      ABUNDANCES[(MoleculeNumberDB,IsoNumberDB)] * \
-                                                      LineIntensity * lineshape_vals
-   
+        # loop through line centers (single stream)
+        for i in range(len(RowIDs)):
+            lineshape_vals = PROFILE_SDVOIGT(LineCenterDB[i],GammaD[i],Gamma0[i],Gamma2[i],Shift0[i],Shift2,Omegas[BoundIndexLower[i]:BoundIndexUpper[i]],CPF)[0]
+            Xsect[BoundIndexLower[i]:BoundIndexUpper[i]] += LineFactor[i] * lineshape_vals
+    
     if File: save_to_file(File,Format,Omegas,Xsect)
     return Omegas,Xsect
     
@@ -18870,7 +20914,7 @@ def absorptionCoefficient_Voigt(Components=None,SourceTables=None,partitionFunct
                                 File=None, Format=None, OmegaGrid=None,
                                 WavenumberRange=None,WavenumberStep=None,WavenumberWing=None,
                                 WavenumberWingHW=None,WavenumberGrid=None,
-                                Diluent={},EnvDependences=None):
+                                Diluent={},EnvDependences=None,BatchLines=None,CPF=None):
     """
     INPUT PARAMETERS: 
         Components:  list of tuples [(M,I,D)], where
@@ -18892,6 +20936,8 @@ def absorptionCoefficient_Voigt(Components=None,SourceTables=None,partitionFunct
         HITRAN_units:  use cm2/molecule (True) or cm-1 (False) for absorption coefficient
         File:   write output to file (if specified)
         Format:  c-format of file output (accounts for significant digits in WavenumberStep)
+        BatchLines:  evaluate lineshapes in batches of lines (default is VARIABLES['BATCH_LINES'])
+        CPF:  complex probability function, name in CPF_MAP or function (default is VARIABLES['CPF'])
     OUTPUT PARAMETERS: 
         Wavenum: wavenumber grid with respect to parameters WavenumberRange and WavenumberStep
         Xsect: absorption coefficient calculated on the grid
@@ -18918,6 +20964,8 @@ def absorptionCoefficient_Voigt(Components=None,SourceTables=None,partitionFunct
     if WavenumberWing:   OmegaWing=WavenumberWing
     if WavenumberWingHW: OmegaWingHW=WavenumberWingHW
     if WavenumberGrid:   OmegaGrid=WavenumberGrid
+    if BatchLines is None: BatchLines=VARIABLES['BATCH_LINES']
+    CPF = getCPF(CPF)
 
     # "bug" with 1-element list
     Components = listOfTuples(Components)
@@ -18973,9 +21021,6 @@ def absorptionCoefficient_Voigt(Components=None,SourceTables=None,partitionFunct
     else:
         factor = volumeConcentration(p,T) 
         
-    # setup the default empty environment dependence function
-    if not EnvDependences:
-        EnvDependences = lambda ENV,LINE:{}
     Env = Environment.copy()
     Env['Tref'] = Tref
     Env['pref'] = pref
@@ -19000,102 +21045,54 @@ def absorptionCoefficient_Voigt(Components=None,SourceTables=None,partitionFunct
     # SourceTables contain multiple tables
     for TableName in SourceTables:
 
-        # get the number of rows
-        nline = LOCAL_TABLE_CACHE[TableName]['header']['number_of_rows']
+        # parameters of all lines of the table at once
+        Lines = getLineParameters(TableName,ABUNDANCES,NATURAL_ABUNDANCES,partitionFunction,
+                                  T,Tref,factor,IntensityThreshold,
+                                  EnvDependences,Env)
+        RowIDs = Lines['RowIDs']
+        LineCenterDB = Lines['nu']
+        LineFactor = Lines['LineFactor']
         
-        # get parameter names for each table
-        parnames = LOCAL_TABLE_CACHE[TableName]['data'].keys()
+        #   doppler broadening coefficient (GammaD)
+        cMassMol = 1.66053873e-27 # hapi
+        m = Lines['Mass'] * cMassMol * 1000
+        GammaD = sqrt(2*cBolts*T*log(2)/m/cc**2)*LineCenterDB
         
-        # loop through line centers (single stream)
-        for RowID in range(nline):
-            
-            # Get the custom environment dependences
-            Line = {}
-            for parname in parnames:
-                Line[parname] = LOCAL_TABLE_CACHE[TableName]['data'][parname][RowID]
-            CustomEnvDependences = EnvDependences(Env,Line)
-            
-            # get basic line parameters (lower level)
-            LineCenterDB = LOCAL_TABLE_CACHE[TableName]['data']['nu'][RowID]
-            LineIntensityDB = LOCAL_TABLE_CACHE[TableName]['data']['sw'][RowID]
-            LowerStateEnergyDB = LOCAL_TABLE_CACHE[TableName]['data']['elower'][RowID]
-            MoleculeNumberDB = LOCAL_TABLE_CACHE[TableName]['data']['molec_id'][RowID]
-            IsoNumberDB = LOCAL_TABLE_CACHE[TableName]['data']['local_iso_id'][RowID]
-            
-            # filter by molecule and isotopologue
-            if (MoleculeNumberDB,IsoNumberDB) not in ABUNDANCES: continue
-            
-            # partition functions for T and Tref
-            SigmaT = partitionFunction(MoleculeNumberDB,IsoNumberDB,T)
-            SigmaTref = partitionFunction(MoleculeNumberDB,IsoNumberDB,Tref)
-            
-            # get all environment dependences from voigt parameters
-            
-            #   intensity
-            if 'sw' in CustomEnvDependences:
-                LineIntensity = CustomEnvDependences['sw']
-            else:
-                LineIntensity = EnvironmentDependency_Intensity(LineIntensityDB,T,Tref,SigmaT,SigmaTref,
-                                                                LowerStateEnergyDB,LineCenterDB)
+        #   pressure broadening coefficient
+        Gamma0 = zeros(len(RowIDs)); Shift0 = zeros(len(RowIDs))
+        for species in Diluent:
+            species_lower = species # species_lower = species.lower() # CHANGED RJH 23MAR18
             
-            #   FILTER by LineIntensity: compare it with IntencityThreshold
-            if LineIntensity < IntensityThreshold: continue
+            abun = Diluent[species]
             
-            #   doppler broadening coefficient (GammaD)
-            cMassMol = 1.66053873e-27 # hapi
-            m = molecularMass(MoleculeNumberDB,IsoNumberDB) * cMassMol * 1000
-            GammaD = sqrt(2*cBolts*T*log(2)/m/cc**2)*LineCenterDB
+            gamma_name = 'gamma_' + species_lower
+            Gamma0DB = getLineColumn(TableName,gamma_name,RowIDs,0.0)
+            TempRatioPowerDB = getTempRatioPower(TableName,species_lower,RowIDs)
             
-            #   pressure broadening coefficient
-            Gamma0 = 0.; Shift0 = 0.;
-            for species in Diluent:
-                species_lower = species # species_lower = species.lower() # CHANGED RJH 23MAR18
-                
-                abun = Diluent[species]
-                
-                gamma_name = 'gamma_' + species_lower
-                try:
-                    Gamma0DB = LOCAL_TABLE_CACHE[TableName]['data'][gamma_name][RowID]
-                except:
-                    Gamma0DB = 0.0
-                
-                n_name = 'n_' + species_lower
-                try:
-                    TempRatioPowerDB = LOCAL_TABLE_CACHE[TableName]['data'][n_name][RowID]
-                    if species_lower == 'self' and TempRatioPowerDB == 0.:
-                        TempRatioPowerDB = LOCAL_TABLE_CACHE[TableName]['data']['n_air'][RowID] # same for self as for air
-                except:
-                    #TempRatioPowerDB = 0                    
-                    TempRatioPowerDB = LOCAL_TABLE_CACHE[TableName]['data']['n_air'][RowID]
-                
-                # Add to the final Gamma0
-                Gamma0 += abun*CustomEnvDependences.get(gamma_name, # default ->
-                          EnvironmentDependency_Gamma0(Gamma0DB,T,Tref,p,pref,TempRatioPowerDB))
+            # Add to the final Gamma0
+            Gamma0 += abun*applyCustomValues(EnvironmentDependency_Gamma0(Gamma0DB,T,Tref,p,pref,TempRatioPowerDB),
+                                             Lines,gamma_name)
 
-                delta_name = 'delta_' + species_lower
-                try:
-                    Shift0DB = LOCAL_TABLE_CACHE[TableName]['data'][delta_name][RowID]
-                except:
-                    Shift0DB = 0.0
-                
-                deltap_name = 'deltap_' + species_lower
-                try:
-                    deltap = LOCAL_TABLE_CACHE[TableName]['data'][deltap_name][RowID]
-                except:
-                    deltap = 0.0
+            delta_name = 'delta_' + species_lower
+            Shift0DB = getLineColumn(TableName,delta_name,RowIDs,0.0)
+            deltap = getLineColumn(TableName,'deltap_' + species_lower,RowIDs,0.0)
 
-                Shift0 += abun*CustomEnvDependences.get(delta_name, # default ->
-                          ((Shift0DB + deltap*(T-Tref))*p/pref))
-            
-            #   get final wing of the line according to Gamma0, OmegaWingHW and OmegaWing
-            OmegaWingF = max(OmegaWing,OmegaWingHW*Gamma0,OmegaWingHW*GammaD)
-
-            BoundIndexLower = bisect(Omegas,LineCenterDB-OmegaWingF)
-            BoundIndexUpper = bisect(Omegas,LineCenterDB+OmegaWingF)
-            lineshape_vals = PROFILE_VOIGT(LineCenterDB+Shift0,GammaD,Gamma0,Omegas[BoundIndexLower:BoundIndexUpper])[0]
-            Xsect[BoundIndexLower:BoundIndexUpper] += factor / NATURAL_ABUNDANCES[(MoleculeNumberDB,IsoNumberDB)] * \
-                                                      ABUNDANCES[(MoleculeNumberDB,IsoNumberDB)] * \
-                                                      LineIntensity * lineshape_vals
+            Shift0 += abun*applyCustomValues((Shift0DB + deltap*(T-Tref))*p/pref,Lines,delta_name)
+        
+        #   get final wing of the line according to Gamma0, OmegaWingHW and OmegaWing
+        OmegaWingF = maximum(maximum(OmegaWing,OmegaWingHW*Gamma0),OmegaWingHW*GammaD)
+        BoundIndexLower,BoundIndexUpper = getLineBounds(Omegas,LineCenterDB,OmegaWingF)
+
+        if BatchLines:
+            # lineshapes of all lines at once
+            addLineshapesBatched(Xsect,Omegas,BoundIndexLower,BoundIndexUpper,LineFactor,
+                                 lambda sg0,GamD,Gam0,sg: PROFILE_VOIGT(sg0,GamD,Gam0,sg,CPF)[0],
+                                 LineCenterDB+Shift0,GammaD,Gamma0)
+        else:
+            # loop through line centers (single stream)
+            for i in range(len(RowIDs)):
+                lineshape_vals = PROFILE_VOIGT(LineCenterDB[i]+Shift0[i],GammaD[i],Gamma0[i],Omegas[BoundIndexLower[i]:BoundIndexUpper[i]],CPF)[0]
+                Xsect[BoundIndexLower[i]:BoundIndexUpper[i]] += LineFactor[i] * lineshape_vals
     
     if File: save_to_file(File,Format,Omegas,Xsect)
     return Omegas,Xsect
@@ -19109,7 +21106,7 @@ def absorptionCoefficient_Lorentz(Components=None,SourceTables=None,partitionFun
                                 File=None, Format=None, OmegaGrid=None,
                                 WavenumberRange=None,WavenumberStep=None,WavenumberWing=None,
                                 WavenumberWingHW=None,WavenumberGrid=None,
-                                Diluent={},EnvDependences=None):
+                                Diluent={},EnvDependences=None,BatchLines=None):
     """
     INPUT PARAMETERS: 
         Components:  list of tuples [(M,I,D)], where
@@ -19131,6 +21128,7 @@ def absorptionCoefficient_Lorentz(Components=None,SourceTables=None,partitionFun
         HITRAN_units:  use cm2/molecule (True) or cm-1 (False) for absorption coefficient
         File:   write output to file (if specified)
         Format:  c-format of file output (accounts for significant digits in WavenumberStep)
+        BatchLines:  evaluate lineshapes in batches of lines (default is VARIABLES['BATCH_LINES'])
     OUTPUT PARAMETERS: 
         Wavenum: wavenumber grid with respect to parameters WavenumberRange and WavenumberStep
         Xsect: absorption coefficient calculated on the grid
@@ -19157,6 +21155,7 @@ def absorptionCoefficient_Lorentz(Components=None,SourceTables=None,partitionFun
     if WavenumberWing:   OmegaWing=WavenumberWing
     if WavenumberWingHW: OmegaWingHW=WavenumberWingHW
     if WavenumberGrid:   OmegaGrid=WavenumberGrid
+    if BatchLines is None: BatchLines=VARIABLES['BATCH_LINES']
 
     # "bug" with 1-element list
     Components = listOfTuples(Components)
@@ -19212,9 +21211,6 @@ def absorptionCoefficient_Lorentz(Components=None,SourceTables=None,partitionFun
     else:
         factor = volumeConcentration(p,T) 
         
-    # setup the default empty environment dependence function
-    if not EnvDependences:
-        EnvDependences = lambda ENV,LINE:{}
     Env = Environment.copy()
     Env['Tref'] = Tref
     Env['pref'] = pref
@@ -19239,97 +21235,48 @@ def absorptionCoefficient_Lorentz(Components=None,SourceTables=None,partitionFun
     # SourceTables contain multiple tables
     for TableName in SourceTables:
 
-        # get the number of rows
-        nline = LOCAL_TABLE_CACHE[TableName]['header']['number_of_rows']
+        # parameters of all lines of the table at once
+        Lines = getLineParameters(TableName,ABUNDANCES,NATURAL_ABUNDANCES,partitionFunction,
+                                  T,Tref,factor,IntensityThreshold,
+                                  EnvDependences,Env)
+        RowIDs = Lines['RowIDs']
+        LineCenterDB = Lines['nu']
+        LineFactor = Lines['LineFactor']
         
-        # get parameter names for each table
-        parnames = LOCAL_TABLE_CACHE[TableName]['data'].keys()
-        
-        # loop through line centers (single stream)
-        for RowID in range(nline):
-            
-            # Get the custom environment dependences
-            Line = {}
-            for parname in parnames:
-                Line[parname] = LOCAL_TABLE_CACHE[TableName]['data'][parname][RowID]
-            CustomEnvDependences = EnvDependences(Env,Line)
-            
-            # get basic line parameters (lower level)
-            LineCenterDB = LOCAL_TABLE_CACHE[TableName]['data']['nu'][RowID]
-            LineIntensityDB = LOCAL_TABLE_CACHE[TableName]['data']['sw'][RowID]
-            LowerStateEnergyDB = LOCAL_TABLE_CACHE[TableName]['data']['elower'][RowID]
-            MoleculeNumberDB = LOCAL_TABLE_CACHE[TableName]['data']['molec_id'][RowID]
-            IsoNumberDB = LOCAL_TABLE_CACHE[TableName]['data']['local_iso_id'][RowID]
+        #   pressure broadening coefficient
+        Gamma0 = zeros(len(RowIDs)); Shift0 = zeros(len(RowIDs))
+        for species in Diluent:
+            species_lower = species # species_lower = species.lower() # CHANGED RJH 23MAR18
             
-            # filter by molecule and isotopologue
-            if (MoleculeNumberDB,IsoNumberDB) not in ABUNDANCES: continue
+            abun = Diluent[species]
             
-            # partition functions for T and Tref
-            SigmaT = partitionFunction(MoleculeNumberDB,IsoNumberDB,T)
-            SigmaTref = partitionFunction(MoleculeNumberDB,IsoNumberDB,Tref)
+            gamma_name = 'gamma_' + species_lower
+            Gamma0DB = getLineColumn(TableName,gamma_name,RowIDs,0.0)
+            TempRatioPowerDB = getTempRatioPower(TableName,species_lower,RowIDs)
             
-            # get all environment dependences from voigt parameters
-            
-            #   intensity
-            if 'sw' in CustomEnvDependences:
-                LineIntensity = CustomEnvDependences['sw']
-            else:
-                LineIntensity = EnvironmentDependency_Intensity(LineIntensityDB,T,Tref,SigmaT,SigmaTref,
-                                                                LowerStateEnergyDB,LineCenterDB)
-            
-            #   FILTER by LineIntensity: compare it with IntencityThreshold
-            if LineIntensity < IntensityThreshold: continue
-                       
-            #   pressure broadening coefficient
-            Gamma0 = 0.; Shift0 = 0.;
-            for species in Diluent:
-                species_lower = species # species_lower = species.lower() # CHANGED RJH 23MAR18
-                
-                abun = Diluent[species]
-                
-                gamma_name = 'gamma_' + species_lower
-                try:
-                    Gamma0DB = LOCAL_TABLE_CACHE[TableName]['data'][gamma_name][RowID]
-                except:
-                    Gamma0DB = 0.0
-                
-                n_name = 'n_' + species_lower
-                try:
-                    TempRatioPowerDB = LOCAL_TABLE_CACHE[TableName]['data'][n_name][RowID]
-                    if species_lower == 'self' and TempRatioPowerDB == 0.:
-                        TempRatioPowerDB = LOCAL_TABLE_CACHE[TableName]['data']['n_air'][RowID] # same for self as for air
-                except:
-                    #TempRatioPowerDB = 0                    
-                    TempRatioPowerDB = LOCAL_TABLE_CACHE[TableName]['data']['n_air'][RowID]
-                
-                # Add to the final Gamma0
-                Gamma0 += abun*CustomEnvDependences.get(gamma_name, # default ->
-                          EnvironmentDependency_Gamma0(Gamma0DB,T,Tref,p,pref,TempRatioPowerDB))
+            # Add to the final Gamma0
+            Gamma0 += abun*applyCustomValues(EnvironmentDependency_Gamma0(Gamma0DB,T,Tref,p,pref,TempRatioPowerDB),
+                                             Lines,gamma_name)
 
-                delta_name = 'delta_' + species_lower
-                try:
-                    Shift0DB = LOCAL_TABLE_CACHE[TableName]['data'][delta_name][RowID]
-                except:
-                    Shift0DB = 0.0
-                
-                deltap_name = 'deltap_' + species_lower
-                try:
-                    deltap = LOCAL_TABLE_CACHE[TableName]['data'][deltap_name][RowID]
-                except:
-                    deltap = 0.0
+            delta_name = 'delta_' + species_lower
+            Shift0DB = getLineColumn(TableName,delta_name,RowIDs,0.0)
+            deltap = getLineColumn(TableName,'deltap_' + species_lower,RowIDs,0.0)
 
-                Shift0 += abun*CustomEnvDependences.get(delta_name, # default ->
-                          ((Shift0DB + deltap*(T-Tref))*p/pref))
-            
-            #   get final wing of the line according to Gamma0, OmegaWingHW and OmegaWing
-            OmegaWingF = max(OmegaWing,OmegaWingHW*Gamma0)
-
-            BoundIndexLower = bisect(Omegas,LineCenterDB-OmegaWingF)
-            BoundIndexUpper = bisect(Omegas,LineCenterDB+OmegaWingF)
-            lineshape_vals = PROFILE_LORENTZ(LineCenterDB+Shift0,Gamma0,Omegas[BoundIndexLower:BoundIndexUpper])
-            Xsect[BoundIndexLower:BoundIndexUpper] += factor / NATURAL_ABUNDANCES[(MoleculeNumberDB,IsoNumberDB)] * \
-                                                      ABUNDANCES[(MoleculeNumberDB,IsoNumberDB)] * \
-                                                      LineIntensity * lineshape_vals
+            Shift0 += abun*applyCustomValues((Shift0DB + deltap*(T-Tref))*p/pref,Lines,delta_name)
+        
+        #   get final wing of the line according to Gamma0, OmegaWingHW and OmegaWing
+        OmegaWingF = maximum(OmegaWing,OmegaWingHW*Gamma0)
+        BoundIndexLower,BoundIndexUpper = getLineBounds(Omegas,LineCenterDB,OmegaWingF)
+
+        if BatchLines:
+            # lineshapes of all lines at once
+            addLineshapesBatched(Xsect,Omegas,BoundIndexLower,BoundIndexUpper,LineFactor,
+                                 PROFILE_LORENTZ,LineCenterDB+Shift0,Gamma0)
+        else:
+            # loop through line centers (single stream)
+            for i in range(len(RowIDs)):
+                lineshape_vals = PROFILE_LORENTZ(LineCenterDB[i]+Shift0[i],Gamma0[i],Omegas[BoundIndexLower[i]:BoundIndexUpper[i]])
+                Xsect[BoundIndexLower[i]:BoundIndexUpper[i]] += LineFactor[i] * lineshape_vals
     
     if File: save_to_file(File,Format,Omegas,Xsect)
     return Omegas,Xsect
@@ -19351,7 +21298,8 @@ def absorptionCoefficient_Doppler(Components=None,SourceTables=None,partitionFun
                                   GammaL='dummy', HITRAN_units=True, LineShift=True,
                                   File=None, Format=None, OmegaGrid=None,
                                   WavenumberRange=None,WavenumberStep=None,WavenumberWing=None,
-                                  WavenumberWingHW=None,WavenumberGrid=None,Diluent=None):   
+                                  WavenumberWingHW=None,WavenumberGrid=None,Diluent=None,
+                                  BatchLines=None):
     """
     INPUT PARAMETERS: 
         Components:  list of tuples [(M,I,D)], where
@@ -19373,6 +21321,7 @@ def absorptionCoefficient_Doppler(Components=None,SourceTables=None,partitionFun
         HITRAN_units:  use cm2/molecule (True) or cm-1 (False) for absorption coefficient
         File:   write output to file (if specified)
         Format:  c-format of file output (accounts for significant digits in WavenumberStep)
+        BatchLines:  evaluate lineshapes in batches of lines (default is VARIABLES['BATCH_LINES'])
     OUTPUT PARAMETERS: 
         Wavenum: wavenumber grid with respect to parameters OmegaRange and OmegaStep
         Xsect: absorption coefficient calculated on the grid
@@ -19397,6 +21346,7 @@ def absorptionCoefficient_Doppler(Components=None,SourceTables=None,partitionFun
     if WavenumberWing:   OmegaWing=WavenumberWing
     if WavenumberWingHW: OmegaWingHW=WavenumberWingHW
     if WavenumberGrid:   OmegaGrid=WavenumberGrid
+    if BatchLines is None: BatchLines=VARIABLES['BATCH_LINES']
     
     # "bug" with 1-element list
     Components = listOfTuples(Components)
@@ -19457,60 +21407,41 @@ def absorptionCoefficient_Doppler(Components=None,SourceTables=None,partitionFun
     # SourceTables contain multiple tables
     for TableName in SourceTables:
 
-        # get line centers
-        nline = LOCAL_TABLE_CACHE[TableName]['header']['number_of_rows']
+        # parameters of all lines of the table at once
+        Lines = getLineParameters(TableName,ABUNDANCES,NATURAL_ABUNDANCES,partitionFunction,
+                                  T,Tref,factor,IntensityThreshold)
+        RowIDs = Lines['RowIDs']
+        LineCenterDB = Lines['nu']
+        LineFactor = Lines['LineFactor']
         
-        # loop through line centers (single stream)
-        for RowID in range(nline):
-            
-            # get basic line parameters (lower level)
-            LineCenterDB = LOCAL_TABLE_CACHE[TableName]['data']['nu'][RowID]
-            LineIntensityDB = LOCAL_TABLE_CACHE[TableName]['data']['sw'][RowID]
-            LowerStateEnergyDB = LOCAL_TABLE_CACHE[TableName]['data']['elower'][RowID]
-            MoleculeNumberDB = LOCAL_TABLE_CACHE[TableName]['data']['molec_id'][RowID]
-            IsoNumberDB = LOCAL_TABLE_CACHE[TableName]['data']['local_iso_id'][RowID]
-            if LineShift:
-                Shift0DB = LOCAL_TABLE_CACHE[TableName]['data']['delta_air'][RowID]
-            else:
-                Shift0DB = 0
-            
-            # filter by molecule and isotopologue
-            if (MoleculeNumberDB,IsoNumberDB) not in ABUNDANCES: continue
-            
-            # partition functions for T and Tref
-            # TODO: optimize
-            SigmaT = partitionFunction(MoleculeNumberDB,IsoNumberDB,T)
-            SigmaTref = partitionFunction(MoleculeNumberDB,IsoNumberDB,Tref)
-            
-            # get all environment dependences from voigt parameters
-            
-            #   intensity
-            LineIntensity = EnvironmentDependency_Intensity(LineIntensityDB,T,Tref,SigmaT,SigmaTref,
-                                                            LowerStateEnergyDB,LineCenterDB)
-            
-            #   FILTER by LineIntensity: compare it with IntencityThreshold
-            # TODO: apply wing narrowing instead of filtering, this would be more appropriate
-            if LineIntensity < IntensityThreshold: continue
+        if LineShift:
+            Shift0DB = getLineColumn(TableName,'delta_air',RowIDs)
+        else:
+            Shift0DB = zeros(len(RowIDs))
             
-            cMassMol = 1.66053873e-27
-            fSqrtMass = sqrt(molecularMass(MoleculeNumberDB,IsoNumberDB))
-            cc_ = 2.99792458e8
-            cBolts_ = 1.3806503e-23
-            GammaD = (cSqrt2Ln2/cc_)*sqrt(cBolts_/cMassMol)*sqrt(T) * LineCenterDB/fSqrtMass
-                        
-            #   get final wing of the line according to GammaD, OmegaWingHW and OmegaWing
-            OmegaWingF = max(OmegaWing,OmegaWingHW*GammaD)
-
-            #   shift coefficient
-            Shift0 = Shift0DB*p/pref
-
-            BoundIndexLower = bisect(Omegas,LineCenterDB-OmegaWingF)
-            BoundIndexUpper = bisect(Omegas,LineCenterDB+OmegaWingF)
-            lineshape_vals = PROFILE_DOPPLER(LineCenterDB+Shift0,GammaD,Omegas[BoundIndexLower:BoundIndexUpper])
-            Xsect[BoundIndexLower:BoundIndexUpper] += factor / NATURAL_ABUNDANCES[(MoleculeNumberDB,IsoNumberDB)] * \
-                                                      ABUNDANCES[(MoleculeNumberDB,IsoNumberDB)] * \
-                                                      LineIntensity * lineshape_vals
-
+        cMassMol = 1.66053873e-27
+        fSqrtMass = sqrt(Lines['Mass'])
+        cc_ = 2.99792458e8
+        cBolts_ = 1.3806503e-23
+        GammaD = (cSqrt2Ln2/cc_)*sqrt(cBolts_/cMassMol)*sqrt(T) * LineCenterDB/fSqrtMass
+
+        #   shift coefficient
+        Shift0 = Shift0DB*p/pref
+        
+        #   get final wing of the line according to GammaD, OmegaWingHW and OmegaWing
+        OmegaWingF = maximum(OmegaWing,OmegaWingHW*GammaD)
+        BoundIndexLower,BoundIndexUpper = getLineBounds(Omegas,LineCenterDB,OmegaWingF)
+
+        if BatchLines:
+            # lineshapes of all lines at once
+            addLineshapesBatched(Xsect,Omegas,BoundIndexLower,BoundIndexUpper,LineFactor,
+                                 PROFILE_DOPPLER,LineCenterDB+Shift0,GammaD)
+        else:
+            # loop through line centers (single stream)
+            for i in range(len(RowIDs)):
+                lineshape_vals = PROFILE_DOPPLER(LineCenterDB[i]+Shift0[i],GammaD[i],Omegas[BoundIndexLower[i]:BoundIndexUpper[i]])
+                Xsect[BoundIndexLower[i]:BoundIndexUpper[i]] += LineFactor[i] * lineshape_vals
+    
     if File: save_to_file(File,Format,Omegas,Xsect)
     return Omegas,Xsect
 
@@ -19530,8 +21461,129 @@ def absorptionCrossSection(profile='HT',**argv):
     
 def absorptionCoefficient(profile='HT',**argv):
     argv['HITRAN_units'] = False
-    return PROFILE_MAP[profile](**argv)    
-    
+    return PROFILE_MAP[profile](**argv)
+
+# -------------------------------------------------------------------------------
+# PARALLEL CALCULATION OF THE ABSORPTION COEFFICIENT
+# -------------------------------------------------------------------------------
+
+def absorptionCoefficientParallel(profile='HT',n_workers=None,**argv):
+    """
+    INPUT PARAMETERS:
+        profile:  key of PROFILE_MAP or one of absorptionCoefficient_* functions
+        n_workers:  number of processes (default is the number of CPUs)
+        argv:  parameters of the profile function, passed unchanged
+    OUTPUT PARAMETERS:
+        Wavenum: wavenumber grid
+        Xsect: absorption coefficient calculated on the grid
+    ---
+    DESCRIPTION:
+        Calculate absorption coefficient with the profile function
+        in n_workers processes. The lines of the source tables are split
+        into n_workers consecutive parts, each process adds the lineshapes
+        of its part on the whole wavenumber grid into shared memory,
+        and the parts are summed in a fixed order, so that the result
+        does not depend on which process finishes first.
+        Results differ from the one-process calculation only by rounding.
+        Processes are forked; where fork is not available the calculation
+        runs in the calling process.
+    ---
+    EXAMPLE OF USAGE:
+        nu,coef = absorptionCoefficientParallel('Voigt',n_workers=8,
+                                                SourceTables='co2',WavenumberStep=0.01)
+    ---
+    """
+    import multiprocessing,mmap
+    Function = PROFILE_MAP[profile] if profile in PROFILE_MAP else profile
+    if n_workers is None:
+        n_workers = multiprocessing.cpu_count()
+    if n_workers<=1 or 'fork' not in multiprocessing.get_all_start_methods():
+        return Function(**argv)
+
+    # same defaults and wavenumber grid as the profile function
+    OmegaRange = argv.get('WavenumberRange') or argv.get('OmegaRange')
+    OmegaStep = argv.get('WavenumberStep') or argv.get('OmegaStep')
+    OmegaGrid = argv.get('WavenumberGrid')
+    if OmegaGrid is None: OmegaGrid = argv.get('OmegaGrid')
+    Components,SourceTables,Environment,OmegaRange,OmegaStep,OmegaWing,\
+    IntensityThreshold,Format = \
+       getDefaultValuesForXsect(listOfTuples(argv.get('Components')),
+                                listOfTuples(argv.get('SourceTables')),
+                                argv.get('Environment'),OmegaRange,OmegaStep,
+                                None,None,argv.get('Format'))
+    if OmegaGrid is not None:
+        Omegas = npsort(OmegaGrid)
+    else:
+        Omegas = arange_(OmegaRange[0],OmegaRange[1],OmegaStep)
+    Components = [tuple(Component) for Component in Components]
+
+    # lines of the components in every table
+    TableRows = []
+    for TableName in SourceTables:
+        data = LOCAL_TABLE_CACHE[TableName]['data']
+        MoleculeNumberDB = np.asarray(data['molec_id'])
+        IsoNumberDB = np.asarray(data['local_iso_id'])
+        ComponentMask = zeros(len(MoleculeNumberDB),dtype=bool)
+        for Component in Components:
+            ComponentMask |= (MoleculeNumberDB==Component[0]) & (IsoNumberDB==Component[1])
+        TableRows.append(np.flatnonzero(ComponentMask))
+    n_workers = min(n_workers,max(max(len(Rows) for Rows in TableRows),1))
+    if n_workers<=1:
+        return Function(**argv)
+
+    WorkerArgv = {Name:Value for Name,Value in argv.items()
+                  if Name not in set(['SourceTables','WavenumberRange','OmegaRange','WavenumberStep',
+                                      'OmegaStep','WavenumberGrid','OmegaGrid','File'])}
+    WorkerArgv['Components'] = Components
+    WorkerArgv['Environment'] = Environment
+    WorkerArgv['OmegaStep'] = OmegaStep
+    WorkerArgv['OmegaGrid'] = Omegas
+
+    # partial absorption coefficients of the workers
+    number_of_points = len(Omegas)
+    Buffer = mmap.mmap(-1,max(n_workers*number_of_points,1)*Omegas.itemsize)
+    Partials = np.frombuffer(Buffer,dtype=float64).reshape(n_workers,number_of_points)
+    context = multiprocessing.get_context('fork')
+    Errors = context.SimpleQueue()
+
+    def worker(k):
+        # forked process: the tables are inherited from the parent
+        try:
+            PartTables = []
+            for TableName,Rows in zip(SourceTables,TableRows):
+                PartName = '__part%d__%s' % (k,TableName)
+                PartRows = Rows[k*len(Rows)//n_workers:(k+1)*len(Rows)//n_workers]
+                LOCAL_TABLE_CACHE[PartName] = {'header':dict(LOCAL_TABLE_CACHE[TableName]['header']),
+                                               'data':None}
+                createView(PartName,TableName,PartRows,list(LOCAL_TABLE_CACHE[TableName]['data'].keys()))
+                PartTables.append(PartName)
+            Partials[k] = Function(SourceTables=PartTables,**WorkerArgv)[1]
+            Errors.put((k,None))
+        except Exception as e:
+            Errors.put((k,'%s: %s' % (type(e).__name__,e)))
+
+    processes = [context.Process(target=worker,args=(k,)) for k in range(n_workers)]
+    for process in processes: process.start()
+    for process in processes: process.join()
+    Messages = {}
+    while not Errors.empty():
+        k,Message = Errors.get()
+        Messages[k] = Message
+    for k,process in enumerate(processes):
+        if process.exitcode!=0 or k not in Messages:
+            raise Exception('absorption coefficient: worker %d exited with code %s' % (k,process.exitcode))
+        if Messages[k] is not None:
+            raise Exception('absorption coefficient: worker %d failed: %s' % (k,Messages[k]))
+
+    # deterministic reduction
+    Xsect = Partials[0].copy()
+    for k in range(1,n_workers):
+        Xsect += Partials[k]
+    del Partials; Buffer.close()
+
+    if argv.get('File'): save_to_file(argv['File'],Format,Omegas,Xsect)
+    return Omegas,Xsect
+
 # ---------------------------------------------------------------------------
 # SHORTCUTS AND ALIASES FOR ABSORPTION COEFFICIENTS
 # ---------------------------------------------------------------------------
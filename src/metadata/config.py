@@ -96,6 +96,72 @@ class Config:
             'tool_tip': 'Format specifier for the tick labels. This should be a C-Style '
                         'format.', 'type': str
         },
+
+        # Whether table columns should be memory-mapped from disk rather than loaded into RAM.
+        'memmap_tables':          {
+            'default_value': False,
+            'display_name': 'Memory-Mapped Tables',
+            'tool_tip': 'Whether to keep table columns in binary files on disk instead of RAM. '
+                        'Enable this for tables that are too large to fit into memory. Takes '
+                        'effect after a restart.', 'type': bool
+        },
+
+        # The number of processes used to parse tables when hapi is started.
+        'loading_processes':      {
+            'default_value': 1,
+            'display_name': 'Table Loading Processes',
+            'tool_tip': 'The number of processes used to parse new or modified tables on '
+                        'startup. Values greater than 1 parse several tables at once. Takes '
+                        'effect after a restart.', 'type': int
+        },
+
+        # Whether integer table columns should be stored in the smallest type that fits them.
+        'compact_tables':         {
+            'default_value': False,
+            'display_name': 'Compact Tables',
+            'tool_tip': 'Whether to store integer table columns, like molecule and isotopologue '
+                        'ids, in the smallest integer type that fits them to save memory. Takes '
+                        'effect after a restart.', 'type': bool
+        },
+
+        # Compression of the data files of newly fetched tables: '', 'gz' or 'xz'.
+        'data_compression':       {
+            'default_value': '',
+            'display_name': 'Data Compression',
+            'tool_tip': 'Compression of the data files of newly fetched or saved tables: \'gz\' '
+                        'for gzip, \'xz\' for lzma, or empty for plain text. Compressed tables '
+                        'are always readable. Takes effect after a restart.', 'type': str
+        },
+
+        # Memory budget in megabytes of the cache of select results.
+        'query_cache_size':       {
+            'default_value': 100,
+            'display_name': 'Query Cache Size',
+            'tool_tip': 'The memory in megabytes used to keep the results of recent selects, so '
+                        'that repeating a select on an unchanged table does not scan it again. '
+                        'Set to 0 to disable. Takes effect after a restart.', 'type': int
+        },
+
+        # The number of processes used to calculate absorption coefficients and spectra.
+        'synthesis_processes':    {
+            'default_value': 1,
+            'display_name': 'Spectrum Processes',
+            'tool_tip': 'The number of processes used to calculate absorption coefficients and '
+                        'spectra. Values greater than 1 split the lines of the table across '
+                        'several processes, which pays off for tables with many lines.',
+            'type': int
+        },
+
+        # The complex probability function used by the Voigt, SD Voigt and HT profiles.
+        'complex_probability_function': {
+            'default_value': 'hum1_wei',
+            'display_name': 'Complex Probability Function',
+            'tool_tip': 'The implementation of the complex probability function used by the Voigt, '
+                        'SD Voigt and HT profiles: \'hum1_wei\' (default), \'humlicek_w4\' (faster '
+                        'preview, less accurate), \'weideman24\' or \'weideman32\' (more '
+                        'accurate), \'cpf\', or \'wofz\' if scipy is installed. Takes effect after '
+                        'a restart.', 'type': str
+        },
     }
 
     DEFAULT_CONFIG = ""
@@ -112,6 +178,13 @@ class Config:
     axisx_log_label_format = None
     axisy_label_format = None
     axisy_log_label_format = None
+    memmap_tables = None
+    loading_processes = None
+    compact_tables = None
+    data_compression = None
+    query_cache_size = None
+    synthesis_processes = None
+    complex_probability_function = None
     online = True #assume online
     continue_offline = False
 
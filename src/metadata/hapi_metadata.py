@@ -63,6 +63,7 @@ class HapiMetaData:
 
     def initialize_from_hapi_table(self, table_name):
         if table_name in LOCAL_TABLE_CACHE:
+            loadTableOnDemand(table_name)
             data = LOCAL_TABLE_CACHE[table_name]['data']
             molec_ids = data['molec_id']
             local_ids = data['local_iso_id']
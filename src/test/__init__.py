@@ -3,16 +3,47 @@ from multiprocessing import Process
 from types import TracebackType
 from typing import *
 
+from test.absorption_lines_test import AbsorptionLinesTest
+from test.batched_lineshape_test import BatchedLineshapeTest
+from test.bulk_parser_test import BulkParserTest
+from test.compact_columns_test import CompactColumnsTest
+from test.compression_test import CompressionTest
 from test.config_editor_test import ConfigEditorTest
+from test.cpf_test import CPFTest
+from test.expression_compiler_test import ExpressionCompilerTest
+from test.extra_parser_test import ExtraParserTest
 from test.fail_test import FailTest
+from test.group_test import GroupTest
+from test.hapi_query_test import ColumnwiseSelectTest
 from test.hapi_sources_test import HapiSourcesTest
+from test.index_test import IndexTest
+from test.lazy_loading_test import LazyLoadingTest
+from test.memmap_test import MemmapTest
 from test.molecule_info_test import MoleculeInfoTest
+from test.output_table_test import OutputTableTest
+from test.parallel_loading_test import ParallelLoadingTest
+from test.parallel_synthesis_test import ParallelSynthesisTest
+from test.partition_sum_test import PartitionSumTest
+from test.query_cache_test import QueryCacheTest
+from test.select_view_test import SelectViewTest
+from test.sidecar_test import SidecarTest
+from test.sort_test import SortTest
+from test.storage_writer_test import StorageWriterTest
+from test.string_predicate_test import StringPredicateTest
+from test.table_chunks_test import TableChunksTest
 from test.test import Test
 from test.throw_test import ThrowTest
 
 
 tests: List[Test] = [Test(), FailTest(), ThrowTest(), HapiSourcesTest(), MoleculeInfoTest(),
-                     ConfigEditorTest()]
+                     ConfigEditorTest(), BulkParserTest(), ColumnwiseSelectTest(), IndexTest(),
+                     CompactColumnsTest(), SortTest(), GroupTest(), QueryCacheTest(),
+                     SelectViewTest(), SidecarTest(), LazyLoadingTest(), MemmapTest(),
+                     StorageWriterTest(), TableChunksTest(), ParallelLoadingTest(),
+                     ExtraParserTest(), CompressionTest(), ExpressionCompilerTest(),
+                     StringPredicateTest(), OutputTableTest(), AbsorptionLinesTest(),
+                     PartitionSumTest(), BatchedLineshapeTest(), ParallelSynthesisTest(),
+                     CPFTest()]
 
 
 def run_tests():
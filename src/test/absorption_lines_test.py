@@ -0,0 +1,63 @@
+from bisect import bisect
+
+import numpy as np
+
+import hapi
+from test.hapi_test_util import make_line_table
+from test.test import Test
+
+
+class AbsorptionLinesTest(Test):
+
+    def __init__(self):
+        Test.__init__(self)
+
+    def name(self) -> str:
+        return 'absorption lines test'
+
+    @staticmethod
+    def reference(table_name, abundances, T, p, diluent, threshold, omegas, wing, wing_hw):
+        # Lorentz absorption coefficient computed line by line
+        Tref, pref = 296., 1.
+        data = hapi.LOCAL_TABLE_CACHE[table_name]['data']
+        xsect = np.zeros(len(omegas))
+        for i in range(len(data['nu'])):
+            M, I = int(data['molec_id'][i]), int(data['local_iso_id'][i])
+            if (M, I) not in abundances:
+                continue
+            intensity = hapi.EnvironmentDependency_Intensity(
+                data['sw'][i], T, Tref, hapi.PYTIPS2017(M, I, T), hapi.PYTIPS2017(M, I, Tref),
+                data['elower'][i], data['nu'][i])
+            if intensity < threshold:
+                continue
+            gamma0 = shift0 = 0.
+            for species, abun in diluent.items():
+                # n_self is missing, n_air is used instead; delta_self is zero
+                gamma0 += abun * hapi.EnvironmentDependency_Gamma0(
+                    data['gamma_' + species][i], T, Tref, p, pref, data['n_air'][i])
+                if species == 'air':
+                    shift0 += abun * data['delta_air'][i] * p / pref
+            wing_f = max(wing, wing_hw * gamma0)
+            lower = bisect(omegas, data['nu'][i] - wing_f)
+            upper = bisect(omegas, data['nu'][i] + wing_f)
+            factor = abundances[(M, I)] / hapi.abundance(M, I)
+            xsect[lower:upper] += factor * intensity * hapi.PROFILE_LORENTZ(
+                data['nu'][i] + shift0, gamma0, omegas[lower:upper])
+        return xsect
+
+    def test(self) -> bool:
+        make_line_table('__test_lines__')
+        abundances = {(1, 1): 0.9, (2, 1): 0.5}
+        diluent = {'air': 0.7, 'self': 0.3}
+        for T, p in ((296., 1.), (250., 0.5), (700., 2.)):
+            nu, coef = hapi.absorptionCoefficient_Lorentz(
+                Components=[(M, I, abun) for (M, I), abun in abundances.items()],
+                SourceTables='__test_lines__', Environment={'T': T, 'p': p},
+                Diluent=diluent, IntensityThreshold=1e-24, WavenumberRange=[2000, 2010],
+                WavenumberStep=0.01, WavenumberWing=0.5, WavenumberWingHW=30.)
+            expected = self.reference('__test_lines__', abundances, T, p, diluent, 1e-24,
+                                      nu, 0.5, 30.)
+            if not np.allclose(coef, expected, rtol=1e-12, atol=0):
+                print('T={}, p={}: max difference {}'.format(T, p, np.abs(coef - expected).max()))
+                return False
+        return True
@@ -0,0 +1,32 @@
+import numpy as np
+
+import hapi
+from test.hapi_test_util import make_line_table
+from test.test import Test
+
+
+class BatchedLineshapeTest(Test):
+
+    def __init__(self):
+        Test.__init__(self)
+
+    def name(self) -> str:
+        return 'batched lineshape test'
+
+    def test(self) -> bool:
+        make_line_table('__test_lines__', 500)
+        for function in (hapi.absorptionCoefficient_Voigt, hapi.absorptionCoefficient_Lorentz,
+                         hapi.absorptionCoefficient_Doppler):
+            arguments = dict(SourceTables='__test_lines__', Environment={'T': 250., 'p': 0.5},
+                             WavenumberRange=[2000, 2010], WavenumberStep=0.002)
+            nu, expected = function(BatchLines=False, **arguments)
+            # in large batches, then in small ones with the wide lines added one by one
+            for batch_size, batch_width in ((2 ** 18, 2048), (4096, 40)):
+                hapi.LINESHAPE_BATCH_SIZE = batch_size
+                hapi.LINESHAPE_BATCH_WIDTH = batch_width
+                nu, coef = function(BatchLines=True, **arguments)
+                # the lineshapes are summed in another order
+                if not np.allclose(coef, expected, rtol=1e-12, atol=1e-12 * expected.max()):
+                    print('{} differs'.format(function.__name__))
+                    return False
+        return True
@@ -0,0 +1,42 @@
+import io
+
+import hapi
+from test.hapi_test_util import make_lines, same_values
+from test.test import Test
+
+
+class BulkParserTest(Test):
+
+    def __init__(self):
+        Test.__init__(self)
+
+    def name(self) -> str:
+        return 'bulk parser test'
+
+    def test(self) -> bool:
+        header = hapi.HITRAN_DEFAULT_HEADER
+        lines = make_lines(200)
+        layout = hapi.getFixedWidthLayout(header)
+        converters = [hapi.getFixedWidthConverter(qnt, dtype, start, end)
+                      for qnt, dtype, start, end in layout]
+        expected = list(zip(*[[cvt(line) for cvt in converters] for line in lines]))
+        data, line_count, flag_EOF = hapi.parseTableBlock(io.StringIO(''.join(lines)), header)
+        if line_count != len(lines) or not flag_EOF:
+            return False
+        for (qnt, dtype, start, end), column in zip(layout, expected):
+            if not same_values(list(data[qnt]), list(column)):
+                print('{} differs'.format(qnt))
+                return False
+        # the same lines parsed by blocks
+        infile = io.StringIO(''.join(lines))
+        blocks = []
+        flag_EOF = False
+        while not flag_EOF:
+            block, line_count, flag_EOF = hapi.parseTableBlock(infile, header, 7)
+            blocks.append(block)
+        for (qnt, dtype, start, end), column in zip(layout, expected):
+            values = [value for block in blocks for value in list(block[qnt])]
+            if not same_values(values, list(column)):
+                print('{} differs in blocks'.format(qnt))
+                return False
+        return True
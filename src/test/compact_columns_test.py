@@ -0,0 +1,42 @@
+import numpy as np
+
+import hapi
+from test.hapi_query_test import check_select
+from test.hapi_test_util import get_rows, make_table
+from test.test import Test
+
+
+class CompactColumnsTest(Test):
+
+    def __init__(self):
+        Test.__init__(self)
+
+    def name(self) -> str:
+        return 'compact columns test'
+
+    def test(self) -> bool:
+        make_table('__test_table__')
+        rows = get_rows('__test_table__')
+        hapi.compactTable('__test_table__')
+        data = hapi.LOCAL_TABLE_CACHE['__test_table__']['data']
+        # integer columns take the narrowest type, the values are kept
+        if data['molec_id'].dtype != np.int8 or data['row'].dtype != np.int16:
+            return False
+        for par_name in ('row', 'molec_id', 'local_iso_id'):
+            if data[par_name].tolist() != [row[par_name] for row in rows]:
+                return False
+        # selects on the narrow types give the results of the full-width columns
+        #  (e.g. molec_id*100 overflows int8)
+        if not check_select('__test_table__'):
+            return False
+        # float columns go to single precision only if asked for,
+        #  and only when it holds all the digits of their format
+        if data['nu'].dtype != np.float64:
+            return False
+        hapi.VARIABLES['FLOAT32_COLUMNS'] = True
+        data['nu'] = np.round(data['nu'] - 1000, 3)
+        hapi.LOCAL_TABLE_CACHE['__test_table__']['header']['format']['nu'] = '%5.3f'
+        hapi.compactTable('__test_table__')
+        if data['nu'].dtype != np.float32:
+            return False
+        return '%5.3f' % data['nu'][0] == '%5.3f' % (rows[0]['nu'] - 1000)
@@ -0,0 +1,48 @@
+import os
+import shutil
+import tempfile
+
+import hapi
+from test.hapi_test_util import get_rows, make_table
+from test.test import Test
+
+
+class CompressionTest(Test):
+
+    def __init__(self):
+        Test.__init__(self)
+
+    def name(self) -> str:
+        return 'compression test'
+
+    def test(self) -> bool:
+        database = tempfile.mkdtemp()
+        try:
+            hapi.VARIABLES['BACKEND_DATABASE_NAME'] = database
+            hapi.VARIABLES['SIDECAR_CACHE'] = False
+            make_table('__test_table__', 100)
+            hapi.cache2storage('__test_table__')
+            with open(os.path.join(database, '__test_table__.data')) as fp:
+                text = fp.read()
+            hapi.LOCAL_TABLE_CACHE.pop('__test_table__')
+            hapi.storage2cache('__test_table__')
+            reference = repr(get_rows('__test_table__'))  # NaNs compare equal in repr
+            for compression in list(hapi.COMPRESSED_OPENERS) + [None]:
+                # written compressed, the other versions of the data file are removed
+                hapi.VARIABLES['DATA_COMPRESSION'] = compression
+                hapi.cache2storage('__test_table__')
+                data_name = '__test_table__.data' + ('.' + compression if compression else '')
+                if [name for name in os.listdir(database) if '.data' in name] != [data_name]:
+                    return False
+                with hapi.open_(os.path.join(database, data_name)) as fp:
+                    if fp.read() != text:
+                        return False
+                # and read back whatever the setting is
+                hapi.VARIABLES['DATA_COMPRESSION'] = None
+                hapi.LOCAL_TABLE_CACHE.pop('__test_table__')
+                hapi.storage2cache('__test_table__')
+                if repr(get_rows('__test_table__')) != reference:
+                    return False
+            return True
+        finally:
+            shutil.rmtree(database)
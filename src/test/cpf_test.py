@@ -0,0 +1,50 @@
+import numpy as np
+
+import hapi
+from test.hapi_test_util import make_line_table
+from test.test import Test
+
+
+class CPFTest(Test):
+
+    def __init__(self):
+        Test.__init__(self)
+
+    def name(self) -> str:
+        return 'complex probability function test'
+
+    def test(self) -> bool:
+        # the range of the accuracy tiers of CPF_MAP
+        x = np.concatenate([-np.logspace(-3, 4, 120), [0.], np.logspace(-3, 4, 120)])
+        y = np.logspace(-6, 3, 100)
+        x, y = [values.ravel() for values in np.meshgrid(x, y)]
+        reference = hapi.weideman(x, y, 128)
+        for name, entry in hapi.CPF_MAP.items():
+            if entry['error'] is None:
+                continue
+            re, im = entry['function'](x, y)
+            error = np.max(np.abs(re + 1j * im - reference) / np.abs(reference))
+            # the tiers are rounded to one digit
+            if error > 1.5 * entry['error']:
+                print('{}: relative error {}'.format(name, error))
+                return False
+        # the function given per call is the one set globally
+        make_line_table('__test_lines__', 100)
+        arguments = dict(SourceTables='__test_lines__', WavenumberRange=[2000, 2010],
+                         WavenumberStep=0.01)
+        nu, coef = hapi.absorptionCoefficient_Voigt(CPF='humlicek_w4', **arguments)
+        hapi.setCPF('humlicek_w4')
+        nu, expected = hapi.absorptionCoefficient_Voigt(**arguments)
+        if coef.tolist() != expected.tolist():
+            return False
+        # other functions give other values, within their accuracy
+        hapi.setCPF('hum1_wei')
+        nu, coef = hapi.absorptionCoefficient_Voigt(**arguments)
+        if np.allclose(coef, expected, rtol=1e-10, atol=0) or \
+                not np.allclose(coef, expected, rtol=1e-3, atol=1e-3 * coef.max()):
+            return False
+        try:
+            hapi.setCPF('no such function')
+        except Exception:
+            return True
+        return False
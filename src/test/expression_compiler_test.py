@@ -0,0 +1,40 @@
+import hapi
+from test.hapi_query_test import CONDITIONS, PARAMETERS
+from test.hapi_test_util import get_rows, make_table, same_values
+from test.test import Test
+
+EXPRESSIONS = CONDITIONS + PARAMETERS + [
+    ('SEARCH', ('STR', ' *(.)'), 'quanta'),
+    ('FINDALL', ('STR', '[AB]'), 'quanta'),
+    ('LIST', 'molec_id', ('+', 'nu', 1)),
+    ('OR', ('IN', 'local_iso_id', ('SET', [1, 2])), ('>', 'sw', 'sw')),
+]
+
+
+class ExpressionCompilerTest(Test):
+
+    def __init__(self):
+        Test.__init__(self)
+
+    def name(self) -> str:
+        return 'expression compiler test'
+
+    def test(self) -> bool:
+        make_table('__test_table__')
+        rows = get_rows('__test_table__')
+        # plans give the values of the interpreter for every row
+        for expression in EXPRESSIONS:
+            plan = hapi.compileExpression(expression)
+            if not same_values([plan(row) for row in rows],
+                               [hapi.evaluateExpression(expression, row) for row in rows]):
+                print('{} differs'.format(expression))
+                return False
+            # and are compiled once
+            if hapi.compileExpression(expression) is not plan:
+                return False
+        # unknown operators are reported before any row is evaluated
+        try:
+            hapi.compileExpression(('AND', ('FOO', 'nu', 1), ('<', 'nu', 2)))
+        except Exception:
+            return True
+        return False
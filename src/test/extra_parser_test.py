@@ -0,0 +1,64 @@
+import io
+import random
+
+import hapi
+from test.hapi_test_util import same_values
+from test.test import Test
+
+HEADER = {
+    'order': ['molec_id', 'local_iso_id', 'nu'],
+    'format': {'molec_id': '%2d', 'local_iso_id': '%1d', 'nu': '%12.6f'},
+    'default': {'molec_id': 0, 'local_iso_id': 0, 'nu': 0.0},
+    'extra': ['gamma_h2', 'trans_id', 'statep'],
+    'extra_format': {'gamma_h2': '%6.4f', 'trans_id': '%12d', 'statep': '%256s'},
+    'extra_separator': ',',
+}
+
+
+class ExtraParserTest(Test):
+
+    def __init__(self):
+        Test.__init__(self)
+
+    def name(self) -> str:
+        return 'extra parser test'
+
+    @staticmethod
+    def make_lines(number_of_lines, seed=0):
+        # column-fixed part and comma-separated values with placeholders,
+        #  empty values and lines which can't be parsed
+        rnd = random.Random(seed)
+        lines = []
+        for i in range(number_of_lines):
+            fixed = '%2d%1d%12.6f' % (rnd.randint(1, 99), rnd.randint(1, 9), rnd.random() * 1e4)
+            gamma = rnd.choice(['%6.4f' % rnd.random(), '#', '', ' 0.05 '])
+            trans_id = rnd.choice([str(rnd.randint(0, 10 ** 9)), '#', 'x'])
+            statep = rnd.choice(['J=1;v=0', '', 'ElecStateLabel=X'])
+            lines.append(','.join([fixed, gamma, trans_id, statep]) + '\n')
+        lines[3] = 'xx' + lines[3][2:]  # bad column-fixed value
+        lines[5] = lines[5].split(',')[0] + ',0.1\n'  # missing values
+        return lines
+
+    def test(self) -> bool:
+        lines = self.make_lines(300)
+        # row objects of the lines, as the row-wise parser reads them
+        expected = []
+        for line in lines:
+            try:
+                expected.append(hapi.getRowObjectFromHeader(line, HEADER))
+            except Exception:
+                continue
+        order = HEADER['order'] + HEADER['extra']
+        for nlines in (None, 7):
+            infile = io.StringIO(''.join(lines))
+            columns = {par_name: [] for par_name in order}
+            flag_EOF = False
+            while not flag_EOF:
+                data, line_count, flag_EOF = hapi.parseTableBlock(infile, HEADER, nlines)
+                for par_name in order:
+                    columns[par_name] += list(data[par_name])
+            for i, par_name in enumerate(order):
+                if not same_values(columns[par_name], [row[i][1] for row in expected]):
+                    print('{} differs'.format(par_name))
+                    return False
+        return True
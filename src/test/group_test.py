@@ -0,0 +1,48 @@
+import numpy as np
+
+import hapi
+from test.hapi_test_util import get_rows, make_table
+from test.test import Test
+
+
+class GroupTest(Test):
+
+    def __init__(self):
+        Test.__init__(self)
+
+    def name(self) -> str:
+        return 'group test'
+
+    def test(self) -> bool:
+        make_table('__test_table__')
+        rows = [row for row in get_rows('__test_table__')]
+        for group_names in [('molec_id',), ('quanta',), ('molec_id', 'quanta'),
+                            (('*', 'molec_id', 'local_iso_id'),)]:
+            plans = [hapi.compileExpression(expr) for expr in group_names]
+            groups = {}
+            for row in rows:
+                # groups in the order of their first rows
+                groups.setdefault(tuple(plan(row) for plan in plans), []).append(row)
+            expected = [(len(group), sum(row['nu'] for row in group),
+                         min(row['local_iso_id'] for row in group),
+                         max(row['nu'] for row in group),
+                         sum(row['molec_id'] for row in group) / len(group),
+                         group[0]['row'])
+                        for group in groups.values()]
+            hapi.group('__test_table__', DestinationTableName='__test_group__',
+                       ParameterNames=(('COUNT',), ('SUM', 'nu'), ('MIN', 'local_iso_id'),
+                                       ('MAX', 'nu'), ('AVG', 'molec_id'), 'row'),
+                       GroupParameterNames=group_names, Output=False)
+            data = hapi.LOCAL_TABLE_CACHE['__test_group__']['data']
+            names = ('#0', '#1', '#2', '#3', '#4', 'row')
+            result = list(zip(*[list(data[name]) for name in names]))
+            if len(result) != len(expected):
+                return False
+            for values, reference in zip(result, expected):
+                if values[0] != reference[0] or values[2] != reference[2] or \
+                        values[5] != reference[5] or values[3] != reference[3] or \
+                        not np.isclose(values[1], reference[1], rtol=1e-12) or \
+                        not np.isclose(values[4], reference[4], rtol=1e-12):
+                    print('group by {} differs'.format(group_names))
+                    return False
+        return True
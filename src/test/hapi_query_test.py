@@ -0,0 +1,81 @@
+import hapi
+from test.hapi_test_util import get_rows, make_table, same_values
+from test.test import Test
+
+# The column-wise select is checked against the row-wise reference:
+# row-by-row evaluation of the compiled expressions.
+
+CONDITIONS = [
+    ('AND', ('>', 'nu', 1000.5), ('<', 'molec_id', 5)),
+    ('OR', ('==', 'molec_id', 1), ('<=', 'sw', 1e-22)),
+    ('NOT', ('BETWEEN', 'nu', 1000.2, 1000.8)),
+    ('AND', ('OR', ('<', 'nu', 1000.3), ('>', 'nu', 1000.7)), ('NOT', ('==', 'molec_id', 2))),
+    ('IN', 'molec_id', ('SET', [1, 3, 7])),
+    ('IN', 'quanta', ('SET', ['   A', '   B'])),
+    ('RANGE', 'nu', 1000.1, 1000.3),
+    ('<', 1000.1, 'nu', 1000.6),
+    ('>=', 'sw', 5e-23),
+    ('!=', 'sw', 'sw'),
+    ('==', 'quanta', ('STR', '   C')),
+    ('MATCH', ('STR', ' +[AB]'), 'quanta'),
+    ('LIKE', ('STR', '.*C'), 'quanta'),
+    ('<', 'LineNumber', 100),
+    ('AND', ('>=', 'LineNumber', 10), ('!=', 'molec_id', 2)),
+    ('==', 'molec_id', 2.0),
+    ('>', ('*', 'molec_id', 100), 150),
+    ('<', ('/', 'molec_id', 2), 1),
+    ('>', ('+', 'nu', 'molec_id'), 1003),
+    ('<', ('-', 'molec_id', 'local_iso_id'), 0),
+]
+
+PARAMETERS = [
+    'row', ('*', 'molec_id', 100), ('/', 'molec_id', 2), ('+', 'nu', 'molec_id'),
+    ('-', 'molec_id', 'local_iso_id'),
+]
+
+
+def check_select(table_name) -> bool:
+    # select with every condition against the compiled expressions row by row
+    rows = get_rows(table_name)
+    for conditions in CONDITIONS:
+        plan = hapi.compileExpression(conditions)
+        expected = [row for row in rows if plan(row)]
+        hapi.select(table_name, DestinationTableName='__test_select__',
+                    ParameterNames=PARAMETERS, Conditions=conditions, Output=False)
+        result = hapi.LOCAL_TABLE_CACHE['__test_select__']['data']
+        expressions = [par for par in PARAMETERS if type(par) != str]
+        for par in PARAMETERS:
+            # expressions are named by their numbers
+            name = par if type(par) == str else '#%d' % expressions.index(par)
+            plan = hapi.compileExpression(par)
+            if not same_values(list(result[name]), [plan(row) for row in expected]):
+                print('{}: {} differs for {}'.format(table_name, par, conditions))
+                return False
+    return True
+
+
+class ColumnwiseSelectTest(Test):
+
+    def __init__(self):
+        Test.__init__(self)
+
+    def name(self) -> str:
+        return 'column-wise select test'
+
+    def test(self) -> bool:
+        # with the query cache on, as hapiest runs hapi
+        hapi.VARIABLES['QUERY_CACHE_SIZE'] = 10 * 1024 ** 2
+        make_table('__test_table__')
+        if not check_select('__test_table__'):
+            return False
+        # the selects are evaluated again after the columns are edited,
+        #  assigned directly or through hapi
+        data = hapi.LOCAL_TABLE_CACHE['__test_table__']['data']
+        data['nu'] = data['nu'][::-1].copy()
+        data['quanta'] = data['quanta'][::-1]
+        if not check_select('__test_table__'):
+            return False
+        hapi.setRowObject(0, [('row', 0, '%5d'), ('molec_id', 9, '%2d'),
+                              ('local_iso_id', 1, '%1d'), ('nu', 999.0, '%12.6f'),
+                              ('sw', 0.0, '%10.3E'), ('quanta', '   A', '%4s')], '__test_table__')
+        return check_select('__test_table__')
@@ -0,0 +1,118 @@
+import json
+import os
+import random
+import re
+
+import numpy as np
+
+import hapi
+
+# Tables and lines of random data shared by the hapi tests.
+
+
+def make_table(table_name, number_of_rows=400, seed=0):
+    # table with integer, float (NaNs included) and string columns;
+    #  the row column holds the row ids to check the selected rows
+    rnd = random.Random(seed)
+    hapi.createTable(table_name, [('row', 0, '%5d'), ('molec_id', 0, '%2d'),
+                                  ('local_iso_id', 0, '%1d'), ('nu', 0.0, '%12.6f'),
+                                  ('sw', 0.0, '%10.3E'), ('quanta', '', '%4s')])
+    data = hapi.LOCAL_TABLE_CACHE[table_name]['data']
+    data['row'] = np.arange(number_of_rows)
+    data['molec_id'] = np.array([rnd.randint(1, 7) for i in range(number_of_rows)])
+    data['local_iso_id'] = np.array([rnd.randint(1, 4) for i in range(number_of_rows)])
+    data['nu'] = np.array([1000 + rnd.random() for i in range(number_of_rows)])
+    data['sw'] = np.array([float('nan') if rnd.random() < 0.05 else rnd.random() * 1e-22
+                           for i in range(number_of_rows)])
+    data['quanta'] = [rnd.choice(['   A', '   B', '   C', '  AB']) for i in range(number_of_rows)]
+    hapi.LOCAL_TABLE_CACHE[table_name]['header']['number_of_rows'] = number_of_rows
+
+
+def get_rows(table_name):
+    # rows of the table as dictionaries of python values (see getVarDictionary)
+    data = hapi.LOCAL_TABLE_CACHE[table_name]['data']
+    header = hapi.LOCAL_TABLE_CACHE[table_name]['header']
+    columns = [list(data[par_name]) if not isinstance(data[par_name], np.ndarray)
+               else data[par_name].tolist() for par_name in header['order']]
+    rows = []
+    for row_id, values in enumerate(zip(*columns)):
+        row = dict(zip(header['order'], values))
+        row['LineNumber'] = row_id
+        rows.append(row)
+    return rows
+
+
+def same_values(values, reference):
+    # element-wise equality, NaNs being equal
+    if len(values) != len(reference):
+        return False
+    for value, ref in zip(values, reference):
+        if value != ref and not (value != value and ref != ref):
+            return False
+    return True
+
+
+def make_lines(number_of_lines, seed=0):
+    # lines of the HITRAN format with random values of every parameter
+    rnd = random.Random(seed)
+    header = hapi.HITRAN_DEFAULT_HEADER
+    lines = []
+    for i in range(number_of_lines):
+        row = []
+        for par_name in header['order']:
+            par_format = header['format'][par_name]
+            lng, trail, lngpnt, ty = re.search(hapi.FORMAT_PYTHON_REGEX, par_format).groups()
+            lng = int(lng)
+            if ty == 'd':
+                value = rnd.randint(0, 10 ** lng - 1)
+            elif ty == 'E':
+                value = rnd.random() * 10 ** rnd.randint(-30, -18)
+            elif ty == 'f':
+                digits = lng - int(lngpnt) - 1
+                value = rnd.random() * (10 ** digits - 1 if digits > 0 else 0.99)
+            else:
+                value = ''.join(rnd.choice(' 0123456789ABC') for j in range(lng))
+            row.append((par_name, value, par_format))
+        lines.append(hapi.putRowObjectToString(row) + '\n')
+    # special isotopologue numbers and the last line without the line break
+    lines[1] = lines[1][:2] + '0' + lines[1][3:]
+    lines[2] = lines[2][:2] + 'A' + lines[2][3:]
+    lines[-1] = lines[-1].rstrip('\n')
+    return lines
+
+
+def write_table(database, table_name, lines):
+    # data file and header of a HITRAN table in the database folder
+    with open(os.path.join(database, table_name + '.data'), 'w') as fp:
+        fp.write(''.join(lines))
+    header = dict(hapi.HITRAN_DEFAULT_HEADER, table_name=table_name, number_of_rows=len(lines))
+    with open(os.path.join(database, table_name + '.header'), 'w') as fp:
+        fp.write(json.dumps(header, indent=2))
+
+
+def same_tables(data, reference, order):
+    # columns of the tables hold the same values
+    return all(same_values(list(data[par_name]), list(reference[par_name])) for par_name in order)
+
+
+def make_line_table(table_name, number_of_lines=200, seed=0):
+    # line list of H2O and CO2 isotopologues between 2000 and 2010 cm-1
+    #  for the absorption coefficients
+    rnd = random.Random(seed)
+    hapi.createTable(table_name, [('molec_id', 0, '%2d'), ('local_iso_id', 0, '%1d'),
+                                  ('nu', 0.0, '%12.6f'), ('sw', 0.0, '%10.3E'),
+                                  ('elower', 0.0, '%10.4f'), ('gamma_air', 0.0, '%5.4f'),
+                                  ('gamma_self', 0.0, '%5.3f'), ('n_air', 0.0, '%4.2f'),
+                                  ('delta_air', 0.0, '%8.6f')])
+    data = hapi.LOCAL_TABLE_CACHE[table_name]['data']
+    components = [rnd.choice([(1, 1), (1, 2), (2, 1)]) for i in range(number_of_lines)]
+    data['molec_id'] = np.array([M for M, I in components])
+    data['local_iso_id'] = np.array([I for M, I in components])
+    data['nu'] = np.array([2000 + 10 * rnd.random() for i in range(number_of_lines)])
+    data['sw'] = np.array([10 ** rnd.uniform(-26, -19) for i in range(number_of_lines)])
+    data['elower'] = np.array([rnd.uniform(0, 3000) for i in range(number_of_lines)])
+    data['gamma_air'] = np.array([rnd.uniform(0.02, 0.1) for i in range(number_of_lines)])
+    data['gamma_self'] = np.array([rnd.uniform(0.1, 0.5) for i in range(number_of_lines)])
+    data['n_air'] = np.array([rnd.uniform(0.3, 0.8) for i in range(number_of_lines)])
+    data['delta_air'] = np.array([rnd.uniform(-0.01, 0.01) for i in range(number_of_lines)])
+    hapi.LOCAL_TABLE_CACHE[table_name]['header']['number_of_rows'] = number_of_lines
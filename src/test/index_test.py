@@ -0,0 +1,33 @@
+import numpy as np
+
+import hapi
+from test.hapi_query_test import check_select
+from test.hapi_test_util import make_table
+from test.test import Test
+
+
+class IndexTest(Test):
+
+    def __init__(self):
+        Test.__init__(self)
+
+    def name(self) -> str:
+        return 'index test'
+
+    def test(self) -> bool:
+        make_table('__test_table__')
+        # the conditions of the column-wise select answered by the indexes
+        hapi.createIndex('__test_table__', 'nu')
+        hapi.createIndex('__test_table__', 'molec_id', 'hash')
+        if not check_select('__test_table__'):
+            return False
+        # indexes follow the edits of the table
+        hapi.setRowObject(0, [('row', 0, '%5d'), ('molec_id', 9, '%2d'),
+                              ('local_iso_id', 1, '%1d'), ('nu', 999.0, '%12.6f'),
+                              ('sw', 0.0, '%10.3E'), ('quanta', '   A', '%4s')], '__test_table__')
+        if not check_select('__test_table__'):
+            return False
+        data = hapi.LOCAL_TABLE_CACHE['__test_table__']['data']
+        data['nu'] = data['nu'][::-1].copy()
+        data['molec_id'] = np.ones(len(data['molec_id']), dtype=int)
+        return check_select('__test_table__')
@@ -0,0 +1,38 @@
+import shutil
+import tempfile
+
+import hapi
+from test.hapi_test_util import make_lines, same_tables, write_table
+from test.test import Test
+
+
+class LazyLoadingTest(Test):
+
+    def __init__(self):
+        Test.__init__(self)
+
+    def name(self) -> str:
+        return 'lazy loading test'
+
+    def test(self) -> bool:
+        database = tempfile.mkdtemp()
+        try:
+            hapi.VARIABLES['BACKEND_DATABASE_NAME'] = database
+            write_table(database, '__test_lazy__', make_lines(100))
+            hapi.storage2cache('__test_lazy__')
+            reference = hapi.LOCAL_TABLE_CACHE.pop('__test_lazy__')
+            # tables are registered with their headers only
+            hapi.VARIABLES['LAZY_LOADING'] = True
+            hapi.loadCache()
+            if hapi.isTableLoaded('__test_lazy__') or \
+                    'data' in hapi.LOCAL_TABLE_CACHE['__test_lazy__']:
+                return False
+            # and loaded by the first query
+            hapi.select('__test_lazy__', DestinationTableName='__test_lazy_result__',
+                        ParameterNames=('nu',), Conditions=('>', 'nu', 0), Output=False)
+            if not hapi.isTableLoaded('__test_lazy__'):
+                return False
+            return same_tables(hapi.LOCAL_TABLE_CACHE['__test_lazy__']['data'], reference['data'],
+                               reference['header']['order'])
+        finally:
+            shutil.rmtree(database)
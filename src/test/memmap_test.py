@@ -0,0 +1,50 @@
+import io
+import shutil
+import tempfile
+
+import numpy as np
+
+import hapi
+from test.hapi_test_util import make_lines, same_tables, write_table
+from test.test import Test
+
+
+class MemmapTest(Test):
+
+    def __init__(self):
+        Test.__init__(self)
+
+    def name(self) -> str:
+        return 'memory-mapped columns test'
+
+    def test(self) -> bool:
+        database = tempfile.mkdtemp()
+        try:
+            hapi.VARIABLES['BACKEND_DATABASE_NAME'] = database
+            hapi.VARIABLES['MEMMAP_COLUMNS'] = True
+            lines = make_lines(300)
+            write_table(database, '__test_memmap__', lines)
+            header = hapi.HITRAN_DEFAULT_HEADER
+            reference, line_count, flag_EOF = hapi.parseTableBlock(io.StringIO(''.join(lines)),
+                                                                   header)
+            # the columns are mapped from the sidecar built by blocks
+            fullpath_data, fullpath_header = hapi.getFullTableAndHeaderName('__test_memmap__')
+            if not hapi.saveSidecarByChunks('__test_memmap__', fullpath_data, fullpath_header, 7):
+                return False
+            hapi.storage2cache('__test_memmap__')
+            data = hapi.LOCAL_TABLE_CACHE['__test_memmap__']['data']
+            if not all(isinstance(data[par_name], np.memmap) for par_name in header['order']):
+                return False
+            if hapi.LOCAL_TABLE_CACHE['__test_memmap__']['header']['number_of_rows'] != 300 or \
+                    not same_tables(data, reference, header['order']):
+                return False
+            # edits copy the column to RAM, the sidecar is left as it is
+            hapi.setRowObject(0, hapi.getRowObject(1, '__test_memmap__'), '__test_memmap__')
+            if isinstance(data['nu'], np.memmap) or data['nu'][0] != reference['nu'][1]:
+                return False
+            hapi.LOCAL_TABLE_CACHE.pop('__test_memmap__')
+            hapi.storage2cache('__test_memmap__')
+            return same_tables(hapi.LOCAL_TABLE_CACHE['__test_memmap__']['data'], reference,
+                               header['order'])
+        finally:
+            shutil.rmtree(database)
@@ -0,0 +1,53 @@
+import csv
+import os
+import shutil
+import tempfile
+
+import hapi
+from test.hapi_test_util import get_rows, make_table
+from test.test import Test
+
+
+class OutputTableTest(Test):
+
+    def __init__(self):
+        Test.__init__(self)
+
+    def name(self) -> str:
+        return 'output table test'
+
+    def test(self) -> bool:
+        folder = tempfile.mkdtemp()
+        try:
+            # blocks smaller than the table
+            hapi.OUTPUT_BLOCK = 7
+            make_table('__test_table__')
+            conditions = ('AND', ('>', 'nu', 1000.3), ('!=', 'quanta', ('STR', '   C')))
+            plan = hapi.compileExpression(conditions)
+            row_ids = [row['LineNumber'] for row in get_rows('__test_table__') if plan(row)]
+            # fixed-width output is the one written row by row
+            expected = ''.join(
+                hapi.putRowObjectToString(hapi.getRowObject(row_id, '__test_table__')) + '\n'
+                for row_id in row_ids)
+            path = os.path.join(folder, 'output.txt')
+            hapi.outputTable('__test_table__', Conditions=conditions, File=path)
+            with open(path) as fp:
+                if fp.read() != expected:
+                    return False
+            # and so is the file written by select, from a view too
+            hapi.VARIABLES['SELECT_VIEWS'] = True
+            hapi.select('__test_table__', DestinationTableName='__test_select__',
+                        Conditions=conditions, File=path, Output=False)
+            with open(path) as fp:
+                if fp.read() != expected:
+                    return False
+            # delimited output of expressions with a line of names
+            hapi.outputTable('__test_table__', Conditions=conditions, File=path,
+                             ParameterNames=('row', ('*', 'molec_id', 2)), Delimiter=',')
+            with open(path) as fp:
+                lines = list(csv.reader(fp))
+            molec_id = hapi.LOCAL_TABLE_CACHE['__test_table__']['data']['molec_id']
+            rows = [[str(row_id), str(2 * molec_id[row_id])] for row_id in row_ids]
+            return lines[0][0] == 'row' and lines[1:] == rows
+        finally:
+            shutil.rmtree(folder)
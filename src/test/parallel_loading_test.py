@@ -0,0 +1,50 @@
+import json
+import os
+import shutil
+import tempfile
+
+import hapi
+from test.hapi_test_util import make_lines, same_tables, write_table
+from test.test import Test
+
+
+class ParallelLoadingTest(Test):
+
+    def __init__(self):
+        Test.__init__(self)
+
+    def name(self) -> str:
+        return 'parallel loading test'
+
+    def test(self) -> bool:
+        database = tempfile.mkdtemp()
+        try:
+            hapi.VARIABLES['BACKEND_DATABASE_NAME'] = database
+            hapi.VARIABLES['LOADING_PROCESSES'] = 2
+            table_names = ['__test_parallel_%d__' % i for i in range(3)]
+            for i, table_name in enumerate(table_names):
+                write_table(database, table_name, make_lines(100 + 50 * i, seed=i))
+            # sidecars are built in the pool, a header without data is reported
+            with open(os.path.join(database, '__test_lonely__.header'), 'w') as fp:
+                fp.write(json.dumps(hapi.HITRAN_DEFAULT_HEADER))
+            hapi.prepareSidecars(table_names + ['__test_lonely__'], 2)
+            for table_name in table_names:
+                fullpath_data, fullpath_header = hapi.getFullTableAndHeaderName(table_name)
+                if hapi.readSidecarManifest(fullpath_data, fullpath_header) is None:
+                    return False
+            os.remove(os.path.join(database, '__test_lonely__.header'))
+            # tables loaded through the pool equal the ones parsed in this process
+            for table_name in table_names:
+                shutil.rmtree(hapi.getSidecarName(hapi.getFullHeaderName(table_name)))
+            hapi.loadCache()
+            order = hapi.HITRAN_DEFAULT_HEADER['order']
+            for table_name in table_names:
+                data = hapi.LOCAL_TABLE_CACHE.pop(table_name)['data']
+                hapi.VARIABLES['SIDECAR_CACHE'] = False
+                hapi.storage2cache(table_name)
+                hapi.VARIABLES['SIDECAR_CACHE'] = True
+                if not same_tables(data, hapi.LOCAL_TABLE_CACHE[table_name]['data'], order):
+                    return False
+            return True
+        finally:
+            shutil.rmtree(database)
@@ -0,0 +1,39 @@
+import numpy as np
+
+import hapi
+from test.hapi_test_util import make_line_table
+from test.test import Test
+
+
+class ParallelSynthesisTest(Test):
+
+    def __init__(self):
+        Test.__init__(self)
+
+    def name(self) -> str:
+        return 'parallel synthesis test'
+
+    def test(self) -> bool:
+        make_line_table('__test_lines__', 300)
+        make_line_table('__test_lines_2__', 50, seed=1)
+        arguments = dict(SourceTables=['__test_lines__', '__test_lines_2__'],
+                         Environment={'T': 250., 'p': 0.5}, WavenumberRange=[2000, 2010],
+                         WavenumberStep=0.005)
+        for profile in ('Voigt', 'HT'):
+            nu, expected = hapi.PROFILE_MAP[profile](**arguments)
+            nu, coef = hapi.absorptionCoefficientParallel(profile, 3, **arguments)
+            # the partial sums differ only by rounding
+            if not np.allclose(coef, expected, rtol=1e-12, atol=1e-12 * expected.max()):
+                print('{} differs'.format(profile))
+                return False
+            # and are reduced in the same order every time
+            nu, again = hapi.absorptionCoefficientParallel(profile, 3, **arguments)
+            if again.tolist() != coef.tolist():
+                return False
+        # errors of the workers are raised in the calling process
+        arguments['Environment'] = {'T': 1e6, 'p': 1.}
+        try:
+            hapi.absorptionCoefficientParallel('Voigt', 3, **arguments)
+        except Exception as e:
+            return 'worker' in str(e)
+        return False
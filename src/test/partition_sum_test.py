@@ -0,0 +1,41 @@
+import numpy as np
+
+import hapi
+from test.test import Test
+
+
+class PartitionSumTest(Test):
+
+    def __init__(self):
+        Test.__init__(self)
+
+    def name(self) -> str:
+        return 'partition sum test'
+
+    def test(self) -> bool:
+        for M, I in ((1, 1), (2, 1), (6, 2)):
+            TT = hapi.TIPS_2017_ISOT_HASH[(M, I)]
+            QQ = hapi.TIPS_2017_ISOQ_HASH[(M, I)]
+            # grid nodes, the ends of the grid and values between the nodes
+            temperatures = np.concatenate([TT[:5], TT[-5:], np.linspace(TT[0], TT[-1], 997),
+                                           [296., 296.5, 1000.25]])
+            # the array interpolation is the scalar one, bit for bit
+            expected = [hapi.AtoB(T, TT, QQ, len(TT)) for T in temperatures]
+            if hapi.AtoBArray(temperatures, TT, QQ, len(TT)).tolist() != expected:
+                return False
+            if list(hapi.partitionSum(M, I, temperatures.tolist())) != expected:
+                return False
+            # memoized scalars
+            hapi.PARTITION_SUMS.clear()
+            if hapi.partitionSum(M, I, 296.) != hapi.AtoB(296., TT, QQ, len(TT)) or \
+                    (M, I, 296.) not in hapi.PARTITION_SUMS:
+                return False
+            if hapi.partitionSum(M, I, 296.) != hapi.PARTITION_SUMS[(M, I, 296.)]:
+                return False
+            # out of the temperature range
+            try:
+                hapi.partitionSum(M, I, [296., TT[-1] + 1.])
+            except Exception:
+                continue
+            return False
+        return True
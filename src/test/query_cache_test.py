@@ -0,0 +1,46 @@
+import numpy as np
+
+import hapi
+from test.test import Test
+
+
+class QueryCacheTest(Test):
+
+    def __init__(self):
+        Test.__init__(self)
+
+    def name(self) -> str:
+        return 'query cache test'
+
+    @staticmethod
+    def select_a() -> list:
+        hapi.select('__test_cache__', DestinationTableName='__test_cache_result__',
+                    ParameterNames=('a', ('*', 'b', 2)), Conditions=('<', 'a', 5), Output=False)
+        return hapi.LOCAL_TABLE_CACHE['__test_cache_result__']['data']['a'].tolist()
+
+    @staticmethod
+    def set_columns(a, b):
+        data = hapi.LOCAL_TABLE_CACHE['__test_cache__']['data']
+        data['a'] = a
+        data['b'] = b
+        hapi.LOCAL_TABLE_CACHE['__test_cache__']['header']['number_of_rows'] = len(a)
+
+    def test(self) -> bool:
+        hapi.VARIABLES['QUERY_CACHE_SIZE'] = 10 * 1024 ** 2
+        hapi.createTable('__test_cache__', [('a', 0, '%5d'), ('b', 0.0, '%10.3f')])
+        self.set_columns(np.arange(10), np.arange(10) * 1.0)
+        if self.select_a() != [0, 1, 2, 3, 4]:
+            return False
+        # the repeated select is restored from the cache
+        if len(hapi.QUERY_CACHE) != 1 or self.select_a() != [0, 1, 2, 3, 4]:
+            return False
+        # columns assigned directly, without touchTable, are selected again
+        self.set_columns(np.arange(10) + 100, np.arange(10) * 1.0)
+        if self.select_a() != []:
+            return False
+        self.set_columns(np.arange(12) - 2, np.arange(12) * 1.0)
+        if self.select_a() != [-2, -1, 0, 1, 2, 3, 4]:
+            return False
+        # edits through hapi drop the cached results
+        hapi.setRowObject(0, [('a', 50, '%5d'), ('b', 0.0, '%10.3f')], '__test_cache__')
+        return self.select_a() == [-1, 0, 1, 2, 3, 4]
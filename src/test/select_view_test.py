@@ -0,0 +1,49 @@
+import numpy as np
+
+import hapi
+from test.test import Test
+
+
+class SelectViewTest(Test):
+
+    def __init__(self):
+        Test.__init__(self)
+
+    def name(self) -> str:
+        return 'select view test'
+
+    @staticmethod
+    def select_rows():
+        hapi.createTable('__test_view__', [('a', 0, '%5d'), ('b', 0.0, '%10.3f')])
+        data = hapi.LOCAL_TABLE_CACHE['__test_view__']['data']
+        data['a'] = np.arange(10)
+        data['b'] = np.arange(10) * 1.0
+        hapi.LOCAL_TABLE_CACHE['__test_view__']['header']['number_of_rows'] = 10
+        hapi.select('__test_view__', DestinationTableName='__test_view_result__',
+                    ParameterNames=('a', 'b'), Conditions=('<', 'a', 5), Output=False)
+        return data
+
+    def test(self) -> bool:
+        hapi.VARIABLES['QUERY_CACHE_SIZE'] = 0
+        # by default the selected rows are copied
+        hapi.VARIABLES['SELECT_VIEWS'] = False
+        data = self.select_rows()
+        if hapi.isView('__test_view_result__'):
+            return False
+        data['a'][:] = -1
+        if hapi.LOCAL_TABLE_CACHE['__test_view_result__']['data']['a'].tolist() != [0, 1, 2, 3, 4]:
+            return False
+        # with the views the result shares memory with the source table
+        hapi.VARIABLES['SELECT_VIEWS'] = True
+        data = self.select_rows()
+        if not hapi.isView('__test_view_result__'):
+            return False
+        result = hapi.LOCAL_TABLE_CACHE['__test_view_result__']['data']
+        if not np.shares_memory(result['a'], data['a']):
+            return False
+        # until the source is edited through hapi
+        hapi.setRowObject(0, [('a', 50, '%5d'), ('b', 0.0, '%10.3f')], '__test_view__')
+        if hapi.isView('__test_view_result__'):
+            return False
+        result = hapi.LOCAL_TABLE_CACHE['__test_view_result__']['data']
+        return result['a'].tolist() == [0, 1, 2, 3, 4]
@@ -0,0 +1,53 @@
+import io
+import shutil
+import tempfile
+
+import hapi
+from test.hapi_test_util import make_lines, same_tables, write_table
+from test.test import Test
+
+
+class SidecarTest(Test):
+
+    def __init__(self):
+        Test.__init__(self)
+
+    def name(self) -> str:
+        return 'sidecar test'
+
+    def test(self) -> bool:
+        database = tempfile.mkdtemp()
+        try:
+            hapi.VARIABLES['BACKEND_DATABASE_NAME'] = database
+            hapi.VARIABLES['SIDECAR_CACHE'] = True
+            write_table(database, '__test_sidecar__', make_lines(300))
+            order = hapi.HITRAN_DEFAULT_HEADER['order']
+            # the cold start parses the text and saves the sidecar
+            hapi.storage2cache('__test_sidecar__')
+            cold = hapi.LOCAL_TABLE_CACHE.pop('__test_sidecar__')
+            fullpath_data, fullpath_header = hapi.getFullTableAndHeaderName('__test_sidecar__')
+            if hapi.readSidecarManifest(fullpath_data, fullpath_header) is None:
+                return False
+            # the warm start reads the same table from the sidecar
+            if not hapi.loadSidecar('__test_sidecar__', fullpath_data, fullpath_header):
+                return False
+            hapi.LOCAL_TABLE_CACHE.pop('__test_sidecar__')
+            hapi.storage2cache('__test_sidecar__')
+            warm = hapi.LOCAL_TABLE_CACHE['__test_sidecar__']
+            if warm['header'] != cold['header'] or \
+                    not same_tables(warm['data'], cold['data'], order):
+                return False
+            # string columns are lists, as after parsing
+            if type(warm['data']['global_upper_quanta']) != list:
+                return False
+            # a changed data file is parsed again
+            lines = make_lines(200, seed=1)
+            write_table(database, '__test_sidecar__', lines)
+            if hapi.readSidecarManifest(fullpath_data, fullpath_header) is not None:
+                return False
+            hapi.storage2cache('__test_sidecar__')
+            data, line_count, flag_EOF = hapi.parseTableBlock(io.StringIO(''.join(lines)),
+                                                              hapi.HITRAN_DEFAULT_HEADER)
+            return same_tables(hapi.LOCAL_TABLE_CACHE['__test_sidecar__']['data'], data, order)
+        finally:
+            shutil.rmtree(database)
@@ -0,0 +1,32 @@
+import hapi
+from test.hapi_test_util import get_rows, make_table
+from test.test import Test
+
+
+class SortTest(Test):
+
+    def __init__(self):
+        Test.__init__(self)
+
+    def name(self) -> str:
+        return 'sort test'
+
+    def test(self) -> bool:
+        make_table('__test_table__')
+        rows = get_rows('__test_table__')
+        for parameter_names, key in [
+                (('molec_id',), lambda row: row['molec_id']),
+                (('quanta', 'nu'), lambda row: (row['quanta'], row['nu'])),
+                (('local_iso_id', ('-', 0, 'nu')), lambda row: (row['local_iso_id'], -row['nu'])),
+                ((('*', 'molec_id', 'local_iso_id'), 'quanta'),
+                 lambda row: (row['molec_id'] * row['local_iso_id'], row['quanta']))]:
+            expected = [row['row'] for row in sorted(rows, key=key)]
+            for accending in (True, False):
+                hapi.sort('__test_table__', DestinationTableName='__test_sort__',
+                          ParameterNames=parameter_names, Accending=accending)
+                result = hapi.LOCAL_TABLE_CACHE['__test_sort__']['data']['row'].tolist()
+                # descending order is the reversed ascending one
+                if result != (expected if accending else expected[::-1]):
+                    print('sort by {} differs'.format(parameter_names))
+                    return False
+        return True
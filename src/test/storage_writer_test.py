@@ -0,0 +1,49 @@
+import io
+import os
+import shutil
+import tempfile
+
+import hapi
+from test.hapi_test_util import make_lines, make_table
+from test.test import Test
+
+
+class StorageWriterTest(Test):
+
+    def __init__(self):
+        Test.__init__(self)
+
+    def name(self) -> str:
+        return 'storage writer test'
+
+    @staticmethod
+    def same_output(database, table_name) -> bool:
+        # the data file is the one written row by row with putRowObjectToString
+        hapi.cache2storage(table_name)
+        number_of_rows = hapi.LOCAL_TABLE_CACHE[table_name]['header']['number_of_rows']
+        expected = ''.join(hapi.putRowObjectToString(hapi.getRowObject(row_id, table_name)) + '\n'
+                           for row_id in range(number_of_rows))
+        with open(os.path.join(database, table_name + '.data'), 'r', newline='') as fp:
+            return fp.read() == expected
+
+    def test(self) -> bool:
+        database = tempfile.mkdtemp()
+        try:
+            hapi.VARIABLES['BACKEND_DATABASE_NAME'] = database
+            # blocks smaller than the tables
+            hapi.CACHE2STORAGE_BLOCK = 7
+            data, line_count, flag_EOF = hapi.parseTableBlock(io.StringIO(''.join(make_lines(100))),
+                                                              hapi.HITRAN_DEFAULT_HEADER)
+            hapi.LOCAL_TABLE_CACHE['__test_writer__'] = {
+                'header': dict(hapi.HITRAN_DEFAULT_HEADER, number_of_rows=line_count),
+                'data': data}
+            if not self.same_output(database, '__test_writer__'):
+                return False
+            # NaNs, strings and compact columns
+            make_table('__test_table__', 50)
+            if not self.same_output(database, '__test_table__'):
+                return False
+            hapi.compactTable('__test_table__')
+            return self.same_output(database, '__test_table__')
+        finally:
+            shutil.rmtree(database)
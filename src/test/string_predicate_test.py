@@ -0,0 +1,41 @@
+import numpy as np
+
+import hapi
+from test.hapi_test_util import get_rows, make_table, same_values
+from test.test import Test
+
+EXPRESSIONS = [
+    ('MATCH', ('STR', ' +[AB]'), 'quanta'),
+    ('LIKE', ('STR', 'B$'), 'quanta'),
+    ('MATCH', ('STR', '^ {3}'), 'quanta'),
+    ('SEARCH', ('STR', ' *(.)(.?)'), 'quanta'),
+    ('FINDALL', ('STR', '[AB]'), 'quanta'),
+    ('FINDALL', ('STR', '(A)|(C)'), 'quanta'),
+]
+
+
+class StringPredicateTest(Test):
+
+    def __init__(self):
+        Test.__init__(self)
+
+    def name(self) -> str:
+        return 'string predicate test'
+
+    def test(self) -> bool:
+        make_table('__test_table__')
+        rows = get_rows('__test_table__')
+        columns = hapi.getColumnResolver('__test_table__')
+        # string columns of the cache (lists) and of numpy string types
+        unicode_column = np.array(hapi.LOCAL_TABLE_CACHE['__test_table__']['data']['quanta'])
+        for resolver in (columns, lambda par_name: unicode_column):
+            for expression in EXPRESSIONS:
+                plan = hapi.compileExpression(expression)
+                values = hapi.evaluateColumnExpression(expression, resolver)
+                if not same_values(list(values), [plan(row) for row in rows]):
+                    print('{} differs'.format(expression))
+                    return False
+        # rows with the same string get their own lists
+        values = hapi.evaluateColumnExpression(EXPRESSIONS[-2], columns)
+        values[0].append('X')
+        return all('X' not in value for value in values[1:])
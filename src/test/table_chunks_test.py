@@ -0,0 +1,46 @@
+import shutil
+import tempfile
+
+import hapi
+from test.hapi_test_util import make_lines, same_tables, write_table
+from test.test import Test
+
+
+class TableChunksTest(Test):
+
+    def __init__(self):
+        Test.__init__(self)
+
+    def name(self) -> str:
+        return 'table chunks test'
+
+    @staticmethod
+    def join_chunks(table_name, order) -> dict:
+        # columns of all chunks put together; chunks have at most 7 rows
+        data = {par_name: [] for par_name in order}
+        for chunk in hapi.iterTableChunks(table_name, 7):
+            if chunk['header']['number_of_rows'] > 7:
+                return None
+            for par_name in order:
+                data[par_name] += list(chunk['data'][par_name])
+        return data
+
+    def test(self) -> bool:
+        database = tempfile.mkdtemp()
+        try:
+            hapi.VARIABLES['BACKEND_DATABASE_NAME'] = database
+            write_table(database, '__test_chunks__', make_lines(100))
+            order = hapi.HITRAN_DEFAULT_HEADER['order']
+            # streamed from the data file, the cache is left untouched
+            streamed = self.join_chunks('__test_chunks__', order)
+            if streamed is None or '__test_chunks__' in hapi.LOCAL_TABLE_CACHE:
+                return False
+            hapi.storage2cache('__test_chunks__')
+            reference = hapi.LOCAL_TABLE_CACHE['__test_chunks__']['data']
+            if not same_tables(streamed, reference, order):
+                return False
+            # sliced from the loaded table
+            sliced = self.join_chunks('__test_chunks__', order)
+            return sliced is not None and same_tables(sliced, reference, order)
+        finally:
+            shutil.rmtree(database)
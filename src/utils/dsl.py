@@ -1,5 +1,9 @@
+import functools
+
 from parsy import *
 
+from hapi import compileExpression
+
 
 class DSL:
     """
@@ -11,6 +15,9 @@ class DSL:
     static parser object for the DSL.
     """
 
+    # Names hapi provides in the expressions on any table, besides the table's own parameters
+    builtin_names = {'LineNumber'}
+
     # Whitespace..
     whitespace_parse = whitespace.optional()
 
@@ -51,7 +58,7 @@ class DSL:
     search_parse = regex('(search)|(SEARCH)').map(lambda x: 'search')
     match_parse = regex('(match)|(MATCH)|(like)|(LIKE)').map(lambda x: 'match')
     find_parse = regex('(findall)|(FINDALL)').map(lambda x: 'findall')
-    count_parse = regex('(count)|(COUNT)').map(lambda: 'count')
+    count_parse = regex('(count)|(COUNT)').map(lambda x: 'count')
 
     operation = add_parse | sub_parse | mul_parse | div_parse | between_parse | subset_parse | \
                 and_parse | or_parse | not_parse | lt_parse | gt_parse | lte_parse | gte_parse | \
@@ -82,18 +89,82 @@ class DSL:
     expression_list_parse = whitespace_parse >> bracket_open >> expression_parse.many() << \
                             bracket_close << whitespace_parse
 
+    # Operations on literals that are evaluated while the expression is prepared for hapi
+    folded_operations = {
+        '+': lambda args: sum(args),
+        '-': lambda args: args[0] - args[1],
+        '*': lambda args: functools.reduce(lambda x, y: x * y, args),
+        '/': lambda args: args[0] / args[1]
+    }
+
     @staticmethod
+    @functools.lru_cache(maxsize=256)
     def parse_expression(expression):
         """
-        Attempts to parse an expression into the nested-tuple format used by hapi.
+        Attempts to parse an expression into the nested-tuple format used by hapi. Results are
+        cached, so they should not be modified.
 
         """
         try:
-            x = DSL.expression_list_parse.parse(expression)
-            return x
+            if expression.lstrip().startswith('['):
+                return DSL.expression_list_parse.parse(expression)
+            return DSL.expression_parse.parse(expression)
         except:
+            return None
+
+    @staticmethod
+    def prepare_expression(expression, parameters=None):
+        """
+        Prepares a parsed expression for hapi: list literals become hapi sets, arithmetic on
+        literals is replaced by its value, and names are checked against the parameters (LineNumber
+        is always known).
+
+        :param expression: An expression in the nested-tuple format returned by parse_expression
+        :param parameters: The parameter names of the table, or None to not check the names
+        :return: The prepared expression
+        """
+        if type(expression) == list:
+            return 'set', expression
+        if type(expression) == str:
+            if parameters is not None and expression not in parameters and \
+                    expression not in DSL.builtin_names:
+                raise Exception('Unknown parameter \'{}\''.format(expression))
+            return expression
+        if type(expression) != tuple:
+            return expression
+
+        op = expression[0]
+        if op == 'str':
+            return expression
+        args = [DSL.prepare_expression(arg, parameters) for arg in expression[1:]]
+        if op in DSL.folded_operations and args and \
+                all(type(arg) in (int, float) for arg in args):
             try:
-                z = DSL.expression_parse.parse(expression)
-                return z
-            except:
-                return None
+                return DSL.folded_operations[op](args)
+            except (IndexError, ZeroDivisionError):
+                pass
+        return tuple([op] + args)
+
+    @staticmethod
+    @functools.lru_cache(maxsize=256)
+    def compile_expression(expression, parameters=None):
+        """
+        Parses an expression and compiles it into a hapi query plan. Unlike hapi itself, this
+        reports unknown parameter names and malformed operations before any table is scanned.
+
+        :param expression: The text of the expression
+        :param parameters: A tuple of the parameter names of the table, or None to not check
+                           the names
+        :return: A tuple of the prepared expression (see prepare_expression) and its compiled
+                 plan. Lists of expressions give a list of prepared expressions and a list of
+                 plans.
+        :raises Exception: If the expression is invalid. The message describes the error.
+        """
+        parsed = DSL.parse_expression(expression)
+        if parsed is None:
+            raise Exception('Invalid expression')
+        if type(parsed) == list and expression.lstrip().startswith('['):
+            prepared = [DSL.prepare_expression(item, parameters) for item in parsed]
+            return prepared, [compileExpression(item, Columnwise=True) for item in prepared]
+        prepared = DSL.prepare_expression(parsed, parameters)
+        return prepared, compileExpression(prepared, Columnwise=True)
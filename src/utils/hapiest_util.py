@@ -7,7 +7,8 @@ from metadata.config import *
 
 
 # Regex that captures files ending in .data, and binds everything before the .data to 'data_handle'
-DATA_FILE_REGEX = re.compile('(?P<data_handle>.+)\\.(data|par|xsc)\\Z')
+# (the data files may be compressed: .data.gz, .data.xz)
+DATA_FILE_REGEX = re.compile('(?P<data_handle>.+)\\.(data|par|xsc)(\\.(gz|xz))?\\Z')
 
 VERSION_STRING = "v0.2-alpha"
 
@@ -29,6 +29,8 @@ class SelectWidget(QWidget):
         self.table_name: QComboBox = None
         self.select_all_button: QPushButton = None
         self.deselect_all_button: QPushButton = None
+        # Parameters of the selected table, used to check the select expression
+        self.parameters = None
 
         uic.loadUi('layouts/select_widget.ui', self)
 
@@ -95,6 +97,7 @@ class SelectWidget(QWidget):
             return
 
         parameters = result['parameters']
+        self.parameters = tuple(parameters)
         self.parameter_list.clear()
         for par in parameters:
             item = QtWidgets.QListWidgetItem(par)
@@ -116,11 +119,14 @@ class SelectWidget(QWidget):
         table_name = self.get_select_table_name()
         new_table_name = self.get_output_table_name()
         expression = self.get_select_expression()
-        parsed_expression = DSL.parse_expression(expression)
-
-        if parsed_expression == None and expression.strip() != '':
-            err_log('Invalid select expression.')
-            return
+        parsed_expression = None
+
+        if expression.strip() != '':
+            try:
+                parsed_expression, _ = DSL.compile_expression(expression, self.parameters)
+            except Exception as e:
+                err_log('Invalid select expression: {}'.format(str(e)))
+                return
         if table_name == new_table_name:
             err_log('Cannot have select output table be the same as the input table')
             return
@@ -188,14 +194,15 @@ class SelectWidget(QWidget):
         and display a warning..
         """
         expression = self.get_select_expression()
-        res = DSL.parse_expression(expression)
 
         if expression.strip() == '':
             self.run_button.setEnabled(True)
-        elif res == None:
-            self.run_button.setDisabled(True)
-        else:
+            return
+        try:
+            DSL.compile_expression(expression, self.parameters)
             self.run_button.setEnabled(True)
+        except Exception:
+            self.run_button.setDisabled(True)
 
     ###
     # Getters
@@ -22,6 +22,11 @@ LOCAL_XSC_CACHE: Dict[str, CrossSection] = {
     #    },
     }
 
+# The select query (see hapi.getQueryKey) last saved to each destination table, along with the
+# generation of the saved destination table. Repeating that query while neither table has
+# changed leaves the destination table as it is.
+SAVED_SELECTS: Dict[str, Tuple[Any, int]] = {}
+
 
 def add_xsc_to_cache(name, text=None):
     """
@@ -55,10 +60,23 @@ class WorkFunctions:
     @staticmethod
     def start_hapi(**_kwargs) -> bool:
         """
-        Initilizes the hapi database (i.e. loads all data into RAM).
+        Initilizes the hapi database. Tables are only registered here, their data is loaded
+        into RAM the first time they are used. New or modified tables are parsed up front in
+        parallel when more than one loading process is configured.
         """
         print('Initializing hapi db...')
         try:
+            VARIABLES['LAZY_LOADING'] = True
+            VARIABLES['MEMMAP_COLUMNS'] = Config.memmap_tables
+            VARIABLES['LOADING_PROCESSES'] = Config.loading_processes
+            VARIABLES['COMPACT_COLUMNS'] = Config.compact_tables
+            VARIABLES['DATA_COMPRESSION'] = Config.data_compression or None
+            VARIABLES['QUERY_CACHE_SIZE'] = Config.query_cache_size * 1024 ** 2
+            if Config.complex_probability_function in CPF_MAP:
+                setCPF(Config.complex_probability_function)
+            else:
+                print('Unknown complex probability function: ' +
+                      Config.complex_probability_function)
             db_begin(Config.data_folder)
             del LOCAL_TABLE_CACHE['sampletab']
             print('Done initializing hapi db...')
@@ -119,6 +137,7 @@ class WorkFunctions:
                 from two parameters)
                 IDS = indexes of the lines in LOCAL_TABLE_HASH corresponding to the BAND
             """
+            loadTableOnDemand(TableName)
             data = LOCAL_TABLE_CACHE[TableName]['data']
             band2index = { }
 
@@ -171,12 +190,23 @@ class WorkFunctions:
                                                           instrumental_fn])
             return newx, newy
 
+    @staticmethod
+    def absorption_coefficient(graph_fn: str, n_workers: Optional[int] = None, **kwargs):
+        """
+        Calculates the absorption coefficient with the function named graph_fn, splitting the
+        lines across n_workers processes (Config.synthesis_processes if not specified).
+        """
+        if n_workers is None:
+            n_workers = Config.synthesis_processes
+        return absorptionCoefficientParallel(WorkFunctions.graph_type_map[graph_fn],
+                                             n_workers = n_workers, **kwargs)
+
     @staticmethod
     def graph_absorption_coefficient(
             graph_fn: str, Components: List[Tuple[int, int]], SourceTables: List[str],
             Environment: Dict[str, Any], Diluent: dict, WavenumberRange: Tuple[float, float],
             WavenumberStep: float, WavenumberWing: float, WavenumberWingHW: float, title: str,
-            titlex: str, titley: str,
+            titlex: str, titley: str, n_workers: Optional[int] = None,
             **kwargs) -> Dict[str, Union[str, Any]]:
         """
         :param graph_fn:        Name of the graphing function to be applied.
@@ -191,6 +221,7 @@ class WorkFunctions:
         :param title:           Title of the graph
         :param titlex:          Title for the x axis
         :param titley:          Title for the y axis
+        :param n_workers:       Number of processes to calculate the absorption coefficient in
         :param kwargs:         Unused keyword-arguments
         :return:
         """
@@ -210,7 +241,8 @@ class WorkFunctions:
 
         # absorptionCoefficient_Doppler functions do not use Diluent
         if WorkFunctions.graph_type_map[graph_fn] == WorkFunctions.graph_type_map["Galatry"]:
-            x, y = WorkFunctions.graph_type_map[graph_fn](
+            x, y = WorkFunctions.absorption_coefficient(
+                    graph_fn, n_workers,
                     Components = Components,
                     SourceTables = SourceTables,
                     Environment = Environment,
@@ -220,7 +252,8 @@ class WorkFunctions:
                     WavenumberWing = WavenumberWing,
                     WavenumberWingHW = WavenumberWingHW)
         else:
-            x, y = WorkFunctions.graph_type_map[graph_fn](
+            x, y = WorkFunctions.absorption_coefficient(
+                    graph_fn, n_workers,
                     Components = Components,
                     SourceTables = SourceTables,
                     Environment = Environment,
@@ -248,7 +281,8 @@ class WorkFunctions:
             WavenumberStep: float, WavenumberWing: float, WavenumberWingHW: float, title: str,
             titlex: str, titley: str,
             Format='%e %e', path_length=100.0, File=None, instrumental_fn: str = "",
-            Resolution: float = 0.01, AF_wing: float = 100.0, **kwargs) -> Union[
+            Resolution: float = 0.01, AF_wing: float = 100.0, n_workers: Optional[int] = None,
+            **kwargs) -> Union[
         Dict[str, Any], Exception]:
         """
         Generates coordinates for absorption spectrum graph.
@@ -258,7 +292,8 @@ class WorkFunctions:
             'WavenumberRange': WavenumberRange, 'Environment': Environment, 'graph_fn': graph_fn,
             'Diluent':         Diluent
         }
-        wn, ac = WorkFunctions.graph_type_map[graph_fn](
+        wn, ac = WorkFunctions.absorption_coefficient(
+                graph_fn, n_workers,
                 Components = Components,
                 SourceTables = SourceTables,
                 Environment = Environment,
@@ -285,7 +320,8 @@ class WorkFunctions:
             WavenumberStep: float, WavenumberWing: float, WavenumberWingHW: float, title: str,
             titlex: str, titley: str,
             Format='%e %e', path_length=100.0, temp=296.0, File=None, instrumental_fn: str = "",
-            Resolution: float = 0.01, AF_wing: float = 100.0, **kwargs) -> Union[
+            Resolution: float = 0.01, AF_wing: float = 100.0, n_workers: Optional[int] = None,
+            **kwargs) -> Union[
         Dict[str, Any], Exception]:
         """
         Generates coordinates for radiance spectrum graph.
@@ -295,7 +331,8 @@ class WorkFunctions:
             'WavenumberRange': WavenumberRange, 'Environment': Environment, 'graph_fn': graph_fn,
             'Diluent':         Diluent
         }
-        wn, ac = WorkFunctions.graph_type_map[graph_fn](
+        wn, ac = WorkFunctions.absorption_coefficient(
+                graph_fn, n_workers,
                 Components = Components,
                 SourceTables = SourceTables,
                 Environment = Environment,
@@ -322,7 +359,8 @@ class WorkFunctions:
             WavenumberStep: float, WavenumberWing: float, WavenumberWingHW: float, title: str,
             titlex: str, titley: str,
             Format='%e %e', path_length=100.0, File=None, instrumental_fn: str = "",
-            Resolution: float = 0.01, AF_wing: float = 100.0, **kwargs) -> Union[
+            Resolution: float = 0.01, AF_wing: float = 100.0, n_workers: Optional[int] = None,
+            **kwargs) -> Union[
         Dict[str, Any], Exception]:
         """
         Generates coordinates for transmittance spectrum graph.
@@ -332,7 +370,8 @@ class WorkFunctions:
             'WavenumberRange': WavenumberRange, 'Environment': Environment, 'graph_fn': graph_fn,
             'Diluent':         Diluent
         }
-        wn, ac = WorkFunctions.graph_type_map[graph_fn](
+        wn, ac = WorkFunctions.absorption_coefficient(
+                graph_fn, n_workers,
                 Components = Components,
                 SourceTables = SourceTables,
                 Environment = Environment,
@@ -386,6 +425,7 @@ class WorkFunctions:
     @staticmethod
     def get_table(table_name: str) -> Optional[Dict[str, Any]]:
         if table_name in LOCAL_TABLE_CACHE:
+            loadTableOnDemand(table_name)
             return LOCAL_TABLE_CACHE[table_name]
         else:
             return None
@@ -398,6 +438,7 @@ class WorkFunctions:
         try:
             # This also means the files already exist on disk and do not need to be created
             if name in LOCAL_TABLE_CACHE:
+                touchTable(name)
                 del LOCAL_TABLE_CACHE[name]
             else:
                 open(Config.data_folder + "/{}.header".format(name), 'w+')
@@ -433,6 +474,7 @@ class WorkFunctions:
             length = xsc.len
             parameters = []
         else:
+            loadTableOnDemand(table_name)
             table = LOCAL_TABLE_CACHE[table_name]['data']
             header = LOCAL_TABLE_CACHE[table_name]['header']
             parameters = list(table.keys())
@@ -455,13 +497,28 @@ class WorkFunctions:
                ParameterNames: List[str] = None,
                Conditions: List[Any] = None, Output: bool = False, File=None, **_kwargs):
         """
-        Attempts to call the select() method from hapi.
+        Attempts to call the select() method from hapi, then saves the resulting table. Repeating
+        the last select into a table is skipped if neither table has changed since.
         """
+        query_key = None
+        if TableName in LOCAL_TABLE_CACHE:
+            loadTableOnDemand(TableName)
+            query_key = getQueryKey(TableName, ParameterNames or
+                                    LOCAL_TABLE_CACHE[TableName]['header']['order'], Conditions)
+        saved = (query_key, LOCAL_TABLE_GENERATION.get(DestinationTableName))
+        if query_key is not None and not (Output or File) and \
+                DestinationTableName in LOCAL_TABLE_CACHE and \
+                SAVED_SELECTS.get(DestinationTableName) == saved:
+            return echo(new_table_name = DestinationTableName, all_tables = list(tableList()))
+
         select(TableName = TableName, DestinationTableName = DestinationTableName,
                ParameterNames = ParameterNames,
                Conditions = Conditions, Output = Output, File = File)
         hmd = HapiMetaData(DestinationTableName)
-        WorkFunctions.save_table(LOCAL_TABLE_CACHE[TableName], table_name = DestinationTableName)
+        if WorkFunctions.save_table(LOCAL_TABLE_CACHE[DestinationTableName],
+                                    name = DestinationTableName):
+            SAVED_SELECTS[DestinationTableName] = \
+                (query_key, LOCAL_TABLE_GENERATION.get(DestinationTableName))
 
         return echo(new_table_name = DestinationTableName, all_tables = list(tableList()))
 